@@ -0,0 +1,147 @@
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
+from .hashing import HashingQueueFull
+from . import models, schemas, auth, services as app_services
+
+# Versiones asíncronas de las rutas más usadas.
+# main.py registra este router antes que las rutas síncronas cuando
+# settings.async_db_enabled está activo, así que estas tienen prioridad.
+router = APIRouter()
+
+@router.post("/api/login", response_model=schemas.Token)
+async def login(user_credentials: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
+    """Iniciar sesión"""
+    try:
+        user = await auth.authenticate_user_async_db(db, user_credentials.email, user_credentials.password)
+    except HashingQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta de nuevo en unos segundos"
+        )
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Email o contraseña incorrectos",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if not user.is_verified:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Por favor verifica tu email antes de iniciar sesión"
+        )
+
+    session_id = auth.new_session_id()
+    access_token = auth.create_user_access_token(user, session_id=session_id)
+    refresh_token = await db.run_sync(auth.create_refresh_token, user.id, session_id)
+
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.get("/api/users/me", response_model=schemas.UserResponse)
+async def read_users_me(
+    current_user: models.User = Depends(auth.get_current_active_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Obtener información del usuario actual"""
+    # Contadores y perfil vigentes (del cache solo vienen identidad y rol)
+    await db.refresh(current_user)
+    return current_user
+
+@router.put("/api/users/me", response_model=schemas.UserUpdateResponse)
+async def update_user(
+    user_update: schemas.UserUpdate,
+    current_user: models.User = Depends(auth.get_current_active_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Actualizar perfil del usuario"""
+    token_version = current_user.token_version
+    if user_update.full_name is not None:
+        current_user.full_name = user_update.full_name
+    if user_update.location is not None:
+        current_user.location = user_update.location
+    if user_update.bio is not None:
+        current_user.bio = user_update.bio
+    if user_update.specialties is not None:
+        current_user.specialties = user_update.specialties
+    if user_update.role is not None:
+        current_user.role = user_update.role
+
+    current_user.updated_at = datetime.utcnow()
+    await db.commit()
+    await db.refresh(current_user)
+
+    response = schemas.UserUpdateResponse.model_validate(current_user)
+    if current_user.token_version != token_version:
+        # El cambio de rol revocó los tokens anteriores; devolver uno nuevo como switch-role
+        response.access_token = auth.create_user_access_token(current_user, session_id=db.info.get("session_id"))
+        response.token_type = "bearer"
+
+    return response
+
+@router.post("/api/users/switch-role")
+async def switch_role(
+    current_user: models.User = Depends(auth.get_current_active_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Cambiar entre cliente y técnico"""
+    if current_user.role == "client":
+        current_user.role = "technician"
+    else:
+        current_user.role = "client"
+
+    current_user.updated_at = datetime.utcnow()
+    await db.commit()
+    await db.refresh(current_user)
+
+    # El cambio de rol revoca los tokens anteriores; devolver uno nuevo (misma sesión)
+    access_token = auth.create_user_access_token(current_user, session_id=db.info.get("session_id"))
+
+    return {
+        "message": f"Rol cambiado a {current_user.role}",
+        "new_role": current_user.role,
+        "access_token": access_token,
+        "token_type": "bearer"
+    }
+
+@router.get("/api/friends", response_model=List[schemas.UserSummary])
+async def get_friends(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    after_id: Optional[int] = Query(None, description="Último id recibido, para pedir la página siguiente"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.TokenData = Depends(auth.get_current_identity_async)
+):
+    """Obtener lista de amigos (ordenada por id, paginable con limit y after_id)"""
+    return await app_services.FriendshipService.get_friends_async(db, current_user.id, limit, after_id)
+
+@router.get("/api/conversations", response_model=List[schemas.ConversationSummary])
+async def get_conversations(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.TokenData = Depends(auth.get_current_identity_async)
+):
+    """Obtener todas las conversaciones del usuario"""
+    return await app_services.MessagingService.get_user_conversations_async(db, current_user.id)
+
+@router.get("/api/services/my-services", response_model=List[schemas.ServiceResponse])
+async def get_my_services(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.TokenData = Depends(auth.get_current_identity_async)
+):
+    """Obtener mis servicios (como cliente o técnico)"""
+    return await app_services.ServiceRequestService.get_user_services_async(
+        db, current_user.id, current_user.role
+    )
+
+@router.get("/api/services/pending", response_model=List[schemas.ServiceResponse])
+async def get_pending_service_requests(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.TokenData = Depends(auth.get_current_identity_async)
+):
+    """Obtener solicitudes pendientes (para técnicos)"""
+    if current_user.role != "technician":
+        raise HTTPException(status_code=403, detail="Solo técnicos pueden ver solicitudes pendientes")
+
+    return await app_services.ServiceRequestService.get_pending_requests_async(db, current_user.id)
@@ -1,24 +1,62 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException, status
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from fastapi import Depends, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from .database import get_db
-from .models import User
+from .database import get_db, get_async_db
+from .models import User, RefreshToken
+from .schemas import TokenData
 from .config import settings
+from .cache import TTLCache
+from .hashing import HashingExecutor, pwd_context
+from .revocation import TokenRevocationList
+from . import repository
+import hashlib
+import hmac
 import secrets
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Cache de usuarios autenticados indexado por el "sub" del token (email)
+principal_cache = TTLCache(
+    maxsize=settings.auth_cache_size if settings.auth_cache_enabled else 0,
+    ttl=settings.auth_cache_ttl_seconds
+)
+
+# Versiones de token revocadas, sincronizadas con users.token_version
+revocation_list = TokenRevocationList(
+    num_bits=settings.token_revocation_bloom_bits,
+    sync_seconds=settings.token_revocation_sync_seconds,
+    session_ttl_seconds=settings.access_token_expire_minutes * 60
+)
+
+# Cambios que invalidan los tokens ya emitidos
+TOKEN_VERSION_FIELDS = ("role", "hashed_password", "is_active")
+
+# Ejecutor dedicado para bcrypt (login/register no bloquean a los demás endpoints)
+hashing_executor = HashingExecutor(
+    mode=settings.hashing_mode,
+    max_workers=settings.hashing_workers,
+    max_queue=settings.hashing_max_queue
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def get_password_hash_async(password: str) -> str:
+    return await hashing_executor.hash(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_executor.verify(plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -29,39 +67,343 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
+def create_user_access_token(user: User, expires_delta: Optional[timedelta] = None, session_id: Optional[str] = None):
+    """Access token con la identidad del usuario, su token_version y la sesión (refresh token) que lo emite"""
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=settings.access_token_expire_minutes)
+    data = {
+        "sub": user.email,
+        "uid": user.id,
+        "role": user.role,
+        "ver": user.token_version or 0
+    }
+    if session_id:
+        data["sid"] = session_id
+    return create_access_token(data=data, expires_delta=expires_delta)
+
+def new_session_id() -> str:
+    """Id de sesión: se mantiene al rotar el refresh token y va en el claim "sid" de los access tokens"""
+    return secrets.token_hex(16)
+
+def bump_token_version(user: User):
+    """Invalidar todos los access tokens emitidos para el usuario"""
+    # El usuario puede venir del cache de principals: partir del valor vigente en la BD
+    db = object_session(user)
+    if db is not None and inspect(user).persistent:
+        db.refresh(user, ["token_version"])
+    user.token_version = (user.token_version or 0) + 1
+
 def generate_verification_token() -> str:
     return secrets.token_urlsafe(32)
 
+def _refresh_token_digest(token: str) -> str:
+    """HMAC del refresh token: comparación barata en lugar de verificar la contraseña"""
+    return hmac.new(settings.secret_key.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+def create_refresh_token(db: Session, user_id: int, session_id: Optional[str] = None) -> str:
+    """Emitir un refresh token opaco y guardar solo su HMAC"""
+    token = secrets.token_urlsafe(48)
+    db_token = RefreshToken(
+        user_id=user_id,
+        session_id=session_id or new_session_id(),
+        token_hash=_refresh_token_digest(token),
+        expires_at=datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
+    )
+    db.add(db_token)
+    db.commit()
+    return token
+
+def _find_refresh_token(db: Session, token: str) -> Optional[RefreshToken]:
+    digest = _refresh_token_digest(token)
+    db_token = db.query(RefreshToken).filter(RefreshToken.token_hash == digest).first()
+    if db_token is None or not hmac.compare_digest(db_token.token_hash, digest):
+        return None
+    return db_token
+
+def revoke_user_refresh_tokens(db: Session, user_id: int):
+    """Revocar todas las sesiones activas de un usuario"""
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+
+def _revoke_reused_refresh_token(db: Session, user_id: int):
+    """Reutilización de un token ya rotado: posible robo, cerrar todas las sesiones"""
+    revoke_user_refresh_tokens(db, user_id)
+    user = db.get(User, user_id)
+    if user is not None:
+        bump_token_version(user)
+    db.commit()
+
+def rotate_refresh_token(db: Session, token: str):
+    """Canjear un refresh token por uno nuevo. Devuelve (user, nuevo_token, id de sesión) o None"""
+    db_token = _find_refresh_token(db, token)
+    if db_token is None:
+        return None
+
+    now = datetime.utcnow()
+    if db_token.revoked_at is not None:
+        if db_token.replaced_by_id is not None:
+            _revoke_reused_refresh_token(db, db_token.user_id)
+        return None
+    if db_token.expires_at <= now:
+        return None
+
+    user = db_token.user
+    if user is None or not user.is_active or not user.is_verified:
+        return None
+
+    new_token = secrets.token_urlsafe(48)
+    replacement = RefreshToken(
+        user_id=user.id,
+        session_id=db_token.session_id or new_session_id(),
+        token_hash=_refresh_token_digest(new_token),
+        expires_at=now + timedelta(days=settings.refresh_token_expire_days)
+    )
+    db.add(replacement)
+    db.flush()
+
+    # Solo rota quien lo marca primero: un canje concurrente del mismo token
+    # encuentra revoked_at ya puesto (rowcount 0) y cuenta como reutilización
+    rotated = db.query(RefreshToken).filter(
+        RefreshToken.id == db_token.id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": now, "replaced_by_id": replacement.id}, synchronize_session=False)
+    if rotated == 0:
+        user_id = db_token.user_id
+        db.rollback()
+        _revoke_reused_refresh_token(db, user_id)
+        return None
+    db.commit()
+    return user, new_token, replacement.session_id
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    """
+    Revocar un refresh token (logout) y los access tokens de esa sesión.
+    Las demás sesiones del usuario siguen válidas: token_version solo se
+    incrementa por cambios de contraseña, rol o estado.
+    """
+    db_token = _find_refresh_token(db, token)
+    if db_token is None:
+        return False
+    if db_token.revoked_at is None:
+        db_token.revoked_at = datetime.utcnow()
+        session_id = db_token.session_id
+        db.commit()
+        if session_id:
+            revocation_list.revoke_session(session_id)
+    return True
+
+def _get_user_by_email(db: Session, email: str) -> Optional[User]:
+    return repository.get_user_by_email(db, email)
+
 def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+    user = _get_user_by_email(db, email)
     if not user:
         return False
     if not verify_password(password, user.hashed_password):
         return False
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+async def authenticate_user_async(db: Session, email: str, password: str):
+    user = await run_in_threadpool(_get_user_by_email, db, email)
+    if not user:
+        return False
+    if not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
+def _user_snapshot(user: User) -> dict:
+    """Copiar las columnas del usuario para guardarlas en el cache"""
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+# Columnas del snapshot cacheado que se usan sin releer: identidad y autorización
+PRINCIPAL_IDENTITY_FIELDS = ("id", "email", "role", "token_version", "is_active", "is_verified")
+
+def _user_from_cache(db: Session, email: str) -> Optional[User]:
+    """
+    Reconstruir el usuario cacheado y asociarlo a la sesión sin consultar la BD.
+    El resto de las columnas (contadores, rating, perfil) se expiran: si el handler
+    las lee o modifica, se cargan de la BD en una sola consulta y no se pisan
+    valores más nuevos escritos por otro worker.
+    """
+    snapshot = principal_cache.get(email)
+    if snapshot is None:
+        return None
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    user = db.merge(user, load=False)
+    db.expire(user, [
+        attr.key for attr in inspect(User).column_attrs if attr.key not in PRINCIPAL_IDENTITY_FIELDS
+    ])
+    return user
+
+def invalidate_cached_user(email: str):
+    """Descartar el usuario cacheado tras modificarlo"""
+    principal_cache.invalidate(email)
+
+@event.listens_for(Session, "before_flush")
+def _bump_changed_token_versions(session, flush_context, instances):
+    # Cambio de rol, contraseña o desactivación: los tokens anteriores dejan de valer
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        if get_history(obj, "token_version").has_changes():
+            continue
+        if any(get_history(obj, field).has_changes() for field in TOKEN_VERSION_FIELDS):
+            bump_token_version(obj)
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_users(session, flush_context):
+    # Cualquier cambio a un User (update_user, switch_role, verify_email, stats...) invalida su entrada
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.email:
+            invalidate_cached_user(obj.email)
+            # La revocación se aplica solo si la transacción confirma
+            if get_history(obj, "token_version").has_changes():
+                session.info.setdefault("revoked_token_versions", {})[obj.email] = obj.token_version
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_revocations(session):
+    for email, token_version in session.info.pop("revoked_token_versions", {}).items():
+        # Otra request pudo cachear el valor anterior antes de confirmar
+        invalidate_cached_user(email)
+        revocation_list.record(email, token_version)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_revocations(session):
+    session.info.pop("revoked_token_versions", None)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> TokenData:
+    """Validar firma y expiración del token sin tocar la BD"""
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+
+    return TokenData(
+        email=email,
+        id=payload.get("uid"),
+        role=payload.get("role"),
+        token_version=payload.get("ver", 0),
+        session_id=payload.get("sid")
+    )
+
+def _check_not_revoked(token_data: TokenData):
+    if revocation_list.is_revoked(token_data.email, token_data.token_version, token_data.session_id):
+        raise _credentials_exception()
+
+def _check_user_token(token_data: TokenData, user: Optional[User]) -> User:
+    if user is None or token_data.token_version < (user.token_version or 0):
+        raise _credentials_exception()
+    return user
+
+# Las dependencias síncronas se ejecutan en el threadpool y no bloquean el event loop
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    token_data = _decode_token(token)
+    # Identifica al usuario ante RoutingSession (lectura de sus propias escrituras)
+    db.info["user_id"] = token_data.id
+    db.info["session_id"] = token_data.session_id
+    if revocation_list.needs_sync():
+        revocation_list.sync(db)
+    _check_not_revoked(token_data)
+    email = token_data.email
     
-    user = db.query(User).filter(User.email == email).first()
+    user = _user_from_cache(db, email)
     if user is None:
-        raise credentials_exception
-    return user
+        user = repository.get_user_by_email(db, email)
+        if user is not None:
+            principal_cache.set(email, _user_snapshot(user))
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+    return _check_user_token(token_data, user)
+
+def _check_active(current_user: User) -> User:
     if not current_user.is_verified:
         raise HTTPException(status_code=400, detail="Email no verificado")
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
-    return current_user
\ No newline at end of file
+    return current_user
+
+async def get_current_active_user(current_user: User = Depends(get_current_user)):
+    return _check_active(current_user)
+
+def get_current_identity(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> TokenData:
+    """
+    Identidad tomada del token, sin consultar al usuario en la BD.
+    Solo se emiten tokens a usuarios verificados y cualquier cambio de rol,
+    contraseña o estado incrementa token_version, así que los claims son fiables.
+    """
+    token_data = _decode_token(token)
+    db.info["user_id"] = token_data.id
+    if revocation_list.needs_sync():
+        revocation_list.sync(db)
+    _check_not_revoked(token_data)
+    if token_data.id is None:
+        raise _credentials_exception()
+    return token_data
+
+def require_metrics_token(x_metrics_token: Optional[str] = Header(None)):
+    """Acceso a métricas privilegiadas (SQL y planes de ejecución): exige METRICS_TOKEN"""
+    if not settings.metrics_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_metrics_token or not hmac.compare_digest(x_metrics_token, settings.metrics_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token de métricas inválido")
+
+# Variantes para el modo asíncrono (settings.async_db_enabled)
+
+async def authenticate_user_async_db(db: AsyncSession, email: str, password: str):
+    result = await db.execute(repository.user_by_email_stmt(email))
+    user = result.scalars().first()
+    if not user:
+        return False
+    if not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """
+    Igual que get_current_user: del cache solo se usan identidad y autorización.
+    Con asyncio no hay cargas implícitas, así que las rutas que leen el resto
+    de las columnas (perfil, contadores) las recargan con db.refresh.
+    """
+    token_data = _decode_token(token)
+    db.info["user_id"] = token_data.id
+    db.info["session_id"] = token_data.session_id
+    if revocation_list.needs_sync():
+        await db.run_sync(revocation_list.sync)
+    _check_not_revoked(token_data)
+    email = token_data.email
+
+    user = await db.run_sync(_user_from_cache, email)
+    if user is None:
+        result = await db.execute(repository.user_by_email_stmt(email))
+        user = result.scalars().first()
+        if user is not None:
+            principal_cache.set(email, _user_snapshot(user))
+
+    return _check_user_token(token_data, user)
+
+async def get_current_active_user_async(current_user: User = Depends(get_current_user_async)):
+    return _check_active(current_user)
+
+async def get_current_identity_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> TokenData:
+    """Igual que get_current_identity, usando la sesión asíncrona para sincronizar revocaciones"""
+    token_data = _decode_token(token)
+    db.info["user_id"] = token_data.id
+    if revocation_list.needs_sync():
+        await db.run_sync(revocation_list.sync)
+    _check_not_revoked(token_data)
+    if token_data.id is None:
+        raise _credentials_exception()
+    return token_data
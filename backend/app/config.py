@@ -1,6 +1,6 @@
 from pydantic import Field
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 import os
 
 # Auto-detectar entorno si no estar explícito
@@ -19,11 +19,69 @@ class Settings(BaseSettings):
     database_url: Optional[str] = None
     database_url_prod: Optional[str] = None
     database_url_dev: Optional[str] = None
+    # Réplicas de lectura (URLs separadas por coma) y ventana de lectura tras escritura
+    # (la lleva el cliente en la cookie primary_until o la cabecera X-Primary-Until)
+    database_replica_urls: Optional[str] = None
+    replica_sticky_seconds: int = 5
+    # Crear tablas y migrar al arrancar (en producción usar "python migrate.py")
+    db_auto_migrate: bool = CURRENT_ENV != "production"
+    # Pool de conexiones (dimensionar junto con threadpool_size)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 3600
+    # Hilos de anyio para endpoints síncronos (None = valor por defecto, 40)
+    threadpool_size: Optional[int] = None
+    # Motor asíncrono (aiomysql) para las rutas calientes
+    async_db_enabled: bool = False
+    async_database_url: Optional[str] = None
 
     # Seguridad
     secret_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 30
+
+    # Cache de usuarios autenticados (evita una consulta por request)
+    auth_cache_enabled: bool = True
+    auth_cache_size: int = 1024
+    auth_cache_ttl_seconds: int = 60
+
+    # Revocación de tokens por token_version (filtro de Bloom en memoria)
+    token_revocation_bloom_bits: int = 1 << 20
+    token_revocation_sync_seconds: int = 30
+
+    # Hashing de contraseñas fuera de los workers ('process' o 'thread')
+    hashing_mode: str = "thread"
+    hashing_workers: Optional[int] = None
+    hashing_max_queue: int = 64
+
+    # Grafo de confianza en memoria (CSR); se reconstruye desde la BD periódicamente
+    trust_graph_rebuild_seconds: int = 300
+    # Límites del grafo de red devuelto por la API
+    network_graph_max_nodes: int = 500
+    network_graph_max_edges: int = 2000
+    # Personas que quizás conozcas (refresh_suggestions.py)
+    friend_suggestions_top_k: int = 20
+    # Recomendaciones materializadas: top-N por categoría y antigüedad máxima tolerada
+    # desde el primer cambio antes de calcular en vivo. Las materializa refresh_recommendations.py;
+    # el hilo dentro de la API (cada refresh_seconds, 0 lo desactiva) es solo para un único worker
+    recommendations_top_n: int = 20
+    recommendations_refresh_seconds: int = 0
+    recommendations_refresh_batch: int = 200
+    recommendations_max_staleness_seconds: int = 120
+    # Cache de /api/recommendations por versión del usuario en recommendation_state (vale entre
+    # workers: amistades, reviews y servicios la suben); el TTL solo acota la memoria
+    recommendation_cache_enabled: bool = True
+    recommendation_cache_size: int = 4096
+    recommendation_cache_ttl_seconds: int = 300
+    # PageRank personalizado sobre amistades y contrataciones (refresh_trust_rank.py)
+    trust_rank_alpha: float = 0.85
+    trust_rank_tol: float = 1e-4
+    trust_rank_max_iter: int = 60
+    trust_rank_block_size: int = 64
+    trust_rank_top_k: int = 20
+    trust_rank_unreviewed_weight: float = 0.5
 
     # SMTP
     email_host: str = Field(alias="SMTP_HOST")
@@ -45,10 +103,28 @@ class Settings(BaseSettings):
     # Gemini API
     gemini_api_key: Optional[str] = None
 
+    # Instrumentación SQL por request y detector de N+1
+    sql_instrumentation_enabled: bool = True
+    sql_n_plus_one_threshold: int = 5
+    sql_query_budget: int = 50
+    # Presupuestos por endpoint, p. ej. {"GET /api/network/graph": 20}
+    sql_query_budgets: Dict[str, int] = {}
+    # En desarrollo: lanzar error al superar el presupuesto
+    sql_query_budget_strict: bool = False
+    # Registro de consultas lentas (buffer en memoria + archivo rotativo)
+    slow_query_threshold_ms: int = 200
+    slow_query_buffer_size: int = 200
+    slow_query_log_file: Optional[str] = "slow_queries.log"
+    slow_query_redact_params: bool = True
+    slow_query_explain: bool = True
+    # Token para /api/metrics/slow-queries (cabecera X-Metrics-Token); sin token el endpoint no responde
+    metrics_token: Optional[str] = None
+
     # Entorno y debug
     environment: str = CURRENT_ENV
     debug: bool = CURRENT_ENV != "production"
     docs_enabled: bool = CURRENT_ENV != "production"
+    metrics_enabled: bool = CURRENT_ENV != "production"
 
     class Config:
         env_file = ".env"
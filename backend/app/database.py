@@ -1,15 +1,167 @@
-from sqlalchemy import create_engine
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from .config import settings
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+from .config import settings, is_production
+from .cache import TTLCache
+from .db_metrics import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool, pool_metrics
+
+def _pool_options(url: str, async_mode: bool = False) -> dict:
+    """Parámetros del pool tomados de Settings"""
+    options = {
+        "pool_pre_ping": True,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+    # SQLite (local) usa su propio pool y no acepta estos parámetros
+    if url and not url.startswith("sqlite"):
+        options.update(
+            poolclass=InstrumentedAsyncAdaptedQueuePool if async_mode else InstrumentedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+        )
+    return options
 
 engine = create_engine(
     settings.database_url,
-    pool_pre_ping=True,  
-    pool_recycle=3600,   
-    connect_args={}       
+    connect_args={},
+    **_pool_options(settings.database_url)
 )
+pool_metrics.attach(engine, "primary")
+
+# Réplicas de solo lectura (DATABASE_REPLICA_URLS separadas por coma)
+replica_engines = []
+for index, replica_url in enumerate(filter(None, (settings.database_replica_urls or "").split(","))):
+    replica_url = replica_url.strip()
+    replica_engine = create_engine(replica_url, **_pool_options(replica_url))
+    pool_metrics.attach(replica_engine, f"replica_{index}")
+    replica_engines.append(replica_engine)
+
+# Usuarios que escribieron hace poco en este proceso: sus lecturas van al primario
+recent_writers = TTLCache(maxsize=10000, ttl=settings.replica_sticky_seconds)
+
+# Entre workers, el cliente devuelve hasta cuándo leer del primario (cookie o cabecera)
+PRIMARY_UNTIL_COOKIE = "primary_until"
+PRIMARY_UNTIL_HEADER = "X-Primary-Until"
+# Métodos que leen para escribir: todo el request va al primario
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RequestRouting:
+    """Estado de enrutamiento de un request: si debe leer del primario y si confirmó escrituras"""
+
+    def __init__(self, use_primary: bool = False):
+        self.use_primary = use_primary
+        self.wrote = False
+
+
+_request_routing: ContextVar[Optional[RequestRouting]] = ContextVar("request_routing", default=None)
+
+
+class RoutingSession(Session):
+    """
+    Sesión que envía las lecturas a una réplica y las escrituras al primario.
+    Después de la primera escritura la sesión (y el usuario, durante
+    replica_sticky_seconds) queda fijada al primario. Los requests que
+    modifican datos y los que llegan con primary_until vigente leen del primario.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if not replica_engines:
+            return engine
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.mark_write()
+            return engine
+        if clause is not None and getattr(clause, "_for_update_arg", None) is not None:
+            return engine
+        if self.info.get("use_primary"):
+            return engine
+        routing = _request_routing.get()
+        if routing is not None and routing.use_primary:
+            self.info["use_primary"] = True
+            return engine
+        user_id = self.info.get("user_id")
+        if user_id is not None and recent_writers.get(user_id):
+            self.info["use_primary"] = True
+            return engine
+        return random.choice(replica_engines)
+
+    def mark_write(self):
+        self.info["use_primary"] = True
+        self.info["wrote"] = True
+        user_id = self.info.get("user_id")
+        if user_id is not None:
+            recent_writers.set(user_id, True)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_committed_write(session):
+    # El request responde con primary_until solo si la escritura confirmó
+    if session.info.pop("wrote", False):
+        routing = _request_routing.get()
+        if routing is not None:
+            routing.wrote = True
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_rolled_back_write(session):
+    session.info.pop("wrote", None)
+
+
+def pin_primary(db: Session):
+    """Leer del primario desde ya: para leer-modificar-escribir fuera de un request (o antes de escribir)"""
+    db.info["use_primary"] = True
+
+
+def _primary_until(value: Optional[str]) -> float:
+    """primary_until enviado por el cliente; se ignora si no es válido o pasa de replica_sticky_seconds"""
+    try:
+        until = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    now = time.time()
+    return until if now < until <= now + settings.replica_sticky_seconds else 0.0
+
+
+async def read_your_writes_middleware(request, call_next):
+    """
+    Lectura de las propias escrituras con varios workers: tras confirmar una
+    escritura se responde primary_until (cookie y cabecera) y, mientras siga
+    vigente, los requests del cliente leen del primario en cualquier worker.
+    """
+    if not replica_engines:
+        return await call_next(request)
+
+    primary_until = _primary_until(
+        request.headers.get(PRIMARY_UNTIL_HEADER) or request.cookies.get(PRIMARY_UNTIL_COOKIE)
+    )
+    routing = RequestRouting(use_primary=request.method not in SAFE_METHODS or primary_until > 0)
+    token = _request_routing.set(routing)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_routing.reset(token)
+
+    if routing.wrote:
+        until = f"{time.time() + settings.replica_sticky_seconds:.3f}"
+        response.headers[PRIMARY_UNTIL_HEADER] = until
+        # El frontend está en otro dominio: en producción la cookie viaja entre sitios
+        response.set_cookie(
+            PRIMARY_UNTIL_COOKIE, until,
+            max_age=settings.replica_sticky_seconds,
+            httponly=True,
+            secure=is_production(),
+            samesite="none" if is_production() else "lax"
+        )
+    return response
+
 SessionLocal = sessionmaker(
+    class_=RoutingSession,
     autocommit=False,
     autoflush=False,
     bind=engine
@@ -24,3 +176,56 @@ def get_db():
         yield db
     finally:
         db.close()
+
+@contextmanager
+def primary_session(session_factory=None):
+    """
+    Sesión fijada al primario, para los procesos batch que leen y escriben en la
+    misma transacción (una réplica atrasada les haría recalcular sobre datos viejos).
+    """
+    db = (session_factory or SessionLocal)()
+    db.info["use_primary"] = True
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Motor asíncrono (opcional, settings.async_db_enabled)
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(url: str) -> str:
+    """Traducir la URL síncrona a su equivalente con driver asíncrono"""
+    if settings.async_database_url:
+        return settings.async_database_url
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.async_db_enabled:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_database_url = get_async_database_url(settings.database_url)
+    async_engine = create_async_engine(
+        async_database_url,
+        **_pool_options(async_database_url, async_mode=True)
+    )
+    pool_metrics.attach(async_engine.sync_engine, "primary_async")
+    # expire_on_commit=False: evita cargas implícitas (IO) al leer atributos tras commit
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+# Dependencia asíncrona para FastAPI
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("El modo asíncrono está desactivado (ASYNC_DB_ENABLED)")
+    async with AsyncSessionLocal() as db:
+        yield db
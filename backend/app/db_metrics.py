@@ -0,0 +1,116 @@
+import threading
+import time
+from bisect import bisect_left
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Límites superiores (ms) de los buckets del histograma de espera en checkout
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolMetrics:
+    """Métricas del pool de conexiones construidas a partir de eventos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = []
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total_seconds = 0.0
+        self.wait_max_seconds = 0.0
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float):
+        index = bisect_left(WAIT_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            self.wait_histogram[index] += 1
+            self.wait_total_seconds += seconds
+            self.wait_max_seconds = max(self.wait_max_seconds, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def attach(self, engine, name: str):
+        """Escuchar los eventos del pool de un engine (síncrono o asíncrono)"""
+        pool = engine.pool
+        self._pools.append((name, pool))
+
+        @event.listens_for(pool, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(pool, "checkout")
+        def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self.checkouts += 1
+
+        @event.listens_for(pool, "checkin")
+        def _on_checkin(dbapi_connection, connection_record):
+            with self._lock:
+                self.checkins += 1
+
+        @event.listens_for(pool, "invalidate")
+        def _on_invalidate(dbapi_connection, connection_record, exception):
+            with self._lock:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        pools = {}
+        for name, pool in self._pools:
+            if isinstance(pool, QueuePool):
+                pools[name] = {
+                    "size": pool.size(),
+                    "checked_out": pool.checkedout(),
+                    "checked_in": pool.checkedin(),
+                    "overflow": pool.overflow(),
+                    "timeout_seconds": pool.timeout(),
+                }
+            else:
+                pools[name] = {"status": pool.status()}
+
+        with self._lock:
+            waits = sum(self.wait_histogram)
+            labels = [f"le_{limit}ms" for limit in WAIT_BUCKETS_MS] + ["gt_5000ms"]
+            return {
+                "pools": pools,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "checkout_wait": {
+                    "count": waits,
+                    "avg_ms": round(self.wait_total_seconds / waits * 1000, 3) if waits else 0.0,
+                    "max_ms": round(self.wait_max_seconds * 1000, 3),
+                    "histogram": dict(zip(labels, self.wait_histogram)),
+                },
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class _InstrumentedGetMixin:
+    # No existe un evento "antes del checkout": se mide la espera en _do_get
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_InstrumentedGetMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedGetMixin, AsyncAdaptedQueuePool):
+    pass
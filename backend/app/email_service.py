@@ -1,8 +1,9 @@
-import emails
-from emails.template import JinjaTemplate
 from .config import settings
 
 def send_email(email_to: str, subject: str, html_content: str):
+    # Import diferido: el paquete emails solo se carga al enviar el primer correo
+    import emails
+
     message = emails.Message(
         subject=subject,
         html=html_content,
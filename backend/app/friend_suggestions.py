@@ -0,0 +1,209 @@
+"""
+Motor batch de "personas que quizás conozcas".
+
+Con A la matriz de adyacencia de amistades (dispersa, simétrica), A·A[u, v]
+es el número de amigos en común entre u y v. Se calcula por bloques de filas,
+se descartan los amigos actuales y las solicitudes pendientes, y se guarda el
+top-K de cada usuario en friend_suggestions.
+
+NumPy y SciPy se importan solo aquí (proceso batch), no al arrancar la API.
+"""
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import delete, event, insert, or_, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+from .config import settings
+from . import models
+
+ROW_CHUNK = 1000
+
+
+def queue_refresh(db: Session, user_ids: Iterable[int]):
+    """
+    Marcar usuarios cuyas amistades cambiaron (se confirma con la transacción del llamador).
+    Cada usuario se encola una vez por transacción, con un upsert: dos transacciones
+    que encolan al mismo usuario no chocan en la clave primaria.
+    """
+    queued = db.info.setdefault("friend_suggestions_queued", set())
+    user_ids = sorted(set(user_ids) - queued)
+    if not user_ids:
+        return
+    queued.update(user_ids)
+
+    now = datetime.utcnow()
+    table = models.FriendSuggestionRefresh.__table__
+    values = [{"user_id": user_id, "queued_at": now} for user_id in user_ids]
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(values)
+        db.execute(stmt.on_duplicate_key_update(queued_at=stmt.inserted.queued_at))
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table).values(values)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id], set_={"queued_at": stmt.excluded.queued_at}
+        ))
+    else:
+        db.execute(update(table).where(table.c.user_id.in_(user_ids)).values(queued_at=now))
+        existing = set(db.execute(select(table.c.user_id).where(table.c.user_id.in_(user_ids))).scalars())
+        missing = [row for row in values if row["user_id"] not in existing]
+        if missing:
+            db.execute(insert(table), missing)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _reset_queued(session):
+    session.info.pop("friend_suggestions_queued", None)
+
+
+def load_adjacency(db: Session):
+    """(ids ordenados, matriz CSR n x n) a partir de las amistades aceptadas"""
+    import numpy as np
+    from scipy import sparse
+
+    rows = db.execute(
+        select(models.friendship.c.user_id, models.friendship.c.friend_id).where(
+            models.friendship.c.status == "accepted"
+        )
+    ).all()
+    sources = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    targets = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+
+    ids = np.unique(np.concatenate([sources, targets]))
+    n = len(ids)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (np.searchsorted(ids, sources), np.searchsorted(ids, targets))),
+        shape=(n, n)
+    )
+    # La tabla es simétrica, pero se fuerza por si quedan filas sin su inversa
+    matrix = ((matrix + matrix.T) > 0).astype(np.int32).tocsr()
+    return ids, matrix
+
+
+def _pending_pairs(db: Session, user_ids: Optional[Set[int]] = None) -> Dict[int, Set[int]]:
+    stmt = select(models.FriendRequest.sender_id, models.FriendRequest.receiver_id).where(
+        models.FriendRequest.status == "pending"
+    )
+    if user_ids is not None:
+        stmt = stmt.where(or_(
+            models.FriendRequest.sender_id.in_(user_ids),
+            models.FriendRequest.receiver_id.in_(user_ids)
+        ))
+    pending: Dict[int, Set[int]] = {}
+    for sender_id, receiver_id in db.execute(stmt):
+        pending.setdefault(sender_id, set()).add(receiver_id)
+        pending.setdefault(receiver_id, set()).add(sender_id)
+    return pending
+
+
+def top_k_suggestions(ids, matrix, rows, pending: Dict[int, Set[int]], top_k: int):
+    """Generar (user_id, [(sugerido, amigos_en_común), ...]) para las filas dadas"""
+    import numpy as np
+
+    for start in range(0, len(rows), ROW_CHUNK):
+        chunk = rows[start:start + ROW_CHUNK]
+        mutual = (matrix[chunk] @ matrix).tocsr()
+
+        for local, row in enumerate(chunk):
+            cols = mutual.indices[mutual.indptr[local]:mutual.indptr[local + 1]]
+            counts = mutual.data[mutual.indptr[local]:mutual.indptr[local + 1]]
+            friends = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+
+            keep = (cols != row) & ~np.isin(cols, friends)
+            user_id = int(ids[row])
+            if user_id in pending:
+                keep &= ~np.isin(ids[cols], np.fromiter(pending[user_id], dtype=np.int64))
+            cols, counts = cols[keep], counts[keep]
+
+            # Más amigos en común primero; a igualdad, id menor
+            order = np.lexsort((ids[cols], -counts))[:top_k]
+            yield user_id, [(int(ids[cols[i]]), int(counts[i])) for i in order]
+
+
+def _store(db: Session, user_ids: List[int], suggestions: Dict[int, list]):
+    now = datetime.utcnow()
+    for start in range(0, len(user_ids), ROW_CHUNK):
+        db.execute(delete(models.FriendSuggestion).where(
+            models.FriendSuggestion.user_id.in_(user_ids[start:start + ROW_CHUNK])
+        ))
+    values = [
+        {"user_id": user_id, "suggested_user_id": suggested_id, "mutual_friends": count, "computed_at": now}
+        for user_id, items in suggestions.items()
+        for suggested_id, count in items
+    ]
+    if values:
+        db.execute(insert(models.FriendSuggestion), values)
+
+
+def refresh_all(db: Session, top_k: int = None) -> dict:
+    """Recalcular las sugerencias de todos los usuarios"""
+    import numpy as np
+
+    top_k = top_k or settings.friend_suggestions_top_k
+    started = time.perf_counter()
+    queued_before = datetime.utcnow()
+
+    ids, matrix = load_adjacency(db)
+    pending = _pending_pairs(db)
+    suggestions = dict(top_k_suggestions(ids, matrix, np.arange(len(ids)), pending, top_k))
+
+    db.execute(delete(models.FriendSuggestion))
+    _store(db, [], suggestions)
+    db.execute(delete(models.FriendSuggestionRefresh).where(
+        models.FriendSuggestionRefresh.queued_at <= queued_before
+    ))
+    db.commit()
+    return {
+        "users": len(ids),
+        "edges": int(matrix.nnz // 2),
+        "suggestions": sum(len(items) for items in suggestions.values()),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def refresh_queued(db: Session, top_k: int = None) -> dict:
+    """
+    Recalcular solo lo afectado por los cambios en cola: al agregar o quitar
+    la amistad (a, b) cambian los amigos en común de a, b y de los amigos de ambos.
+    """
+    import numpy as np
+
+    top_k = top_k or settings.friend_suggestions_top_k
+    started = time.perf_counter()
+    queued_before = datetime.utcnow()
+
+    changed = set(db.execute(
+        select(models.FriendSuggestionRefresh.user_id).where(
+            models.FriendSuggestionRefresh.queued_at <= queued_before
+        )
+    ).scalars())
+    if not changed:
+        return {"changed": 0, "refreshed": 0, "suggestions": 0, "seconds": 0.0}
+
+    ids, matrix = load_adjacency(db)
+    changed_ids = np.fromiter(changed, dtype=np.int64)
+    positions = np.searchsorted(ids, changed_ids)
+    found = positions < len(ids)
+    found[found] = ids[positions[found]] == changed_ids[found]
+    changed_rows = positions[found]
+    rows = np.unique(np.concatenate([changed_rows, matrix[changed_rows].indices])).astype(np.int64)
+
+    affected = {int(ids[row]) for row in rows} | changed
+    pending = _pending_pairs(db, affected)
+    suggestions = dict(top_k_suggestions(ids, matrix, rows, pending, top_k))
+
+    # Los usuarios que se quedaron sin amigos no tienen fila en la matriz: solo se borran
+    _store(db, sorted(affected), suggestions)
+    db.execute(delete(models.FriendSuggestionRefresh).where(
+        models.FriendSuggestionRefresh.user_id.in_(changed),
+        models.FriendSuggestionRefresh.queued_at <= queued_before
+    ))
+    db.commit()
+    return {
+        "changed": len(changed),
+        "refreshed": len(affected),
+        "suggestions": sum(len(items) for items in suggestions.values()),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
@@ -1,26 +1,31 @@
 import os
-import google.generativeai as genai
+import threading
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
 # Cargar variables de entorno
 load_dotenv()
-# Configurar Gemini
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+if not GEMINI_API_KEY:
     print("WARNING: GEMINI_API_KEY no encontrada en .env")
 class GeminiService:
     """Servicio para generar respuestas con Gemini AI"""
     
     def __init__(self):
-        if GEMINI_API_KEY:
-            # Usar gemini-pro o gemini-1.5-flash según disponibilidad
-            self.model = genai.GenerativeModel('gemini-2.5-flash') 
-            self.enabled = True
-        else:
-            self.model = None
-            self.enabled = False
+        # google.generativeai tarda casi un segundo en importarse: el cliente se crea en el primer uso
+        self.enabled = bool(GEMINI_API_KEY)
+        self._model = None
+        self._lock = threading.Lock()
+    
+    @property
+    def model(self):
+        if self._model is None and self.enabled:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=GEMINI_API_KEY)
+                    # Usar gemini-pro o gemini-1.5-flash según disponibilidad
+                    self._model = genai.GenerativeModel('gemini-2.5-flash')
+        return self._model
     
     def generate_review_suggestion(self, user_input: str, rating: int, service_context: str) -> str:
         """Generar una sugerencia de reseña basada en input parcial y rating"""
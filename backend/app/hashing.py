@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Funciones de nivel de módulo para que sean serializables en el pool de procesos
+def _hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashingQueueFull(Exception):
+    """La cola del ejecutor de hashing está llena"""
+
+
+class HashingExecutor:
+    """Ejecuta bcrypt fuera de los workers de request, en un pool de procesos o hilos"""
+
+    MODES = ("process", "thread")
+
+    def __init__(self, mode: str = "thread", max_workers: Optional[int] = None, max_queue: int = 64,
+                 latency_window: int = 1000):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de hashing inválido: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._latencies = deque(maxlen=latency_window)
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        # Se crea en el primer uso para no lanzar procesos al importar la app
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.mode == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_workers, thread_name_prefix="hashing"
+                        )
+        return self._executor
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self.rejected += 1
+                raise HashingQueueFull()
+            self._pending += 1
+
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+                self._latencies.append(elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(_verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> dict:
+        """Profundidad de cola y latencia por hash (incluye la espera en cola)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pending = self._pending
+            completed = self.completed
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            index = min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))
+            return round(latencies[index] * 1000, 2)
+
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": pending,
+            "completed": completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds / completed * 1000, 2) if completed else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
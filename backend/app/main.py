@@ -1,21 +1,24 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query, Body
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Body, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, desc, and_
-from datetime import timedelta, datetime
+from sqlalchemy import or_, func
+from datetime import datetime
 from typing import List, Optional
 from .gemini_service import gemini_service  
-from .database import engine, get_db
-from . import models, schemas, auth, email_service, services as app_services
+from .database import SessionLocal, engine, get_db, read_your_writes_middleware, recent_writers, replica_engines
+from .db_metrics import pool_metrics
+from .hashing import HashingQueueFull
+from .sql_instrumentation import QueryBudgetExceeded, slow_query_log, sql_instrumentation_middleware
+from .trust_graph import trust_graph
+from .recommendation_cache import recommendation_cache
+from . import models, schemas, auth, email_service, migrations, recommendation_store, repository, services as app_services
 from .config import settings, is_production
 from app.config import get_cors_origins
+import anyio
 import json
 
-try:
-    models.Base.metadata.create_all(bind=engine)
-except Exception as e:
-    print(f"Error creando tablas en la base de datos: {e}")
-
 app = FastAPI(
     title="Kaimo API",
     version="4.0.0",
@@ -31,43 +34,131 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Primary-Until"],
 )
 
+# Con réplicas: lecturas del primario tras escribir, también desde otros workers
+app.middleware("http")(read_your_writes_middleware)
+
+# Conteo de consultas y tiempo de BD por request (cabeceras X-DB-*)
+app.middleware("http")(sql_instrumentation_middleware)
+
+@app.exception_handler(QueryBudgetExceeded)
+def query_budget_exceeded_handler(request, exc: QueryBudgetExceeded):
+    return JSONResponse(status_code=500, content={"detail": str(exc)})
+
+# Rutas calientes sobre el motor asíncrono (se registran primero para tener prioridad)
+if settings.async_db_enabled:
+    from . import async_routes
+    app.include_router(async_routes.router)
+
+@app.on_event("startup")
+def configure_threadpool():
+    if settings.threadpool_size:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+
+@app.on_event("startup")
+def auto_migrate():
+    # El esquema se crea con "python migrate.py"; en desarrollo se aplica al arrancar (no al importar)
+    if not settings.db_auto_migrate:
+        return
+    try:
+        migrations.create_schema(engine)
+        migrations.upgrade(engine)
+    except Exception as e:
+        print(f"Error creando tablas en la base de datos: {e}")
+
+@app.on_event("startup")
+def schedule_trust_graph_rebuild():
+    # Se construye en segundo plano; mientras tanto las consultas de amistad van a la BD
+    trust_graph.start_scheduler(SessionLocal)
+
+@app.on_event("startup")
+def schedule_recommendations_refresh():
+    # Materializa en segundo plano el top-N de recomendaciones de los usuarios con cambios
+    if settings.recommendations_refresh_seconds > 0:
+        recommendation_store.start_scheduler(SessionLocal)
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    auth.hashing_executor.shutdown()
+    trust_graph.stop_scheduler()
+    recommendation_store.stop_scheduler()
+
 #AUTENTIFICACION
 
 @app.get("/health")
 def health_check():
     return {"status": "ok", "environment": "production" if is_production() else "development"}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Métricas internas de rendimiento"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {
+        "db_pool": pool_metrics.stats(),
+        "replica_routing": {
+            "replicas": len(replica_engines),
+            "sticky_users": recent_writers.stats()
+        },
+        "threadpool": {
+            "total": limiter.total_tokens,
+            "in_use": limiter.borrowed_tokens
+        },
+        "auth_cache": auth.principal_cache.stats(),
+        "hashing": auth.hashing_executor.stats(),
+        "token_revocation": auth.revocation_list.stats(),
+        "trust_graph": trust_graph.stats(),
+        "recommendation_cache": recommendation_cache.stats()
+    }
+
+@app.get("/api/metrics/slow-queries", dependencies=[Depends(auth.require_metrics_token)])
+def get_slow_queries(limit: int = Query(50, ge=1, le=500)):
+    """Últimas consultas lentas con su plan de ejecución (requiere X-Metrics-Token)"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return slow_query_log.snapshot(limit)
+
+def _ensure_user_available(db: Session, user: schemas.UserCreate):
+    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    if db_user:
+        raise HTTPException(status_code=400, detail="El email ya está registrado")
+    
+    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+    if db_user:
+        raise HTTPException(status_code=400, detail="El nombre de usuario ya está en uso")
+
+def _save_new_user(db: Session, db_user: models.User) -> models.User:
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
 @app.post("/api/register", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Registrar un nuevo usuario"""
+    # Las partes bloqueantes (BD, SMTP) van al threadpool y bcrypt al ejecutor de hashing
     try:
-        db_user = db.query(models.User).filter(models.User.email == user.email).first()
-        if db_user:
-            raise HTTPException(status_code=400, detail="El email ya está registrado")
-        
-        db_user = db.query(models.User).filter(models.User.username == user.username).first()
-        if db_user:
-            raise HTTPException(status_code=400, detail="El nombre de usuario ya está en uso")
+        await run_in_threadpool(_ensure_user_available, db, user)
         
         verification_token = auth.generate_verification_token()
         db_user = models.User(
             email=user.email,
             username=user.username,
-            hashed_password=auth.get_password_hash(user.password),
+            hashed_password=await auth.get_password_hash_async(user.password),
             role=user.role or "client",
             verification_token=verification_token,
             is_active=True,
             is_verified=False
         )
         
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        db_user = await run_in_threadpool(_save_new_user, db, db_user)
         
         try:
-            email_service.send_verification_email(
+            await run_in_threadpool(
+                email_service.send_verification_email,
                 email_to=user.email,
                 username=user.username,
                 token=verification_token
@@ -76,6 +167,11 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
             print(f"Error enviando email: {e}")
         
         return db_user
+    except HashingQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta de nuevo en unos segundos"
+        )
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -86,9 +182,15 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         )
 
 @app.post("/api/login", response_model=schemas.Token)
-def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     """Iniciar sesión"""
-    user = auth.authenticate_user(db, user_credentials.email, user_credentials.password)
+    try:
+        user = await auth.authenticate_user_async(db, user_credentials.email, user_credentials.password)
+    except HashingQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta de nuevo en unos segundos"
+        )
     
     if not user:
         raise HTTPException(
@@ -103,12 +205,34 @@ def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
             detail="Por favor verifica tu email antes de iniciar sesión"
         )
     
-    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    session_id = auth.new_session_id()
+    access_token = auth.create_user_access_token(user, session_id=session_id)
+    refresh_token = await run_in_threadpool(auth.create_refresh_token, db, user.id, session_id)
+    
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@app.post("/api/token/refresh", response_model=schemas.Token)
+def refresh_access_token(request: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Renovar el access token con un refresh token (rota el refresh token)"""
+    result = auth.rotate_refresh_token(db, request.refresh_token)
+    
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token inválido o expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user, refresh_token, session_id = result
+    access_token = auth.create_user_access_token(user, session_id=session_id)
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@app.post("/api/logout")
+def logout(request: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Cerrar sesión revocando el refresh token"""
+    auth.revoke_refresh_token(db, request.refresh_token)
+    return {"message": "Sesión cerrada"}
 
 @app.post("/api/verify-email")
 def verify_email(verification: schemas.EmailVerification, db: Session = Depends(get_db)):
@@ -129,17 +253,20 @@ def verify_email(verification: schemas.EmailVerification, db: Session = Depends(
 #USUARIOS
 
 @app.get("/api/users/me", response_model=schemas.UserResponse)
-async def read_users_me(current_user: models.User = Depends(auth.get_current_active_user)):
+def read_users_me(current_user: models.User = Depends(auth.get_current_active_user)):
     """Obtener información del usuario actual"""
+    # Síncrono: con el principal cacheado el perfil está expirado y se carga al
+    # serializar, lo que así ocurre en el threadpool y no en el event loop
     return current_user
 
-@app.put("/api/users/me", response_model=schemas.UserResponse)
-async def update_user(
+@app.put("/api/users/me", response_model=schemas.UserUpdateResponse)
+def update_user(
     user_update: schemas.UserUpdate,
     current_user: models.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Actualizar perfil del usuario"""
+    token_version = current_user.token_version
     if user_update.full_name is not None:
         current_user.full_name = user_update.full_name
     if user_update.location is not None:
@@ -155,10 +282,16 @@ async def update_user(
     db.commit()
     db.refresh(current_user)
     
-    return current_user
+    response = schemas.UserUpdateResponse.model_validate(current_user)
+    if current_user.token_version != token_version:
+        # El cambio de rol revocó los tokens anteriores; devolver uno nuevo como switch-role
+        response.access_token = auth.create_user_access_token(current_user, session_id=db.info.get("session_id"))
+        response.token_type = "bearer"
+    
+    return response
 
 @app.post("/api/users/switch-role")
-async def switch_role(
+def switch_role(
     current_user: models.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -172,7 +305,15 @@ async def switch_role(
     db.commit()
     db.refresh(current_user)
     
-    return {"message": f"Rol cambiado a {current_user.role}", "new_role": current_user.role}
+    # El cambio de rol revoca los tokens anteriores; devolver uno nuevo (misma sesión)
+    access_token = auth.create_user_access_token(current_user, session_id=db.info.get("session_id"))
+    
+    return {
+        "message": f"Rol cambiado a {current_user.role}",
+        "new_role": current_user.role,
+        "access_token": access_token,
+        "token_type": "bearer"
+    }
 
 @app.get("/api/users/search", response_model=List[schemas.UserSummary])
 def search_users(
@@ -206,6 +347,19 @@ def send_friend_request(
     
     return friend_request
 
+@app.post("/api/friends/request/bulk", response_model=schemas.BulkFriendRequestResponse)
+def send_friend_requests_bulk(
+    request: schemas.BulkFriendRequestCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Enviar solicitudes de amistad a una lista de emails (importar contactos)"""
+    results = app_services.FriendshipService.send_friend_requests_bulk(db, current_user.id, request.emails)
+    return {
+        "sent": sum(1 for result in results if result.status == "sent"),
+        "results": results
+    }
+
 @app.post("/api/friends/accept/{request_id}")
 def accept_friend_request(
     request_id: int,
@@ -245,7 +399,7 @@ def reject_friend_request(
 @app.get("/api/friends/requests/pending", response_model=List[schemas.FriendRequestResponse])
 def get_pending_requests(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
     """Obtener solicitudes de amistad pendientes"""
     requests = db.query(models.FriendRequest).filter(
@@ -255,7 +409,7 @@ def get_pending_requests(
     
     result = []
     for request in requests:
-        sender = db.query(models.User).filter(models.User.id == request.sender_id).first()
+        sender = repository.get_user(db, request.sender_id)
         request_dict = {
             "id": request.id,
             "sender_id": request.sender_id,
@@ -280,13 +434,33 @@ def get_pending_requests(
 
 @app.get("/api/friends", response_model=List[schemas.UserSummary])
 def get_friends(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    after_id: Optional[int] = Query(None, description="Último id recibido, para pedir la página siguiente"),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
-    """Obtener lista de amigos"""
-    friends = app_services.FriendshipService.get_friends(db, current_user.id)
+    """Obtener lista de amigos (ordenada por id, paginable con limit y after_id)"""
+    friends = app_services.FriendshipService.get_friends(db, current_user.id, limit, after_id)
     return friends
 
+@app.get("/api/friends/suggestions", response_model=List[schemas.FriendSuggestionResponse])
+def get_friend_suggestions(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
+):
+    """Personas que quizás conozcas, ordenadas por amigos en común"""
+    return app_services.FriendshipService.get_suggestions(db, current_user.id, limit)
+
+@app.get("/api/friends/{user_id}/mutual", response_model=List[schemas.UserSummary])
+def get_mutual_friends(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
+):
+    """Amigos en común con otro usuario"""
+    return app_services.FriendshipService.get_mutual_friends(db, current_user.id, user_id)
+
 @app.delete("/api/friends/{friend_id}")
 def remove_friend(
     friend_id: int,
@@ -294,34 +468,43 @@ def remove_friend(
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Eliminar un amigo"""
-    friend = db.query(models.User).filter(models.User.id == friend_id).first()
+    friend = repository.get_user(db, friend_id)
     if not friend:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    if friend in current_user.friends:
-        current_user.friends.remove(friend)
+    if app_services.FriendshipService.remove_friendship(db, current_user.id, friend.id):
         db.commit()
         return {"message": "Amigo eliminado"}
     
     raise HTTPException(status_code=400, detail="No son amigos")
 
-@app.get("/api/network/graph", response_model=schemas.TrustNetworkResponse)
-def get_trust_network_graph(
-    max_depth: int = 2,
+@app.get("/api/network/path/{target_user_id}", response_model=schemas.ConnectionPathsResponse)
+def get_connection_paths(
+    target_user_id: int,
+    max_depth: int = Query(4, ge=1, le=6),
+    max_paths: int = Query(3, ge=1, le=20),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
-    """Obtener el grafo de red de confianza del usuario"""
-    nodes = []
-    connections = []
+    """Cómo estoy conectado con otro usuario (p. ej. tú -> María -> Carlos)"""
+    return app_services.FriendshipService.get_connection_paths(
+        db, current_user.id, target_user_id, max_depth, max_paths
+    )
+
+def _iter_trust_network(db: Session, current_user: models.User, max_depth: int):
+    """
+    Eventos ("node" | "edge", datos) del grafo de confianza, en el orden de la respuesta,
+    y al final ("truncated", bool). Se corta en NETWORK_GRAPH_MAX_NODES / MAX_EDGES.
+    """
+    max_nodes = settings.network_graph_max_nodes
+    max_edges = settings.network_graph_max_edges
     visited = set()
+    edges = 0
+    truncated = False
     
-    def add_node(user: models.User, distance: int, is_friend: bool = False):
-        if user.id in visited:
-            return
+    def to_node(user: models.User, distance: int, is_friend: bool = False) -> dict:
         visited.add(user.id)
-        
-        nodes.append({
+        return {
             "id": user.id,
             "username": user.username,
             "full_name": user.full_name,
@@ -331,64 +514,156 @@ def get_trust_network_graph(
             "distance": distance,
             "rating": user.rating,
             "total_reviews": user.total_reviews
-        })
+        }
     
     # Agregar nodo central (usuario actual)
-    add_node(current_user, 0, False)
-    
-    # Nivel 1: Amigos directos
-    friendships = db.query(models.friendship).filter(
-        or_(
-            models.friendship.c.user_id == current_user.id,
-            models.friendship.c.friend_id == current_user.id
-        ),
-        models.friendship.c.status == "accepted"
-    ).all()
+    yield "node", to_node(current_user, 0, False)
+    
+    # Nivel 1: Amigos directos, en el orden de las amistades (uno de más para saber si se corta)
+    friends = app_services.FriendshipService.get_network_friends(db, current_user.id, limit=max_nodes)
+    if len(friends) > max_nodes - 1:
+        friends = friends[:max_nodes - 1]
+        truncated = True
+    
+    # Técnicos que cada amigo contrató y calificó con 4+ (una sola consulta para todos);
+    # cada fila es a lo sumo una arista, así que nunca hacen falta más de max_edges
+    recommended_by_friend = {}
+    if max_depth >= 2 and friends:
+        recommended_by_friend = app_services.RecommendationService.get_friend_recommended_technicians(
+            db, current_user.id, [friend.id for friend in friends], limit=max_edges
+        )
     
-    for friendship in friendships:
-        friend_id = friendship.friend_id if friendship.user_id == current_user.id else friendship.user_id
-        friend = db.query(models.User).filter(models.User.id == friend_id).first()
+    # Los amigos ya tienen lugar reservado; el resto de nodos queda para los técnicos
+    technician_slots = max_nodes - 1 - len(friends)
+    
+    for friend in friends:
+        if edges >= max_edges:
+            truncated = True
+            break
+        if friend.id not in visited:
+            yield "node", to_node(friend, 1, True)
+        yield "edge", {
+            "source": current_user.id,
+            "target": friend.id,
+            "type": "friendship"
+        }
+        edges += 1
         
-        if friend:
-            add_node(friend, 1, True)
-            connections.append({
-                "source": current_user.id,
-                "target": friend.id,
-                "type": "friendship"
-            })
-            
-            # Nivel 2: Técnicos recomendados (si max_depth >= 2)
-            if max_depth >= 2:
-                # Obtener servicios contratados por el amigo
-                services = db.query(models.Service).filter(
-                    models.Service.client_id == friend.id,
-                    models.Service.status == "completed"
-                ).all()
-                
-                for service in services:
-                    # Obtener reviews del técnico
-                    review = db.query(models.Review).filter(
-                        models.Review.service_id == service.id,
-                        models.Review.client_id == friend.id,
-                        models.Review.rating >= 4
-                    ).first()
-                    
-                    if review:
-                        technician = db.query(models.User).filter(
-                            models.User.id == service.technician_id
-                        ).first()
-                        
-                        if technician and technician.id != current_user.id:
-                            add_node(technician, 2, False)
-                            connections.append({
-                                "source": friend.id,
-                                "target": technician.id,
-                                "type": "recommendation"
-                            })
+        # Nivel 2: Técnicos recomendados (si max_depth >= 2)
+        for technician in recommended_by_friend.get(friend.id, ()):
+            if edges >= max_edges:
+                truncated = True
+                break
+            if technician.id not in visited:
+                if technician_slots <= 0:
+                    truncated = True
+                    continue
+                technician_slots -= 1
+                yield "node", to_node(technician, 2, False)
+            yield "edge", {
+                "source": friend.id,
+                "target": technician.id,
+                "type": "recommendation"
+            }
+            edges += 1
+    
+    yield "truncated", truncated
+
+def _compact_network(center_user_id: int, nodes: List[dict], connections: List[dict], delta_ids: bool,
+                     truncated: bool = False) -> dict:
+    """
+    Formato columnar: un array por campo en lugar de un objeto por nodo, con los
+    mismos campos que los nodos de json y ndjson (booleanos como 0/1).
+    Las aristas referencian posiciones en nodes; roles y tipos de arista van como
+    índices a sus diccionarios. Con delta_ids, ids[i] = id[i] - id[i-1].
+    """
+    ids = [node["id"] for node in nodes]
+    position = {node_id: i for i, node_id in enumerate(ids)}
+    roles = sorted({node["role"] for node in nodes})
+    role_index = {role: i for i, role in enumerate(roles)}
+    edge_types = ["friendship", "recommendation"]
+    
+    if delta_ids and ids:
+        ids = [ids[0]] + [current - previous for previous, current in zip(ids, ids[1:])]
+    
+    return {
+        "format": "compact",
+        "center_user_id": center_user_id,
+        "truncated": truncated,
+        "id_encoding": "delta" if delta_ids else "plain",
+        "roles": roles,
+        "edge_types": edge_types,
+        "nodes": {
+            "id": ids,
+            "username": [node["username"] for node in nodes],
+            "full_name": [node["full_name"] for node in nodes],
+            "role": [role_index[node["role"]] for node in nodes],
+            "distance": [node["distance"] for node in nodes],
+            "is_friend": [int(node["is_friend"]) for node in nodes],
+            "is_technician": [int(node["is_technician"]) for node in nodes],
+            "rating": [node["rating"] for node in nodes],
+            "total_reviews": [node["total_reviews"] for node in nodes],
+        },
+        "edges": {
+            "source": [position[edge["source"]] for edge in connections],
+            "target": [position[edge["target"]] for edge in connections],
+            "type": [edge_types.index(edge["type"]) for edge in connections],
+        },
+    }
+
+def _ndjson_network(center_user_id: int, events):
+    """
+    Una línea JSON por nodo o arista, enviada a medida que se genera.
+    "kind" dice qué es cada línea (meta, node, edge, end); en las aristas,
+    "type" sigue siendo friendship o recommendation como en el formato json.
+    """
+    yield json.dumps({"kind": "meta", "center_user_id": center_user_id}) + "\n"
+    counts = {"node": 0, "edge": 0}
+    truncated = False
+    for kind, item in events:
+        if kind == "truncated":
+            truncated = item
+            continue
+        counts[kind] += 1
+        yield json.dumps({"kind": kind, **item}, ensure_ascii=False) + "\n"
+    yield json.dumps({"kind": "end", "nodes": counts["node"], "edges": counts["edge"], "truncated": truncated}) + "\n"
+
+@app.get("/api/network/graph", response_model=schemas.TrustNetworkResponse)
+def get_trust_network_graph(
+    max_depth: int = Query(2, ge=1, le=2,
+                           description="1: solo amigos; 2: amigos y los técnicos que recomendaron"),
+    format: str = Query("json", pattern="^(json|compact|ndjson)$",
+                        description="json (por defecto), compact (columnar) o ndjson (streaming)"),
+    delta_ids: bool = Query(False, description="Solo compact: ids codificados como diferencias"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Obtener el grafo de red de confianza del usuario"""
+    center_user_id = current_user.id
+    events = _iter_trust_network(db, current_user, max_depth)
+    
+    if format == "ndjson":
+        return StreamingResponse(_ndjson_network(center_user_id, events), media_type="application/x-ndjson")
+    
+    nodes = []
+    connections = []
+    truncated = False
+    for kind, item in events:
+        if kind == "node":
+            nodes.append(item)
+        elif kind == "edge":
+            connections.append(item)
+        else:
+            truncated = item
+    
+    if format == "compact":
+        return JSONResponse(_compact_network(center_user_id, nodes, connections, delta_ids, truncated))
+    
     return {
         "nodes": nodes,
         "connections": connections,
-        "center_user_id": current_user.id
+        "center_user_id": center_user_id,
+        "truncated": truncated
     }
 # SERVICIOS
 
@@ -467,14 +742,8 @@ def complete_service(
     if not service:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
     
-    service.status = "completed"
-    service.completed_at = datetime.utcnow()
-    
-    # Actualizar estadísticas
-    current_user.jobs_active -= 1
-    current_user.jobs_completed += 1
-    
-    db.commit()
+    # Contadores del técnico y recomendaciones de los amigos del cliente: los mismos que en PUT /status
+    app_services.ServiceRequestService.update_service_status(db, service.id, current_user.id, "completed")
     
     return {"message": "Servicio marcado como completado"}
 
@@ -503,14 +772,30 @@ def search_services(
 
 @app.get("/api/recommendations", response_model=List[schemas.RecommendationResponse])
 def get_recommendations(
+    response: Response,
     category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
-    """Obtener técnicos recomendados basados en la red de confianza"""
-    return app_services.RecommendationService.get_recommended_technicians(
-        db, current_user.id, category
+    """Obtener técnicos recomendados basados en la red de confianza (paginable con limit y cursor)"""
+    after = None
+    if cursor:
+        try:
+            after = app_services.RecommendationService.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    
+    # Uno de más para saber si hay página siguiente
+    recommendations = app_services.RecommendationService.get_recommendations(
+        db, current_user.id, category, limit + 1, after
     )
+    if len(recommendations) > limit:
+        recommendations = recommendations[:limit]
+        last = recommendations[-1]
+        response.headers["X-Next-Cursor"] = app_services.RecommendationService.encode_cursor(last.score, last.technician.id)
+    return recommendations
 
 @app.get("/api/technicians/search", response_model=List[schemas.UserSummary])
 def search_technicians(
@@ -572,9 +857,7 @@ def get_technician_reviews(
     db: Session = Depends(get_db)
 ):
     """Obtener reviews de un técnico"""
-    reviews = db.query(models.Review).filter(
-        models.Review.technician_id == technician_id
-    ).order_by(models.Review.created_at.desc()).all()
+    reviews = repository.get_technician_reviews(db, technician_id)
     
     return reviews
 
@@ -608,7 +891,7 @@ def remove_favorite(
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Eliminar técnico de favoritos"""
-    technician = db.query(models.User).filter(models.User.id == technician_id).first()
+    technician = repository.get_user(db, technician_id)
     
     if technician and technician in current_user.favorite_technicians:
         current_user.favorite_technicians.remove(technician)
@@ -692,13 +975,7 @@ def get_dashboard_stats(
             ).scalar() or 0
             
             # Count Amigos / Contactos
-            friends_count = db.query(func.count(models.friendship.c.id)).filter(
-                or_(
-                    models.friendship.c.user_id == current_user.id,
-                    models.friendship.c.friend_id == current_user.id
-                ),
-                models.friendship.c.status == "accepted"
-            ).scalar() or 0
+            friends_count = app_services.FriendshipService.count_friends(db, current_user.id)
             
             # Count Favoritos
             favorites_count = db.query(func.count(models.favorites.c.technician_id)).filter(
@@ -769,14 +1046,12 @@ def get_technician_profile(
         db.commit()
     
     # Obtener reviews del técnico
-    reviews = db.query(models.Review).filter(
-        models.Review.technician_id == technician_id
-    ).order_by(models.Review.created_at.desc()).all()
+    reviews = repository.get_technician_reviews(db, technician_id)
     
     # Formatear reviews con información del cliente
     formatted_reviews = []
     for review in reviews:
-        client = db.query(models.User).filter(models.User.id == review.client_id).first()
+        client = repository.get_user(db, review.client_id)
         if client:
             formatted_reviews.append({
                 "id": review.id,
@@ -824,7 +1099,7 @@ def get_technician_profile(
 @app.get("/api/conversations", response_model=List[schemas.ConversationSummary])
 def get_conversations(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
     """Obtener todas las conversaciones del usuario"""
     conversations = app_services.MessagingService.get_user_conversations(db, current_user.id)
@@ -858,7 +1133,7 @@ def create_or_get_conversation(
 def get_conversation_messages(
     conversation_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
     """Obtener mensajes de una conversación"""
     data = app_services.MessagingService.get_conversation_messages(
@@ -888,7 +1163,7 @@ def send_message(
     conversation_id: int,
     message_data: schemas.MessageCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
     """Enviar un mensaje en una conversación"""
     message = app_services.MessagingService.send_message(
@@ -905,7 +1180,7 @@ def send_message(
 def mark_conversation_as_read(
     conversation_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
     """Marcar conversación como leída"""
     success = app_services.MessagingService.mark_as_read(db, conversation_id, current_user.id)
@@ -937,7 +1212,7 @@ def create_service_request(
 @app.get("/api/services/my-services", response_model=List[schemas.ServiceResponse])
 def get_my_services(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.TokenData = Depends(auth.get_current_identity)
 ):
     """Obtener mis servicios (como cliente o técnico)"""
     services = app_services.ServiceRequestService.get_user_services(
@@ -1013,23 +1288,6 @@ def start_service(
     return {"message": "Servicio iniciado"}
 
 
-@app.post("/api/services/{service_id}/complete")
-def complete_service(
-    service_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
-):
-    """Completar servicio (técnico)"""
-    service = app_services.ServiceRequestService.update_service_status(
-        db, service_id, current_user.id, "completed"
-    )
-    
-    if not service:
-        raise HTTPException(status_code=404, detail="Servicio no encontrado")
-    
-    return {"message": "Servicio completado"}
-
-
 @app.post("/api/services/{service_id}/cancel")
 def cancel_service(
     service_id: int,
@@ -1090,7 +1348,7 @@ def get_dashboard_stats(
             models.Service.status == "completed"
         ).count()
         
-        friends_count = len(current_user.friends)
+        friends_count = app_services.FriendshipService.count_friends(db, current_user.id)
         
         # Favoritos (simulado por ahora si no hay tabla directa, o usar la relación si existe)
         favorites_count = 0 # Implementar si existe tabla de favoritos
@@ -1171,7 +1429,7 @@ def get_reviews_summary(
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Obtener resumen de opiniones de un técnico con IA"""
-    technician = db.query(models.User).filter(models.User.id == technician_id).first()
+    technician = repository.get_user(db, technician_id)
     if not technician:
         raise HTTPException(status_code=404, detail="Técnico no encontrado")
         
@@ -0,0 +1,228 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+# Tabla de control con las versiones de esquema aplicadas
+schema_migrations = Table(
+    'schema_migrations',
+    MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(255), nullable=False),
+    Column('applied_at', DateTime, default=datetime.utcnow)
+)
+
+
+def _add_column_if_missing(conn: Connection, table: str, column: str, ddl: str):
+    columns = {col["name"] for col in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _0001_users_token_version(conn: Connection):
+    """Versión de token para revocar JWT emitidos"""
+    _add_column_if_missing(conn, "users", "token_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _has_index(conn: Connection, name: str, table: str) -> bool:
+    """Como get_indexes, pero también ve los índices funcionales (el inspector los omite)"""
+    if conn.dialect.name == "mysql":
+        return conn.execute(text(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :name"
+        ), {"table": table, "name": name}).first() is not None
+    if conn.dialect.name == "sqlite":
+        return conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND name = :name"
+        ), {"table": table, "name": name}).first() is not None
+    return name in {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def _create_index_if_missing(conn: Connection, name: str, table: str, columns: tuple):
+    if not inspect(conn).has_table(table):
+        return
+    if not _has_index(conn, name, table):
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+# Índices compuestos para los filtros más frecuentes
+HOT_QUERY_INDEXES = (
+    ("ix_services_technician_status_created", "services", ("technician_id", "status", "created_at")),
+    ("ix_services_client_status", "services", ("client_id", "status")),
+    ("ix_reviews_technician_created", "reviews", ("technician_id", "created_at")),
+    ("ix_reviews_service_id", "reviews", ("service_id",)),
+    ("ix_messages_conversation_created", "messages", ("conversation_id", "created_at")),
+    ("ix_conversations_client_technician", "conversations", ("client_id", "technician_id")),
+    ("ix_friendship_user_status", "friendship", ("user_id", "status")),
+    ("ix_friendship_friend_status", "friendship", ("friend_id", "status")),
+    ("ix_friend_requests_receiver_status", "friend_requests", ("receiver_id", "status")),
+    ("ix_users_verification_token", "users", ("verification_token",)),
+)
+
+
+def _0002_hot_query_indexes(conn: Connection):
+    """Índices compuestos para services, reviews, messages, conversations, friendship y friend_requests"""
+    for name, table, columns in HOT_QUERY_INDEXES:
+        _create_index_if_missing(conn, name, table, columns)
+
+
+def _drop_index_if_exists(conn: Connection, name: str, table: str):
+    if not inspect(conn).has_table(table):
+        return
+    if _has_index(conn, name, table):
+        if conn.dialect.name == "mysql":
+            conn.execute(text(f"DROP INDEX {name} ON {table}"))
+        else:
+            conn.execute(text(f"DROP INDEX {name}"))
+
+
+def _0003_symmetric_friendship(conn: Connection):
+    """
+    Amistades en ambas direcciones: elimina duplicados, agrega la fila inversa
+    que falte y unifica el estado del par (aceptada si cualquiera de las dos lo está).
+    """
+    if not inspect(conn).has_table("friendship"):
+        return
+
+    rows = conn.execute(text(
+        "SELECT id, user_id, friend_id, status, created_at FROM friendship ORDER BY id"
+    )).fetchall()
+
+    edges = {}
+    duplicates = []
+    for row in rows:
+        key = (row.user_id, row.friend_id)
+        if key in edges or row.user_id == row.friend_id:
+            duplicates.append({"id": row.id})
+        else:
+            edges[key] = row
+
+    missing = []
+    accepted = []
+    for (user_id, friend_id), row in edges.items():
+        reverse = edges.get((friend_id, user_id))
+        if reverse is None:
+            missing.append({"user_id": friend_id, "friend_id": user_id,
+                            "status": row.status, "created_at": row.created_at})
+        elif row.status != "accepted" and reverse.status == "accepted":
+            accepted.append({"id": row.id})
+
+    if duplicates:
+        conn.execute(text("DELETE FROM friendship WHERE id = :id"), duplicates)
+    if accepted:
+        conn.execute(text("UPDATE friendship SET status = 'accepted' WHERE id = :id"), accepted)
+    if missing:
+        conn.execute(text(
+            "INSERT INTO friendship (user_id, friend_id, status, created_at) "
+            "VALUES (:user_id, :friend_id, :status, :created_at)"
+        ), missing)
+
+    if "ux_friendship_user_friend" not in {index["name"] for index in inspect(conn).get_indexes("friendship")}:
+        conn.execute(text("CREATE UNIQUE INDEX ux_friendship_user_friend ON friendship (user_id, friend_id)"))
+    _create_index_if_missing(conn, "ix_friendship_user_status_friend", "friendship", ("user_id", "status", "friend_id"))
+    # Quedan cubiertos por el índice anterior (las consultas ya no filtran por friend_id)
+    _drop_index_if_exists(conn, "ix_friendship_user_status", "friendship")
+    _drop_index_if_exists(conn, "ix_friendship_friend_status", "friendship")
+
+
+def _0004_materialized_recommendations(conn: Connection):
+    """Categoría y amigos en común en recommendations (la tabla pasa a guardar el top-N materializado)"""
+    if not inspect(conn).has_table("recommendations"):
+        return
+    _add_column_if_missing(conn, "recommendations", "category", "VARCHAR(100)")
+    _add_column_if_missing(conn, "recommendations", "common_friends", "INTEGER NOT NULL DEFAULT 0")
+    _create_index_if_missing(
+        conn, "ix_recommendations_recipient_category_score", "recommendations",
+        ("recipient_id", "category", "score")
+    )
+
+
+def _0005_refresh_token_sessions(conn: Connection):
+    """Id de sesión en refresh_tokens: el logout revoca solo los access tokens de esa sesión"""
+    if not inspect(conn).has_table("refresh_tokens"):
+        return
+    _add_column_if_missing(conn, "refresh_tokens", "session_id", "VARCHAR(32)")
+    _create_index_if_missing(conn, "ix_refresh_tokens_session_id", "refresh_tokens", ("session_id",))
+
+
+def _0006_recommendation_queue_version(conn: Connection):
+    """Primer cambio pendiente y versión de la cola en recommendation_state"""
+    if not inspect(conn).has_table("recommendation_state"):
+        return
+    _add_column_if_missing(conn, "recommendation_state", "stale_since", "DATETIME")
+    _add_column_if_missing(conn, "recommendation_state", "queue_version", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute(text(
+        "UPDATE recommendation_state SET stale_since = queued_at "
+        "WHERE queued_at IS NOT NULL AND stale_since IS NULL"
+    ))
+    _drop_index_if_exists(conn, "ix_recommendation_state_queued_at", "recommendation_state")
+    _create_index_if_missing(
+        conn, "ix_recommendation_state_stale_since", "recommendation_state", ("stale_since",)
+    )
+
+
+def _0007_recommendation_score_double(conn: Connection):
+    """
+    recommendations.score en doble precisión (en MySQL FLOAT es de 4 bytes y el
+    cursor no coincidía con el score calculado en vivo; el REAL de SQLite ya es
+    de 8). Se vacía recommendation_state para rematerializar a todos con el
+    nuevo formato; mientras tanto se sirven en vivo.
+    """
+    if not inspect(conn).has_table("recommendations"):
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text("ALTER TABLE recommendations MODIFY score DOUBLE"))
+    if inspect(conn).has_table("recommendation_state"):
+        conn.execute(text("DELETE FROM recommendation_state"))
+
+
+def _0008_users_email_lower_index(conn: Connection):
+    """Índice funcional sobre lower(email) para buscar emails sin distinguir mayúsculas (MySQL 8.0.13+)"""
+    # La expresión va entre paréntesis propios, como exige MySQL
+    _create_index_if_missing(conn, "ix_users_email_lower", "users", ("(lower(email))",))
+
+
+# (versión, nombre, función) en orden; nunca modificar una migración ya publicada
+MIGRATIONS = [
+    (1, "users_token_version", _0001_users_token_version),
+    (2, "hot_query_indexes", _0002_hot_query_indexes),
+    (3, "symmetric_friendship", _0003_symmetric_friendship),
+    (4, "materialized_recommendations", _0004_materialized_recommendations),
+    (5, "refresh_token_sessions", _0005_refresh_token_sessions),
+    (6, "recommendation_queue_version", _0006_recommendation_queue_version),
+    (7, "recommendation_score_double", _0007_recommendation_score_double),
+    (8, "users_email_lower_index", _0008_users_email_lower_index),
+]
+
+
+def create_schema(engine: Engine):
+    """Crear las tablas que falten (no modifica las existentes)"""
+    from .models import Base
+    Base.metadata.create_all(bind=engine)
+
+
+def applied_versions(engine: Engine) -> set:
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(schema_migrations.name):
+            return set()
+        return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def upgrade(engine: Engine, verbose: bool = False) -> list:
+    """Aplicar las migraciones pendientes, cada una en su propia transacción"""
+    schema_migrations.create(bind=engine, checkfirst=True)
+    done = applied_versions(engine)
+    applied = []
+
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+        if verbose:
+            print(f"Migración {version:04d} aplicada: {name}")
+
+    return applied
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, Float, ForeignKey, Table
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, Float, Double, ForeignKey, Table, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime, timezone
@@ -14,7 +14,10 @@ friendship = Table(
     Column('user_id', Integer, ForeignKey('users.id')),
     Column('friend_id', Integer, ForeignKey('users.id')),
     Column('status', String(50), default='pending'),  
-    Column('created_at', DateTime(timezone=True), server_default=func.now())
+    Column('created_at', DateTime(timezone=True), server_default=func.now()),
+    # Cada amistad se guarda en ambas direcciones: (a, b) y (b, a)
+    Index('ux_friendship_user_friend', 'user_id', 'friend_id', unique=True),
+    Index('ix_friendship_user_status_friend', 'user_id', 'status', 'friend_id')
 )
 
 # Tabla intermedia para favoritos
@@ -50,7 +53,9 @@ class User(Base):
     
     is_active = Column(Boolean, default=False)
     is_verified = Column(Boolean, default=False)
-    verification_token = Column(String(255), nullable=True)
+    verification_token = Column(String(255), nullable=True, index=True)
+    # Se incrementa para invalidar los JWT ya emitidos (logout, cambio de rol o contraseña)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=utc_now)
     updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
 
@@ -77,9 +82,16 @@ class User(Base):
     reviews_received = relationship('Review', foreign_keys='Review.technician_id', overlaps="client,technician")
     reviews_given = relationship('Review', foreign_keys='Review.client_id', overlaps="client,technician")
 
+# Búsquedas de email sin distinguir mayúsculas (importación de contactos)
+Index('ix_users_email_lower', func.lower(User.email))
+
 
 class Service(Base):
     __tablename__ = "services"
+    __table_args__ = (
+        Index('ix_services_technician_status_created', 'technician_id', 'status', 'created_at'),
+        Index('ix_services_client_status', 'client_id', 'status'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey('users.id'))
@@ -101,6 +113,10 @@ class Service(Base):
 
 class Review(Base):
     __tablename__ = "reviews"
+    __table_args__ = (
+        Index('ix_reviews_technician_created', 'technician_id', 'created_at'),
+        Index('ix_reviews_service_id', 'service_id'),
+    )
     id = Column(Integer, primary_key=True, index=True)    
     service_id = Column(Integer, ForeignKey('services.id'), nullable=False)
     service = relationship('Service', back_populates='reviews')
@@ -119,28 +135,105 @@ class Review(Base):
 
 
 class Recommendation(Base):
+    """Top-N de técnicos por usuario y categoría, precalculado por recommendation_store"""
     __tablename__ = "recommendations"
+    __table_args__ = (
+        Index('ix_recommendations_recipient_category_score', 'recipient_id', 'category', 'score'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     recommender_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     technician_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     recipient_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    score = Column(Float, default=0.0)
+    # NULL = todas las categorías
+    category = Column(String(100), nullable=True)
+    # Doble precisión: el cursor de /api/recommendations compara el score exacto
+    score = Column(Double, default=0.0)
     reason = Column(Text, nullable=True) 
+    common_friends = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=utc_now)
 
 
+class RecommendationState(Base):
+    """Cuándo se materializaron las recomendaciones de un usuario y desde cuándo están desactualizadas"""
+    __tablename__ = "recommendation_state"
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    computed_at = Column(DateTime, nullable=True)
+    # Último cambio pendiente y primero sin materializar (acota la antigüedad servida)
+    queued_at = Column(DateTime, nullable=True)
+    stale_since = Column(DateTime, nullable=True, index=True)
+    # Sube con cada cambio: materialize solo limpia la cola si no cambió mientras calculaba
+    queue_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    # Se conserva al rotar: identifica la sesión en el claim "sid" de los access tokens
+    session_id = Column(String(32), nullable=True, index=True)
+    # HMAC-SHA256 del token; el token en claro nunca se guarda
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+    replaced_by_id = Column(Integer, ForeignKey('refresh_tokens.id'), nullable=True)
+    created_at = Column(DateTime, default=utc_now)
+    user = relationship("User")
+
+
 class FriendRequest(Base):
     __tablename__ = "friend_requests"
+    __table_args__ = (
+        Index('ix_friend_requests_receiver_status', 'receiver_id', 'status'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     receiver_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     status = Column(String(50), default="pending")
     created_at = Column(DateTime, default=utc_now)
     updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
-    
+
+
+class FriendSuggestion(Base):
+    """Personas que quizás conozcas: top-K por amigos en común (lo llena refresh_suggestions.py)"""
+    __tablename__ = "friend_suggestions"
+    __table_args__ = (
+        Index('ux_friend_suggestions_user_suggested', 'user_id', 'suggested_user_id', unique=True),
+        Index('ix_friend_suggestions_user_mutual', 'user_id', 'mutual_friends'),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    suggested_user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    mutual_friends = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, default=utc_now)
+    suggested_user = relationship("User", foreign_keys=[suggested_user_id])
+
+
+class FriendSuggestionRefresh(Base):
+    """Usuarios cuyas amistades cambiaron desde el último cálculo de sugerencias"""
+    __tablename__ = "friend_suggestion_refresh"
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    queued_at = Column(DateTime, default=utc_now, nullable=False)
+
+
+class TechnicianTrustScore(Base):
+    """Confianza de cada usuario en cada técnico: PageRank personalizado (lo llena refresh_trust_rank.py)"""
+    __tablename__ = "technician_trust_scores"
+    __table_args__ = (
+        Index('ux_technician_trust_scores_user_technician', 'user_id', 'technician_id', unique=True),
+        Index('ix_technician_trust_scores_user_score', 'user_id', 'score'),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    technician_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    score = Column(Float, nullable=False)
+    computed_at = Column(DateTime, default=utc_now)
+
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index('ix_conversations_client_technician', 'client_id', 'technician_id'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey('users.id'))
     technician_id = Column(Integer, ForeignKey('users.id'))
@@ -158,6 +251,9 @@ class Conversation(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index('ix_messages_conversation_created', 'conversation_id', 'created_at'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey('conversations.id'))
     sender_id = Column(Integer, ForeignKey('users.id'))
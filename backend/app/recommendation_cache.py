@@ -0,0 +1,53 @@
+"""
+Cache de resultados de /api/recommendations por (usuario, categoría, página).
+
+La clave lleva la versión del usuario en recommendation_state (queue_version y
+computed_at), que se lee de la BD en cada consulta: una amistad, una review o
+un servicio completado suben queue_version al confirmar y materializar cambia
+computed_at, así que ningún worker sirve un resultado anterior a esos cambios.
+Los usuarios nunca materializados también tienen fila (la crea la primera
+consulta, con computed_at NULL), así que se cachean aunque el scheduler no corra.
+
+Se guardan ids y scores, no los técnicos: su rating y su perfil se leen al
+servir, en una consulta, porque cambian con reviews de cualquier usuario.
+"""
+from datetime import datetime
+from typing import Hashable, List, Optional, Tuple
+from .cache import TTLCache
+from .config import settings
+
+# (technician_id, score, razón, amigos en común)
+CachedRecommendation = Tuple[int, float, str, int]
+
+
+class RecommendationCache:
+    """Resultados por usuario, válidos mientras no cambie su versión en recommendation_state"""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 300.0):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def version(state) -> Optional[Tuple[int, Optional[datetime]]]:
+        """Versión del usuario según su fila de recommendation_state (None: sin fila, no se cachea)"""
+        if state is None:
+            return None
+        return (state.queue_version, state.computed_at)
+
+    def get(self, user_id: int, version: tuple, key: Hashable) -> Optional[List[CachedRecommendation]]:
+        return self._entries.get((user_id, version, key))
+
+    def set(self, user_id: int, version: tuple, key: Hashable, value: List[CachedRecommendation]):
+        """Guardar un resultado; si la versión ya cambió, la clave nunca se vuelve a pedir"""
+        self._entries.set((user_id, version, key), value)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+
+recommendation_cache = RecommendationCache(
+    maxsize=settings.recommendation_cache_size if settings.recommendation_cache_enabled else 0,
+    ttl=settings.recommendation_cache_ttl_seconds
+)
@@ -0,0 +1,287 @@
+"""
+Recomendaciones materializadas en la tabla recommendations.
+
+refresh_recommendations.py (un solo proceso) guarda el top-N de técnicos de
+cada usuario, para todas las categorías (category NULL) y para cada categoría.
+recommendation_state lleva cuándo se calcularon y desde cuándo están
+desactualizadas: una amistad nueva o eliminada marca a ambos usuarios y una
+review marca a los amigos de quien la escribió. /api/recommendations sirve
+desde la tabla mientras el primer cambio pendiente no supere
+recommendations_max_staleness_seconds.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import primary_session
+from . import models
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _queue(db: Session, condition):
+    """Marcar el cambio: queued_at y la versión siempre suben, stale_since guarda el primero"""
+    now = datetime.utcnow()
+    db.execute(
+        update(models.RecommendationState)
+        .where(condition)
+        .values(
+            queued_at=now,
+            stale_since=func.coalesce(models.RecommendationState.stale_since, now),
+            queue_version=models.RecommendationState.queue_version + 1
+        )
+    )
+
+
+def queue_refresh(db: Session, user_ids: Iterable[int]):
+    """
+    Marcar usuarios como desactualizados (se confirma con la transacción del llamador).
+    Los usuarios sin fila de estado no tienen nada cacheado ni materializado.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    _queue(db, models.RecommendationState.user_id.in_(user_ids))
+
+
+def queue_friends_of(db: Session, user_id: int):
+    """Marcar a los amigos de un usuario (sus recomendaciones dependen de sus reviews)"""
+    friend_ids = select(models.friendship.c.friend_id).where(
+        models.friendship.c.user_id == user_id,
+        models.friendship.c.status == "accepted"
+    )
+    _queue(db, models.RecommendationState.user_id.in_(friend_ids))
+
+
+def load(db: Session, user_id: int, category: str = None,
+         limit: int = None, after: Tuple[float, int] = None) -> Optional[list]:
+    """
+    (Recommendation, técnico) del usuario en orden (score desc, técnico asc) desde
+    el cursor after = (score, técnico), o None si no están materializadas, llevan
+    desactualizadas más de lo tolerado o la página pasa del final de una lista
+    cortada (se guardan top_n + 1: si está el de más, puede haber otros).
+    """
+    state = get_state(db, user_id)
+    if state is None or state.computed_at is None:
+        return None
+    if state.stale_since is not None:
+        max_staleness = timedelta(seconds=settings.recommendations_max_staleness_seconds)
+        if datetime.utcnow() - state.stale_since > max_staleness:
+            return None
+
+    if category:
+        category_filter = models.Recommendation.category == category
+    else:
+        category_filter = models.Recommendation.category.is_(None)
+    stmt = (
+        select(models.Recommendation, models.User)
+        .join(models.User, models.User.id == models.Recommendation.technician_id)
+        .where(models.Recommendation.recipient_id == user_id, category_filter)
+        .order_by(models.Recommendation.score.desc(), models.Recommendation.technician_id)
+    )
+    if after is not None:
+        stmt = stmt.where(or_(
+            models.Recommendation.score < after[0],
+            and_(models.Recommendation.score == after[0], models.Recommendation.technician_id > after[1])
+        ))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    rows = db.execute(stmt).all()
+
+    if limit is None or len(rows) < limit:
+        # Se llegó al final de lo guardado: solo es el final real si la lista no se cortó
+        stored = db.execute(
+            select(func.count()).select_from(models.Recommendation).where(
+                models.Recommendation.recipient_id == user_id, category_filter
+            )
+        ).scalar()
+        if stored > settings.recommendations_top_n:
+            return None
+    return rows
+
+
+def get_state(db: Session, user_id: int) -> Optional[models.RecommendationState]:
+    """Estado del usuario; queda en la sesión, así que load() e is_pending() no vuelven a consultarlo"""
+    return db.get(models.RecommendationState, user_id)
+
+
+def ensure_state(db: Session, user_id: int) -> Optional[models.RecommendationState]:
+    """
+    Estado del usuario, creándolo sin materializar (computed_at NULL) si no existe,
+    para que tenga versión aunque el scheduler no corra. Se confirma antes de
+    calcular: un cambio posterior ya encuentra la fila y sube su versión.
+    """
+    state = get_state(db, user_id)
+    if state is not None:
+        return state
+    try:
+        with db.begin_nested():
+            db.add(models.RecommendationState(user_id=user_id))
+        db.commit()
+    except IntegrityError:
+        # La creó otro request al mismo tiempo
+        db.rollback()
+    return get_state(db, user_id)
+
+
+def is_pending(db: Session, user_id: int) -> bool:
+    """Hay cambios sin materializar (lee el estado que load() ya dejó en la sesión)"""
+    state = get_state(db, user_id)
+    return state is not None and state.stale_since is not None
+
+
+def materialize(db: Session, user_id: int, top_n: int = None) -> int:
+    """
+    Recalcular y guardar el top-N de un usuario (todas las categorías y cada una); no confirma.
+    Se guarda uno de más para que la primera página (limit + 1) no caiga al cálculo en vivo.
+    """
+    from .services import RecommendationService
+
+    top_n = top_n or settings.recommendations_top_n
+    started = datetime.utcnow()
+    version = db.execute(
+        select(models.RecommendationState.queue_version)
+        .where(models.RecommendationState.user_id == user_id)
+    ).scalar()
+
+    groups = {None: RecommendationService.score_technicians(db, user_id)}
+    for row in RecommendationService.score_technicians(db, user_id, by_category=True):
+        groups.setdefault(row[0], []).append(row)
+    groups = {
+        category: RecommendationService.select_top(scored, top_n + 1)
+        for category, scored in groups.items()
+    }
+    users = RecommendationService.load_ranking_users(db, [row for selected in groups.values() for row in selected])
+
+    values = []
+    for category, selected in groups.items():
+        for technician, score, reason, num_friends, recommender_id in RecommendationService.rank_technicians(selected, users):
+            values.append({
+                "recommender_id": recommender_id,
+                "technician_id": technician.id,
+                "recipient_id": user_id,
+                "category": category,
+                "score": score,
+                "reason": reason,
+                "common_friends": num_friends,
+                "created_at": started,
+            })
+
+    db.execute(delete(models.Recommendation).where(models.Recommendation.recipient_id == user_id))
+    if values:
+        db.execute(insert(models.Recommendation), values)
+
+    if version is None:
+        db.add(models.RecommendationState(user_id=user_id, computed_at=started))
+        return len(values)
+
+    # Sin cambios desde que se leyó la versión: la cola queda vacía
+    result = db.execute(
+        update(models.RecommendationState)
+        .where(
+            models.RecommendationState.user_id == user_id,
+            models.RecommendationState.queue_version == version
+        )
+        .values(computed_at=started, queued_at=None, stale_since=None)
+    )
+    if result.rowcount == 0:
+        # Hubo un cambio mientras se calculaba: sigue pendiente y, como puede no estar
+        # incluido, la antigüedad se cuenta desde que empezó este cálculo
+        db.execute(
+            update(models.RecommendationState)
+            .where(models.RecommendationState.user_id == user_id)
+            .values(computed_at=started, stale_since=started)
+        )
+    return len(values)
+
+
+def pending_users(db: Session, limit: int) -> List[int]:
+    """Usuarios desactualizados (los más antiguos primero) y, si sobra lugar, los nunca materializados"""
+    user_ids = list(db.execute(
+        select(models.RecommendationState.user_id)
+        .where(models.RecommendationState.stale_since.is_not(None))
+        .order_by(models.RecommendationState.stale_since)
+        .limit(limit)
+    ).scalars())
+    if len(user_ids) < limit:
+        materialized = select(models.RecommendationState.user_id).where(
+            models.RecommendationState.computed_at.is_not(None)
+        )
+        user_ids.extend(db.execute(
+            select(models.User.id)
+            .where(models.User.is_active == True, models.User.id.not_in(materialized))
+            .order_by(models.User.id)
+            .limit(limit - len(user_ids))
+        ).scalars())
+    return user_ids
+
+
+def refresh_pending(db: Session, limit: int = None) -> dict:
+    """Materializar un lote de usuarios pendientes, confirmando uno a uno"""
+    limit = limit or settings.recommendations_refresh_batch
+    started = time.perf_counter()
+    refreshed = 0
+    rows = 0
+    for user_id in pending_users(db, limit):
+        try:
+            rows += materialize(db, user_id)
+            db.commit()
+            refreshed += 1
+        except Exception as e:
+            db.rollback()
+            print(f"Error materializando recomendaciones del usuario {user_id}: {e}")
+    return {
+        "refreshed": refreshed,
+        "recommendations": rows,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def refresh_all_pending(db: Session, batch: int = None) -> dict:
+    """Procesar la cola en lotes hasta vaciarla"""
+    batch = batch or settings.recommendations_refresh_batch
+    total = {"refreshed": 0, "recommendations": 0, "seconds": 0.0}
+    while True:
+        result = refresh_pending(db, batch)
+        for key in total:
+            total[key] += result[key]
+        if result["refreshed"] < batch:
+            break
+    total["seconds"] = round(total["seconds"], 3)
+    return total
+
+
+def start_scheduler(session_factory):
+    """
+    Procesar la cola cada recommendations_refresh_seconds dentro del proceso de la API.
+    Solo para un único worker: con varios, cada uno recalcularía a los mismos usuarios.
+    """
+    global _thread
+    if _thread is not None:
+        return
+    _stop.clear()
+
+    def run():
+        while not _stop.is_set():
+            with primary_session(session_factory) as db:
+                try:
+                    result = refresh_pending(db)
+                except Exception as e:
+                    result = {"refreshed": 0}
+                    print(f"Error refrescando recomendaciones: {e}")
+            if result["refreshed"] < settings.recommendations_refresh_batch:
+                _stop.wait(settings.recommendations_refresh_seconds)
+
+    _thread = threading.Thread(target=run, name="recommendations-refresh", daemon=True)
+    _thread.start()
+
+
+def stop_scheduler():
+    global _thread
+    _stop.set()
+    _thread = None
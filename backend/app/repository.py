@@ -0,0 +1,71 @@
+"""
+Consultas más frecuentes como lambda statements de SQLAlchemy.
+
+La sentencia se construye y compila una sola vez por forma; las llamadas
+siguientes solo enlazan los parámetros (las variables del closure).
+Las funciones *_stmt sirven tanto para Session como para AsyncSession.
+"""
+from typing import List, Optional
+from sqlalchemy import and_, case, func, lambda_stmt, or_, select
+from sqlalchemy.orm import Session
+from . import models
+
+
+def user_by_email_stmt(email: str):
+    return lambda_stmt(lambda: select(models.User).where(models.User.email == email))
+
+
+def user_by_id_stmt(user_id: int):
+    return lambda_stmt(lambda: select(models.User).where(models.User.id == user_id))
+
+
+def conversation_between_stmt(user_a: int, user_b: int):
+    """Conversación entre dos participantes, en cualquiera de los dos roles"""
+    return lambda_stmt(lambda: select(models.Conversation).where(
+        or_(
+            and_(models.Conversation.client_id == user_a, models.Conversation.technician_id == user_b),
+            and_(models.Conversation.client_id == user_b, models.Conversation.technician_id == user_a)
+        )
+    ).limit(1))
+
+
+def unread_total_stmt(user_id: int):
+    """Suma de no leídos del usuario en sus conversaciones activas"""
+    return lambda_stmt(lambda: select(func.coalesce(func.sum(
+        case(
+            (models.Conversation.client_id == user_id, models.Conversation.unread_client),
+            else_=models.Conversation.unread_technician
+        )
+    ), 0)).where(
+        or_(
+            models.Conversation.client_id == user_id,
+            models.Conversation.technician_id == user_id
+        ),
+        models.Conversation.is_active == True
+    ))
+
+
+def technician_reviews_stmt(technician_id: int):
+    return lambda_stmt(lambda: select(models.Review).where(
+        models.Review.technician_id == technician_id
+    ).order_by(models.Review.created_at.desc()))
+
+
+def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
+    return db.execute(user_by_email_stmt(email)).scalars().first()
+
+
+def get_user(db: Session, user_id: int) -> Optional[models.User]:
+    return db.execute(user_by_id_stmt(user_id)).scalars().first()
+
+
+def get_conversation_between(db: Session, user_a: int, user_b: int) -> Optional[models.Conversation]:
+    return db.execute(conversation_between_stmt(user_a, user_b)).scalars().first()
+
+
+def get_unread_total(db: Session, user_id: int) -> int:
+    return int(db.execute(unread_total_stmt(user_id)).scalar() or 0)
+
+
+def get_technician_reviews(db: Session, technician_id: int) -> List[models.Review]:
+    return db.execute(technician_reviews_stmt(technician_id)).scalars().all()
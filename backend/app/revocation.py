@@ -0,0 +1,132 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from .models import RefreshToken, User
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre un bytearray (sin falsos negativos)"""
+
+    def __init__(self, num_bits: int = 1 << 20, num_hashes: int = 4):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.num_hashes).digest()
+        for i in range(self.num_hashes):
+            chunk = digest[i * 8:(i + 1) * 8]
+            yield int.from_bytes(chunk, "little") % self.num_bits
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class TokenRevocationList:
+    """
+    Versiones mínimas válidas de token por usuario.
+    El filtro de Bloom descarta en O(1) a los usuarios que nunca revocaron tokens;
+    el diccionario exacto solo guarda a los que sí lo hicieron (token_version > 0).
+    Además, las sesiones cerradas con logout (claim "sid"), mientras sus access
+    tokens puedan seguir vigentes.
+    """
+
+    def __init__(self, num_bits: int = 1 << 20, num_hashes: int = 4, sync_seconds: float = 30.0,
+                 session_ttl_seconds: float = 1800.0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.sync_seconds = sync_seconds
+        self.session_ttl_seconds = session_ttl_seconds
+        self._bloom = BloomFilter(num_bits, num_hashes)
+        self._versions: Dict[str, int] = {}
+        # Sesión revocada -> momento (monotónico) a partir del cual ya no hace falta recordarla
+        self._sessions: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_sync: Optional[float] = None
+        self._synced_until: Optional[datetime] = None
+        self.checks = 0
+        self.bloom_negatives = 0
+        self.revoked = 0
+        self.syncs = 0
+
+    def record(self, email: str, token_version: int):
+        """Registrar la versión vigente de un usuario (nunca retrocede)"""
+        if not token_version:
+            return
+        with self._lock:
+            if token_version > self._versions.get(email, 0):
+                self._versions[email] = token_version
+                self._bloom.add(email)
+
+    def revoke_session(self, session_id: str):
+        """Registrar una sesión cerrada: sus access tokens dejan de valer"""
+        with self._lock:
+            self._sessions[session_id] = time.monotonic() + self.session_ttl_seconds
+
+    def is_revoked(self, email: str, token_version: int, session_id: Optional[str] = None) -> bool:
+        self.checks += 1
+        if session_id is not None and session_id in self._sessions:
+            self.revoked += 1
+            return True
+        if email not in self._bloom:
+            self.bloom_negatives += 1
+            return False
+        current = self._versions.get(email, 0)
+        if token_version < current:
+            self.revoked += 1
+            return True
+        return False
+
+    def needs_sync(self) -> bool:
+        return self._last_sync is None or time.monotonic() - self._last_sync >= self.sync_seconds
+
+    def sync(self, db: Session):
+        """Sincronizar con la tabla users (completo la primera vez, incremental después)"""
+        started_at = datetime.utcnow()
+        stmt = select(User.email, User.token_version).where(User.token_version > 0)
+        if self._synced_until is not None:
+            # Margen para cubrir relojes y transacciones en vuelo de otros workers
+            stmt = stmt.where(User.updated_at >= self._synced_until - timedelta(seconds=self.sync_seconds))
+
+        for email, token_version in db.execute(stmt):
+            self.record(email, token_version)
+
+        # Logouts (revocados sin reemplazo) de otros workers, mientras sus access tokens sigan vigentes
+        since = started_at - timedelta(seconds=self.session_ttl_seconds)
+        if self._synced_until is not None:
+            since = max(since, self._synced_until - timedelta(seconds=self.sync_seconds))
+        for (session_id,) in db.execute(
+            select(RefreshToken.session_id).where(
+                RefreshToken.revoked_at >= since,
+                RefreshToken.replaced_by_id.is_(None),
+                RefreshToken.session_id.is_not(None)
+            )
+        ):
+            self.revoke_session(session_id)
+
+        with self._lock:
+            now = time.monotonic()
+            self._sessions = {sid: until for sid, until in self._sessions.items() if until > now}
+            self._synced_until = started_at
+            self._last_sync = time.monotonic()
+            self.syncs += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked_users": len(self._versions),
+                "revoked_sessions": len(self._sessions),
+                "bloom_bytes": len(self._bloom.bits),
+                "checks": self.checks,
+                "bloom_negatives": self.bloom_negatives,
+                "revoked": self.revoked,
+                "syncs": self.syncs,
+            }
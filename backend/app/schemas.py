@@ -39,6 +39,11 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class UserUpdateResponse(UserResponse):
+    # Solo si el cambio revocó los tokens anteriores (cambio de rol)
+    access_token: Optional[str] = None
+    token_type: Optional[str] = None
+
 class UserSummary(BaseModel):
     id: int
     email: EmailStr
@@ -57,9 +62,17 @@ class UserSummary(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+    id: Optional[int] = None
+    role: Optional[str] = None
+    token_version: int = 0
+    session_id: Optional[str] = None
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -129,6 +142,18 @@ class ReviewResponse(BaseModel):
 class FriendRequestCreate(BaseModel):
     receiver_email: str
 
+class BulkFriendRequestCreate(BaseModel):
+    emails: List[str] = Field(..., min_length=1, max_length=1000)
+
+class BulkFriendRequestResult(BaseModel):
+    email: str
+    status: str  # sent, not_found, already_friends, pending, self o duplicate
+    receiver_id: Optional[int] = None
+
+class BulkFriendRequestResponse(BaseModel):
+    sent: int
+    results: List[BulkFriendRequestResult]
+
 class FriendRequestResponse(BaseModel):
     id: int
     sender_id: int
@@ -149,6 +174,8 @@ class NetworkNode(BaseModel):
     is_friend: bool
     is_technician: bool
     distance: int  # Distancia en la red (0 = tú, 1 = amigo directo, 2 = amigo de amigo)
+    rating: Optional[float] = 0.0
+    total_reviews: Optional[int] = 0
 
 class NetworkConnection(BaseModel):
     source: int
@@ -159,6 +186,24 @@ class TrustNetworkResponse(BaseModel):
     nodes: List[NetworkNode]
     connections: List[NetworkConnection]
     center_user_id: int
+    truncated: bool = False  # True si se alcanzó el límite de nodos o conexiones
+
+class FriendSuggestionResponse(BaseModel):
+    user: UserSummary = Field(validation_alias="suggested_user")
+    mutual_friends: int
+    
+    class Config:
+        from_attributes = True
+
+class ConnectionPath(BaseModel):
+    users: List[UserSummary]  # Del usuario actual al destino
+    relations: List[str]  # Entre users[i] y users[i + 1]: 'friendship' o 'hired'
+
+class ConnectionPathsResponse(BaseModel):
+    source_user_id: int
+    target_user_id: int
+    distance: Optional[int] = None  # None si no hay camino dentro de max_depth
+    paths: List[ConnectionPath]
 
 # Recommendation Schemas
 class RecommendationResponse(BaseModel):
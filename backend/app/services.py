@@ -1,8 +1,17 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from typing import List, Tuple
-from . import models, schemas
-from collections import defaultdict, deque
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, case, distinct, func, insert, select
+from typing import Dict, List, Tuple
+from . import models, schemas, repository, recommendation_store
+from .database import pin_primary
+from .trust_graph import record_graph_change, trust_graph
+from .friend_suggestions import queue_refresh
+from .recommendation_cache import recommendation_cache
+from collections import defaultdict
+from operator import itemgetter
+import base64
+import binascii
+import heapq
 
 class FriendshipService:
     """Servicio para gestionar amistades y red de confianza"""
@@ -10,7 +19,7 @@ class FriendshipService:
     @staticmethod
     def send_friend_request(db: Session, sender_id: int, receiver_email: str):
         """Enviar solicitud de amistad"""
-        receiver = db.query(models.User).filter(models.User.email == receiver_email).first()
+        receiver = repository.get_user_by_email(db, receiver_email)
         if not receiver:
             return None
         
@@ -39,9 +48,94 @@ class FriendshipService:
         db.refresh(friend_request)
         return friend_request
     
+    @staticmethod
+    def send_friend_requests_bulk(db: Session, sender_id: int, emails: List[str]) -> List[schemas.BulkFriendRequestResult]:
+        """
+        Enviar solicitudes a una lista de emails (importación de contactos).
+        Consultas fijas sin importar el tamaño de la lista: usuarios por email,
+        amistades existentes, solicitudes pendientes y un INSERT executemany.
+        """
+        # Lo que se lee decide qué se inserta: una réplica atrasada duplicaría solicitudes
+        pin_primary(db)
+        # Mayúsculas y espacios no cuentan: la primera aparición de cada email es la que se envía
+        entries = []
+        unique_emails = []
+        seen = set()
+        for email in emails:
+            email = email.strip()
+            key = email.lower()
+            entries.append((email, key, key in seen))
+            if key not in seen:
+                seen.add(key)
+                unique_emails.append(key)
+        
+        # Los emails guardados no están normalizados: se compara en minúsculas (ix_users_email_lower);
+        # si dos cuentas difieren solo en mayúsculas, gana la más antigua
+        users_by_email = {}
+        if unique_emails:
+            for user_id, email in db.execute(
+                select(models.User.id, models.User.email)
+                .where(func.lower(models.User.email).in_(unique_emails))
+                .order_by(models.User.id)
+            ):
+                users_by_email.setdefault(email.lower(), user_id)
+        receiver_ids = [user_id for user_id in users_by_email.values() if user_id != sender_id]
+        
+        friend_ids = set()
+        pending_ids = set()
+        if receiver_ids:
+            friend_ids = set(db.execute(
+                select(models.friendship.c.friend_id).where(
+                    models.friendship.c.user_id == sender_id,
+                    models.friendship.c.friend_id.in_(receiver_ids),
+                    models.friendship.c.status == "accepted"
+                )
+            ).scalars())
+            # Pendientes en cualquier dirección: si el otro ya la envió, basta con aceptarla
+            for request_sender, request_receiver in db.execute(
+                select(models.FriendRequest.sender_id, models.FriendRequest.receiver_id).where(
+                    models.FriendRequest.status == "pending",
+                    or_(
+                        and_(models.FriendRequest.sender_id == sender_id,
+                             models.FriendRequest.receiver_id.in_(receiver_ids)),
+                        and_(models.FriendRequest.receiver_id == sender_id,
+                             models.FriendRequest.sender_id.in_(receiver_ids))
+                    )
+                )
+            ):
+                pending_ids.add(request_receiver if request_sender == sender_id else request_sender)
+        
+        # Resultados en el orden de entrada, con los duplicados en su posición
+        results = []
+        new_requests = []
+        for email, key, duplicate in entries:
+            if duplicate:
+                results.append(schemas.BulkFriendRequestResult(email=email, status="duplicate"))
+                continue
+            receiver_id = users_by_email.get(key)
+            if receiver_id is None:
+                status = "not_found"
+            elif receiver_id == sender_id:
+                status = "self"
+            elif receiver_id in friend_ids:
+                status = "already_friends"
+            elif receiver_id in pending_ids:
+                status = "pending"
+            else:
+                status = "sent"
+                new_requests.append({"sender_id": sender_id, "receiver_id": receiver_id, "status": "pending"})
+            results.append(schemas.BulkFriendRequestResult(email=email, status=status, receiver_id=receiver_id))
+        
+        if new_requests:
+            db.execute(insert(models.FriendRequest), new_requests)
+            db.commit()
+        
+        return results
+    
     @staticmethod
     def accept_friend_request(db: Session, request_id: int, receiver_id: int):
         """Aceptar solicitud de amistad"""
+        pin_primary(db)
         # Buscar la solicitud
         friend_request = db.query(models.FriendRequest).filter(
             models.FriendRequest.id == request_id,
@@ -54,132 +148,248 @@ class FriendshipService:
         
         # Actualizar el estado de la solicitud
         friend_request.status = "accepted"
+        FriendshipService.add_friendship(db, friend_request.sender_id, friend_request.receiver_id)
         
-        # Verificar si ya existe para evitar duplicados
-        existing_friendship = db.query(models.friendship).filter(
-            or_(
-                and_(
-                    models.friendship.c.user_id == friend_request.sender_id,
-                    models.friendship.c.friend_id == friend_request.receiver_id
-                ),
-                and_(
-                    models.friendship.c.user_id == friend_request.receiver_id,
-                    models.friendship.c.friend_id == friend_request.sender_id
-                )
-            )
-        ).first()
+        db.commit()
         
-        if not existing_friendship:
-            # Insertar en la tabla friendship
-            stmt = models.friendship.insert().values(
-                user_id=friend_request.sender_id,
-                friend_id=friend_request.receiver_id,
-                status="accepted"
-            )
-            db.execute(stmt)
-        else:
-            # Si ya existe, actualizar su estado a accepted
-            stmt = (
+        return True
+    
+    @staticmethod
+    def add_friendship(db: Session, user_id: int, friend_id: int):
+        """
+        Guardar la amistad en ambas direcciones, (a, b) y (b, a).
+        Así cada consulta por usuario es un rango sobre user_id en un solo índice.
+        """
+        for source, target in ((user_id, friend_id), (friend_id, user_id)):
+            result = db.execute(
                 models.friendship.update()
-                .where(models.friendship.c.id == existing_friendship.id)
+                .where(
+                    models.friendship.c.user_id == source,
+                    models.friendship.c.friend_id == target
+                )
                 .values(status="accepted")
             )
-            db.execute(stmt)
-        
-        db.commit()
-        
+            if result.rowcount == 0:
+                db.execute(models.friendship.insert().values(
+                    user_id=source,
+                    friend_id=target,
+                    status="accepted"
+                ))
+        record_graph_change(db, "add", user_id, friend_id)
+        queue_refresh(db, (user_id, friend_id))
+        recommendation_store.queue_refresh(db, (user_id, friend_id))
+    
+    @staticmethod
+    def remove_friendship(db: Session, user_id: int, friend_id: int) -> bool:
+        """Eliminar la amistad en ambas direcciones"""
+        result = db.execute(
+            models.friendship.delete().where(
+                or_(
+                    and_(models.friendship.c.user_id == user_id, models.friendship.c.friend_id == friend_id),
+                    and_(models.friendship.c.user_id == friend_id, models.friendship.c.friend_id == user_id)
+                )
+            )
+        )
+        if result.rowcount == 0:
+            return False
+        record_graph_change(db, "remove", user_id, friend_id)
+        queue_refresh(db, (user_id, friend_id))
+        recommendation_store.queue_refresh(db, (user_id, friend_id))
         return True
     
     @staticmethod
     def are_friends(db: Session, user_id: int, friend_id: int):
-        """Verificar si dos usuarios son amigos"""
-        friendship = db.query(models.friendship).filter(
-            or_(
-                and_(
-                    models.friendship.c.user_id == user_id,
-                    models.friendship.c.friend_id == friend_id,
-                    models.friendship.c.status == "accepted"
-                ),
-                and_(
-                    models.friendship.c.user_id == friend_id,
-                    models.friendship.c.friend_id == user_id,
-                    models.friendship.c.status == "accepted"
-                )
+        """Verificar si dos usuarios son amigos (búsqueda puntual en el índice único)"""
+        friendship = db.execute(
+            select(models.friendship.c.id).where(
+                models.friendship.c.user_id == user_id,
+                models.friendship.c.friend_id == friend_id,
+                models.friendship.c.status == "accepted"
             )
         ).first()
         
         return friendship is not None
     
     @staticmethod
-    def get_friends(db: Session, user_id: int):
-        """Obtener lista de amigos aceptados"""
-        # Buscar en la tabla friendship
-        friendships = db.query(models.friendship).filter(
-            or_(
-                models.friendship.c.user_id == user_id,
-                models.friendship.c.friend_id == user_id
-            ),
+    def friends_query(user_id: int, limit: int = None, after_id: int = None):
+        """Amigos aceptados ordenados por id; after_id/limit permiten paginar por cursor"""
+        query = select(models.User).join(
+            models.friendship, models.friendship.c.friend_id == models.User.id
+        ).where(
+            models.friendship.c.user_id == user_id,
             models.friendship.c.status == "accepted"
-        ).all()
-        
-        friends = []
-        for friendship in friendships:
-            # Determinar quién es el amigo (el que no es el usuario actual)
-            friend_id = friendship.friend_id if friendship.user_id == user_id else friendship.user_id
-            
-            # Obtener datos del amigo
-            friend = db.query(models.User).filter(models.User.id == friend_id).first()
-            
-            if friend:
-                friends.append(friend)
+        ).order_by(models.friendship.c.friend_id)
         
-        return friends
+        if after_id is not None:
+            query = query.where(models.friendship.c.friend_id > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
     
     @staticmethod
-    def get_network_graph(db: Session, user_id: int, max_depth: int = 2):
-        """Obtener grafo de red de confianza usando BFS"""
-        nodes = []
-        connections = []
-        visited = set()
-        queue = deque([(user_id, 0)])  # (user_id, depth)
+    def get_friends(db: Session, user_id: int, limit: int = None, after_id: int = None):
+        """Obtener lista de amigos aceptados (una consulta)"""
+        return db.execute(FriendshipService.friends_query(user_id, limit, after_id)).scalars().all()
+    
+    @staticmethod
+    def get_friends_in_friendship_order(db: Session, user_id: int, limit: int = None):
+        """
+        Amigos aceptados en el orden en que se crearon las amistades: por la primera
+        fila del par (a, b) / (b, a), como cuando cada amistad se guardaba una sola vez.
+        """
+        reverse = models.friendship.alias("reverse")
+        reverse_id = select(reverse.c.id).where(
+            reverse.c.user_id == models.friendship.c.friend_id,
+            reverse.c.friend_id == models.friendship.c.user_id
+        ).scalar_subquery()
+        first_row_id = case((reverse_id < models.friendship.c.id, reverse_id), else_=models.friendship.c.id)
+        
+        query = select(models.User).join(
+            models.friendship, models.friendship.c.friend_id == models.User.id
+        ).where(
+            models.friendship.c.user_id == user_id,
+            models.friendship.c.status == "accepted"
+        ).order_by(first_row_id, models.friendship.c.friend_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return db.execute(query).scalars().all()
+    
+    @staticmethod
+    def get_network_friends(db: Session, user_id: int, limit: int = None):
+        """
+        Amigos para el grafo de red, en el orden de las amistades: recorridos en el
+        grafo en memoria si ya está construido (y cargados en una consulta), si no
+        con get_friends_in_friendship_order.
+        """
+        if not trust_graph.is_built:
+            return FriendshipService.get_friends_in_friendship_order(db, user_id, limit)
+        
+        reached = trust_graph.bfs(user_id, 1, max_nodes=limit + 1 if limit is not None else None)
+        friend_ids = [friend_id for friend_id, depth in reached.items() if depth == 1]
+        if not friend_ids:
+            return []
+        users_by_id = {
+            user.id: user
+            for user in db.execute(select(models.User).where(models.User.id.in_(friend_ids))).scalars()
+        }
+        return [users_by_id[friend_id] for friend_id in friend_ids if friend_id in users_by_id]
+    
+    @staticmethod
+    async def get_friends_async(db: AsyncSession, user_id: int, limit: int = None, after_id: int = None):
+        """Obtener lista de amigos aceptados (sesión asíncrona, una consulta)"""
+        result = await db.execute(FriendshipService.friends_query(user_id, limit, after_id))
+        return result.scalars().all()
+    
+    @staticmethod
+    def get_friend_ids(db: Session, user_id: int) -> List[int]:
+        """Ids de los amigos aceptados, resueltos solo con el índice"""
+        return db.execute(
+            select(models.friendship.c.friend_id).where(
+                models.friendship.c.user_id == user_id,
+                models.friendship.c.status == "accepted"
+            )
+        ).scalars().all()
+    
+    @staticmethod
+    def count_friends(db: Session, user_id: int) -> int:
+        return db.execute(
+            select(func.count()).select_from(models.friendship).where(
+                models.friendship.c.user_id == user_id,
+                models.friendship.c.status == "accepted"
+            )
+        ).scalar() or 0
+    
+    @staticmethod
+    def get_friend_ids_batch(db: Session, user_ids: List[int]) -> Dict[int, List[int]]:
+        """Amigos de varios usuarios: del grafo en memoria si ya está construido, si no en una consulta"""
+        if trust_graph.is_built:
+            return {user_id: trust_graph.neighbors(user_id) for user_id in user_ids}
+        
+        adjacency = {user_id: [] for user_id in user_ids}
+        if not user_ids:
+            return adjacency
+        rows = db.execute(
+            select(models.friendship.c.user_id, models.friendship.c.friend_id).where(
+                models.friendship.c.user_id.in_(user_ids),
+                models.friendship.c.status == "accepted"
+            ).order_by(models.friendship.c.user_id, models.friendship.c.friend_id)
+        )
+        for user_id, friend_id in rows:
+            adjacency[user_id].append(friend_id)
+        return adjacency
+    
+    @staticmethod
+    def get_mutual_friends(db: Session, user_id: int, other_id: int):
+        """Amigos en común: del grafo en memoria si ya está construido, si no en una consulta"""
+        if trust_graph.is_built:
+            mutual_ids = trust_graph.mutual_friends(user_id, other_id)
+        else:
+            adjacency = FriendshipService.get_friend_ids_batch(db, [user_id, other_id])
+            mine = set(adjacency[user_id])
+            mutual_ids = [friend_id for friend_id in adjacency[other_id] if friend_id in mine]
+        if not mutual_ids:
+            return []
+        users = db.query(models.User).filter(models.User.id.in_(mutual_ids)).all()
+        return sorted(users, key=lambda user: user.id)
+    
+    @staticmethod
+    def get_suggestions(db: Session, user_id: int, limit: int = 20):
+        """
+        Sugerencias precalculadas. Se vuelven a filtrar amistades y solicitudes
+        pendientes creadas después del último cálculo.
+        """
+        suggestion = models.FriendSuggestion
+        already_friends = select(models.friendship.c.id).where(
+            models.friendship.c.user_id == user_id,
+            models.friendship.c.friend_id == suggestion.suggested_user_id
+        ).exists()
+        pending_request = select(models.FriendRequest.id).where(
+            models.FriendRequest.status == "pending",
+            or_(
+                and_(models.FriendRequest.sender_id == user_id,
+                     models.FriendRequest.receiver_id == suggestion.suggested_user_id),
+                and_(models.FriendRequest.sender_id == suggestion.suggested_user_id,
+                     models.FriendRequest.receiver_id == user_id)
+            )
+        ).exists()
+        
+        return db.execute(
+            select(suggestion)
+            .options(selectinload(suggestion.suggested_user))
+            .where(suggestion.user_id == user_id, ~already_friends, ~pending_request)
+            .order_by(suggestion.mutual_friends.desc(), suggestion.suggested_user_id)
+            .limit(limit)
+        ).scalars().all()
+    
+    @staticmethod
+    def get_connection_paths(db: Session, user_id: int, target_id: int,
+                             max_depth: int = 4, max_paths: int = 3) -> schemas.ConnectionPathsResponse:
+        """Cómo está conectado el usuario con otro: caminos más cortos por amistades y servicios completados"""
+        trust_graph.ensure_built(db)
+        paths = trust_graph.connection_paths(user_id, target_id, max_depth, max_paths)
+        
+        path_user_ids = {node for path, _ in paths for node in path}
+        users_by_id = {}
+        if path_user_ids:
+            users_by_id = {
+                user.id: user
+                for user in db.query(models.User).filter(models.User.id.in_(path_user_ids)).all()
+            }
         
-        while queue:
-            current_id, depth = queue.popleft()
-            
-            if current_id in visited or depth > max_depth:
-                continue
-            
-            visited.add(current_id)
-            
-            user = db.query(models.User).filter(models.User.id == current_id).first()
-            if not user:
+        result = []
+        for path, relations in paths:
+            if not all(node in users_by_id for node in path):
                 continue
-            
-            # Agregar nodo
-            nodes.append(schemas.NetworkNode(
-                id=user.id,
-                username=user.username,
-                full_name=user.full_name,
-                role=user.role,
-                is_friend=depth == 1,
-                is_technician=user.role == "technician",
-                distance=depth
+            result.append(schemas.ConnectionPath(
+                users=[schemas.UserSummary.model_validate(users_by_id[node]) for node in path],
+                relations=relations
             ))
-            
-            # Agregar conexiones de amistad
-            for friend in user.friends:
-                if friend.id not in visited or depth + 1 <= max_depth:
-                    connections.append(schemas.NetworkConnection(
-                        source=current_id,
-                        target=friend.id,
-                        type="friendship"
-                    ))
-                    queue.append((friend.id, depth + 1))
-        
-        return schemas.TrustNetworkResponse(
-            nodes=nodes,
-            connections=connections,
-            center_user_id=user_id
+        
+        return schemas.ConnectionPathsResponse(
+            source_user_id=user_id,
+            target_user_id=target_id,
+            distance=len(paths[0][0]) - 1 if paths else None,
+            paths=result
         )
 
 
@@ -187,83 +397,238 @@ class RecommendationService:
     """Servicio para generar recomendaciones basadas en la red de confianza"""
     
     @staticmethod
-    def get_recommended_technicians(db: Session, user_id: int, category: str = None) -> List[schemas.RecommendationResponse]:
-        """Obtener técnicos recomendados basados en la red de confianza"""
-        recommendations = []
-        
-        # Obtener amigos
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
-            return []
-        
-        friend_ids = [friend.id for friend in user.friends]
-        
-        # Obtener servicios completados por amigos con buenas calificaciones
-        services_query = db.query(models.Service).filter(
-            and_(
+    def get_friend_recommended_technicians(db: Session, user_id: int, friend_ids: List[int],
+                                           limit: int = None) -> Dict[int, List[models.User]]:
+        """
+        Técnicos que cada amigo contrató (servicio completado) y calificó con 4 o más.
+        Una consulta: servicios -> review del mismo cliente (EXISTS) -> técnico.
+        Cada par (amigo, técnico) aparece una vez aunque haya varios servicios, en
+        orden de su primer servicio, agrupados por amigo; con limit, solo los primeros pares.
+        """
+        good_review = select(models.Review.id).where(
+            models.Review.service_id == models.Service.id,
+            models.Review.client_id == models.Service.client_id,
+            models.Review.rating >= 4
+        ).exists()
+        
+        pairs = (
+            select(
+                models.Service.client_id,
+                models.Service.technician_id,
+                func.min(models.Service.id).label("first_service_id")
+            )
+            .where(
                 models.Service.client_id.in_(friend_ids),
-                models.Service.status == "completed"
+                models.Service.status == "completed",
+                models.Service.technician_id != user_id,
+                good_review
             )
+            .group_by(models.Service.client_id, models.Service.technician_id)
+            .subquery()
         )
+        rows = db.execute(
+            select(pairs.c.client_id, models.User)
+            .join(models.User, models.User.id == pairs.c.technician_id)
+            .order_by(pairs.c.client_id, pairs.c.first_service_id)
+            .limit(limit)
+        ).all()
         
+        by_friend = defaultdict(list)
+        for friend_id, technician in rows:
+            by_friend[friend_id].append(technician)
+        return by_friend
+    
+    @staticmethod
+    def score_technicians(db: Session, user_id: int, category: str = None, by_category: bool = False) -> list:
+        """
+        Agregado por técnico de las reviews >= 4 en servicios completados de los amigos:
+        (technician_id, suma, cantidad, amigos distintos, menor id de amigo).
+        Con by_category se agrupa además por categoría, que va como primera columna.
+        Una sola consulta; los amigos se resuelven como subconsulta.
+        """
+        friend_ids = select(models.friendship.c.friend_id).where(
+            models.friendship.c.user_id == user_id,
+            models.friendship.c.status == "accepted"
+        )
+        group_by = [models.Service.technician_id]
+        if by_category:
+            group_by.insert(0, models.Service.category)
+        stmt = (
+            select(
+                *group_by,
+                func.sum(models.Review.rating),
+                func.count(models.Review.id),
+                func.count(distinct(models.Service.client_id)),
+                func.min(models.Service.client_id)
+            )
+            .join(models.Review, models.Review.service_id == models.Service.id)
+            .where(
+                models.Service.client_id.in_(friend_ids),
+                models.Service.status == "completed",
+                models.Review.rating >= 4.0
+            )
+            .group_by(*group_by)
+        )
         if category:
-            services_query = services_query.filter(models.Service.category == category)
-        
-        services = services_query.all()
-        
-        # Agrupar por técnico y calcular score
-        technician_scores = defaultdict(lambda: {"reviews": [], "friends": set()})
-        
-        for service in services:
-            # Iterar sobre las reviews del servicio (aunque usualmente es una)
-            for review in service.reviews:
-                if review.rating >= 4.0:
-                    tech_id = service.technician_id
-                    technician_scores[tech_id]["reviews"].append(review.rating)
-                    technician_scores[tech_id]["friends"].add(service.client_id)
-        
-        # Crear recomendaciones
-        for tech_id, data in technician_scores.items():
-            technician = db.query(models.User).filter(models.User.id == tech_id).first()
+            stmt = stmt.where(models.Service.category == category)
+        return db.execute(stmt).all()
+    
+    @staticmethod
+    def compute_score(rating_sum: float, rating_count: int, num_friends: int) -> Tuple[float, float]:
+        """(promedio de las reviews, score)"""
+        avg_rating = rating_sum / rating_count
+        return avg_rating, avg_rating * (1 + num_friends * 0.1)  # Más amigos = mayor score
+    
+    @staticmethod
+    def select_top(scored: list, limit: int = None, after: Tuple[float, int] = None) -> list:
+        """
+        Filas de score_technicians en orden (score desc, técnico asc), a partir del
+        cursor after = (score, técnico). Con limit se eligen con un heap de tamaño
+        limit, sin ordenar ni construir nada para el resto de los candidatos.
+        """
+        def keyed():
+            for row in scored:
+                tech_id, rating_sum, rating_count, num_friends, _ = row[-5:]
+                key = (-RecommendationService.compute_score(rating_sum, rating_count, num_friends)[1], tech_id)
+                if after is None or key > (-after[0], after[1]):
+                    yield key, row
+        
+        if limit is None:
+            selected = sorted(keyed(), key=itemgetter(0))
+        else:
+            selected = heapq.nsmallest(limit, keyed(), key=itemgetter(0))
+        return [row for _, row in selected]
+    
+    @staticmethod
+    def load_ranking_users(db: Session, scored: list) -> Dict[int, models.User]:
+        """Técnicos y, si lo recomienda un solo amigo, ese amigo (para el nombre): una consulta para todos"""
+        user_ids = {row[-5] for row in scored} | {row[-1] for row in scored if row[-2] == 1}
+        if not user_ids:
+            return {}
+        return {
+            user.id: user
+            for user in db.execute(select(models.User).where(models.User.id.in_(user_ids))).scalars()
+        }
+    
+    @staticmethod
+    def rank_technicians(selected: list, users: Dict[int, models.User]) -> list:
+        """(técnico, score, razón, amigos en común, id del amigo que lo recomienda) en el orden de select_top"""
+        ranked = []
+        for tech_id, rating_sum, rating_count, num_friends, first_friend_id in (row[-5:] for row in selected):
+            technician = users.get(tech_id)
             if not technician:
                 continue
             
-            avg_rating = sum(data["reviews"]) / len(data["reviews"])
-            num_friends = len(data["friends"])
-            score = avg_rating * (1 + num_friends * 0.1)  # Más amigos = mayor score
+            avg_rating, score = RecommendationService.compute_score(rating_sum, rating_count, num_friends)
             
             # Crear mensaje de razón
-            friend_names = []
-            for friend_id in list(data["friends"])[:3]:
-                friend = db.query(models.User).filter(models.User.id == friend_id).first()
-                if friend:
-                    friend_names.append(friend.full_name or friend.username)
-            
-            if len(friend_names) == 1:
-                reason = f"Tu amigo {friend_names[0]} lo contrató y lo calificó con {avg_rating:.1f} estrellas"
+            friend = users.get(first_friend_id) if num_friends == 1 else None
+            if friend:
+                reason = f"Tu amigo {friend.full_name or friend.username} lo contrató y lo calificó con {avg_rating:.1f} estrellas"
             else:
                 reason = f"{num_friends} de tus amigos lo contrataron y lo calificaron con {avg_rating:.1f} estrellas en promedio"
             
-            recommendations.append(schemas.RecommendationResponse(
-                technician=schemas.UserSummary(
-                    id=technician.id,
-                    email=technician.email,
-                    username=technician.username,
-                    full_name=technician.full_name,
-                    role=technician.role,
+            ranked.append((technician, score, reason, num_friends, first_friend_id))
+        return ranked
+    
+    @staticmethod
+    def to_response(technician: models.User, score: float, reason: str, common_friends: int) -> schemas.RecommendationResponse:
+        return schemas.RecommendationResponse(
+            technician=schemas.UserSummary(
+                id=technician.id,
+                email=technician.email,
+                username=technician.username,
+                full_name=technician.full_name,
+                role=technician.role,
 
-                    rating=technician.rating,
-                    total_reviews=technician.total_reviews
-                ),
-                score=score,
-                reason=reason,
-                common_friends=num_friends
-            ))
-        
-        # Ordenar por score descendente
-        recommendations.sort(key=lambda x: x.score, reverse=True)
-        
+                rating=technician.rating,
+                total_reviews=technician.total_reviews
+            ),
+            score=score,
+            reason=reason,
+            common_friends=common_friends
+        )
+    
+    @staticmethod
+    def encode_cursor(score: float, technician_id: int) -> str:
+        """Cursor opaco con la posición (score, técnico) del último elemento entregado"""
+        return base64.urlsafe_b64encode(f"{score!r}:{technician_id}".encode()).decode().rstrip("=")
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[float, int]:
+        """Posición de un cursor de encode_cursor; ValueError si no es válido"""
+        try:
+            score, technician_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+            return float(score), int(technician_id)
+        except (binascii.Error, UnicodeDecodeError) as e:
+            raise ValueError("Cursor inválido") from e
+    
+    @staticmethod
+    def get_recommended_technicians(db: Session, user_id: int, category: str = None,
+                                    limit: int = None, after: Tuple[float, int] = None) -> List[schemas.RecommendationResponse]:
+        """Obtener técnicos recomendados basados en la red de confianza (cálculo en vivo)"""
+        scored = RecommendationService.score_technicians(db, user_id, category)
+        selected = RecommendationService.select_top(scored, limit, after)
+        if not selected:
+            return []
+        users = RecommendationService.load_ranking_users(db, selected)
+        return [
+            RecommendationService.to_response(technician, score, reason, num_friends)
+            for technician, score, reason, num_friends, _ in RecommendationService.rank_technicians(selected, users)
+        ]
+    
+    @staticmethod
+    def get_recommendations(db: Session, user_id: int, category: str = None,
+                            limit: int = None, after: Tuple[float, int] = None) -> List[schemas.RecommendationResponse]:
+        """
+        Recomendaciones desde la tabla materializada si está al día (dentro de
+        recommendations_max_staleness_seconds desde el primer cambio); si no, en vivo.
+        La tabla solo guarda el top-N: las páginas que pasan de ahí se calculan en vivo.
+        El resultado queda en recommendation_cache mientras no cambie la versión del
+        usuario en recommendation_state (la fila se crea en la primera consulta si
+        nunca se materializó); los técnicos se leen siempre de la BD.
+        """
+        version = recommendation_cache.version(recommendation_store.ensure_state(db, user_id))
+        key = (category, limit, after)
+        if version is not None:
+            cached = recommendation_cache.get(user_id, version, key)
+            if cached is not None:
+                return RecommendationService.from_cached(db, cached)
+        
+        rows = recommendation_store.load(db, user_id, category, limit, after)
+        if rows is None:
+            recommendations = RecommendationService.get_recommended_technicians(db, user_id, category, limit, after)
+        else:
+            recommendations = [
+                RecommendationService.to_response(technician, recommendation.score, recommendation.reason, recommendation.common_friends)
+                for recommendation, technician in rows
+            ]
+            # Filas de antes de un cambio pendiente: se sirven (dentro de la tolerancia) pero
+            # no se cachean con la versión nueva, que ya refleja ese cambio
+            if recommendation_store.is_pending(db, user_id):
+                return recommendations
+        if version is not None:
+            recommendation_cache.set(user_id, version, key, [
+                (item.technician.id, item.score, item.reason, item.common_friends) for item in recommendations
+            ])
         return recommendations
+    
+    @staticmethod
+    def from_cached(db: Session, cached: list) -> List[schemas.RecommendationResponse]:
+        """Respuestas de un resultado cacheado con el rating y el perfil actuales de los técnicos (una consulta)"""
+        if not cached:
+            return []
+        technicians = {
+            user.id: user
+            for user in db.execute(
+                select(models.User).where(models.User.id.in_([row[0] for row in cached]))
+            ).scalars()
+        }
+        return [
+            RecommendationService.to_response(technicians[technician_id], score, reason, common_friends)
+            for technician_id, score, reason, common_friends in cached
+            if technician_id in technicians
+        ]
 
 
 class ReviewService:
@@ -272,6 +637,8 @@ class ReviewService:
     @staticmethod
     def create_review(db: Session, review_data: schemas.ReviewCreate, client_id: int):
         """Crear una review y actualizar estadísticas del técnico"""
+        # El rating nuevo se calcula sobre el leído: siempre del primario
+        pin_primary(db)
         # Verificar que el servicio existe y pertenece al cliente
         service = db.query(models.Service).filter(
             and_(
@@ -311,6 +678,9 @@ class ReviewService:
         technician.rating = round(new_rating, 2)
         technician.total_reviews = total_reviews
         
+        # Cambian las recomendaciones de los amigos de quien calificó (y su versión en el cache)
+        recommendation_store.queue_friends_of(db, client_id)
+        
         db.commit()
         db.refresh(review)
         
@@ -334,18 +704,7 @@ class MessagingService:
             pass
 
         # Buscar conversación existente
-        conversation = db.query(models.Conversation).filter(
-            or_(
-                and_(
-                    models.Conversation.client_id == client_id,
-                    models.Conversation.technician_id == technician_id
-                ),
-                and_(
-                    models.Conversation.client_id == technician_id,
-                    models.Conversation.technician_id == client_id
-                )
-            )
-        ).first()
+        conversation = repository.get_conversation_between(db, client_id, technician_id)
         
         if conversation:
             return conversation
@@ -365,6 +724,7 @@ class MessagingService:
     @staticmethod
     def send_message(db: Session, conversation_id: int, sender_id: int, content: str, is_ai_generated: bool = False):
         """Enviar un mensaje en una conversación"""
+        pin_primary(db)
         # Verificar que la conversación existe
         conversation = db.query(models.Conversation).filter(
             models.Conversation.id == conversation_id
@@ -417,7 +777,7 @@ class MessagingService:
         for conv in conversations:
             # Determinar el otro usuario
             other_user_id = conv.technician_id if conv.client_id == user_id else conv.client_id
-            other_user = db.query(models.User).filter(models.User.id == other_user_id).first()
+            other_user = repository.get_user(db, other_user_id)
             
             # Determinar mensajes no leídos
             unread_count = conv.unread_client if user_id == conv.client_id else conv.unread_technician
@@ -436,6 +796,46 @@ class MessagingService:
         
         return result
     
+    @staticmethod
+    async def get_user_conversations_async(db: AsyncSession, user_id: int):
+        """Obtener todas las conversaciones de un usuario (sesión asíncrona)"""
+        result = await db.execute(
+            select(models.Conversation).where(
+                or_(
+                    models.Conversation.client_id == user_id,
+                    models.Conversation.technician_id == user_id
+                ),
+                models.Conversation.is_active == True
+            ).order_by(models.Conversation.last_message_at.desc())
+        )
+        conversations = result.scalars().all()
+        
+        other_ids = {
+            conv.technician_id if conv.client_id == user_id else conv.client_id
+            for conv in conversations
+        }
+        users_by_id = {}
+        if other_ids:
+            users = await db.execute(select(models.User).where(models.User.id.in_(other_ids)))
+            users_by_id = {user.id: user for user in users.scalars()}
+        
+        return [
+            {
+                "id": conv.id,
+                "client_id": conv.client_id,
+                "technician_id": conv.technician_id,
+                "last_message": conv.last_message,
+                "last_message_at": conv.last_message_at,
+                "unread_count": conv.unread_client if user_id == conv.client_id else conv.unread_technician,
+                "other_user": users_by_id.get(
+                    conv.technician_id if conv.client_id == user_id else conv.client_id
+                ),
+                "is_active": conv.is_active,
+                "created_at": conv.created_at
+            }
+            for conv in conversations
+        ]
+    
     @staticmethod
     def get_conversation_messages(db: Session, conversation_id: int, user_id: int):
         """Obtener todos los mensajes de una conversación"""
@@ -503,23 +903,8 @@ class MessagingService:
     
     @staticmethod
     def get_unread_messages_count(db: Session, user_id: int) -> int:
-        """Obtener total de mensajes no leídos"""
-        conversations = db.query(models.Conversation).filter(
-            or_(
-                models.Conversation.client_id == user_id,
-                models.Conversation.technician_id == user_id
-            ),
-            models.Conversation.is_active == True
-        ).all()
-        
-        total_unread = 0
-        for conv in conversations:
-            if user_id == conv.client_id:
-                total_unread += conv.unread_client
-            else:
-                total_unread += conv.unread_technician
-        
-        return total_unread
+        """Obtener total de mensajes no leídos con una sola consulta agregada"""
+        return repository.get_unread_total(db, user_id)
     
 class ServiceRequestService:
     """Servicio para gestionar solicitudes de servicio"""
@@ -582,9 +967,37 @@ class ServiceRequestService:
             models.Service.status == "pending"
         ).order_by(models.Service.created_at.desc()).all()
 
+    @staticmethod
+    async def get_user_services_async(db: AsyncSession, user_id: int, role: str):
+        """Obtener servicios del usuario (sesión asíncrona, relaciones precargadas)"""
+        column = models.Service.client_id if role == "client" else models.Service.technician_id
+        result = await db.execute(
+            select(models.Service)
+            .where(column == user_id)
+            .options(selectinload(models.Service.client), selectinload(models.Service.technician))
+            .order_by(models.Service.created_at.desc())
+        )
+        return result.scalars().all()
+
+    @staticmethod
+    async def get_pending_requests_async(db: AsyncSession, technician_id: int):
+        """Obtener solicitudes pendientes para un técnico (sesión asíncrona)"""
+        result = await db.execute(
+            select(models.Service)
+            .where(
+                models.Service.technician_id == technician_id,
+                models.Service.status == "pending"
+            )
+            .options(selectinload(models.Service.client), selectinload(models.Service.technician))
+            .order_by(models.Service.created_at.desc())
+        )
+        return result.scalars().all()
+
     @staticmethod
     def update_service_status(db: Session, service_id: int, user_id: int, status: str, price: float = None):
         """Actualizar estado del servicio"""
+        # Los contadores del técnico se incrementan sobre lo leído: siempre del primario
+        pin_primary(db)
         service = db.query(models.Service).filter(
             models.Service.id == service_id
         ).first()
@@ -619,6 +1032,10 @@ class ServiceRequestService:
                 if old_status == "in_progress":
                     technician.jobs_active = max(0, technician.jobs_active - 1)
             
+            # Solo los servicios completados cuentan para las recomendaciones de los amigos del cliente
+            if "completed" in (old_status, status):
+                recommendation_store.queue_friends_of(db, service.client_id)
+            
         db.commit()
         db.refresh(service)
         return service
\ No newline at end of file
@@ -0,0 +1,239 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+
+
+class QueryBudgetExceeded(Exception):
+    """Un endpoint superó su presupuesto de consultas (solo en modo estricto)"""
+
+
+class RequestQueryStats:
+    """Consultas SQL ejecutadas durante un request"""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.count = 0
+        self.total_seconds = 0.0
+        self.shapes = Counter()
+
+    @property
+    def endpoint(self) -> str:
+        # La plantilla de la ruta (/api/technicians/{technician_id}/profile) agrupa mejor que el path real
+        route = self.scope.get("route")
+        path = getattr(route, "path", None) or self.scope.get("path", "")
+        return f"{self.scope.get('method', '')} {path}"
+
+    @property
+    def budget(self) -> int:
+        return settings.sql_query_budgets.get(self.endpoint, settings.sql_query_budget)
+
+    def repeated_shapes(self) -> list:
+        """Sentencias idénticas repetidas (probable N+1)"""
+        threshold = settings.sql_n_plus_one_threshold
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("sql_request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestQueryStats]:
+    return _current_stats.get()
+
+
+class SlowQueryLog:
+    """
+    Registro de consultas lentas: buffer circular en memoria + archivo rotativo.
+    El EXPLAIN se obtiene en segundo plano para no alargar el request.
+    """
+
+    def __init__(self, threshold_ms: float, buffer_size: int = 200, log_file: Optional[str] = None,
+                 redact_params: bool = True, explain: bool = True, max_pending_explains: int = 20):
+        self.threshold_ms = threshold_ms
+        self.redact_params = redact_params
+        self.explain = explain
+        self.max_pending_explains = max_pending_explains
+        self.log_file = log_file
+        self.records = deque(maxlen=buffer_size)
+        self.recorded = 0
+        self._pending_explains = 0
+        self._lock = threading.Lock()
+        self._logger = None
+        self._executor = None
+
+    def _get_logger(self) -> Optional[logging.Logger]:
+        if not self.log_file:
+            return None
+        if self._logger is None:
+            logger = logging.getLogger("app.slow_queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(self.log_file, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def _redact(self, parameters):
+        if not self.redact_params or parameters is None:
+            return parameters
+        if isinstance(parameters, dict):
+            return {key: "?" for key in parameters}
+        if isinstance(parameters, (list, tuple)):
+            return ["?" for _ in parameters]
+        return "?"
+
+    def maybe_record(self, engine, statement: str, parameters, elapsed: float, executemany: bool):
+        duration_ms = elapsed * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        stats = _current_stats.get()
+        record = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "duration_ms": round(duration_ms, 2),
+            "endpoint": stats.endpoint if stats else None,
+            "statement": statement,
+            "parameters": self._redact(parameters if not executemany else None),
+            "explain": None,
+        }
+        with self._lock:
+            self.records.append(record)
+            self.recorded += 1
+
+        is_select = statement.lstrip().upper().startswith("SELECT")
+        if self.explain and is_select and not executemany and self._reserve_explain():
+            self._get_executor().submit(self._explain, engine, record, statement, parameters)
+        else:
+            self._write(record)
+
+    def _reserve_explain(self) -> bool:
+        with self._lock:
+            if self._pending_explains >= self.max_pending_explains:
+                return False
+            self._pending_explains += 1
+            return True
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        return self._executor
+
+    def _explain(self, engine, record: dict, statement: str, parameters):
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            # Conexión DBAPI directa: no dispara los eventos de cursor (evita recursión)
+            raw = engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                cursor.execute(prefix + statement, parameters or ())
+                columns = [col[0] for col in cursor.description or []]
+                record["explain"] = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                cursor.close()
+            finally:
+                raw.close()
+        except Exception as e:
+            record["explain"] = {"error": str(e)}
+        finally:
+            with self._lock:
+                self._pending_explains -= 1
+            self._write(record)
+
+    def _write(self, record: dict):
+        logger = self._get_logger()
+        if logger is not None:
+            logger.info(json.dumps(record, default=str, ensure_ascii=False))
+
+    def snapshot(self, limit: int = 50) -> dict:
+        with self._lock:
+            records = list(self.records)[-limit:]
+        return {
+            "threshold_ms": self.threshold_ms,
+            "recorded": self.recorded,
+            "records": list(reversed(records)),
+        }
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.slow_query_threshold_ms,
+    buffer_size=settings.slow_query_buffer_size,
+    log_file=settings.slow_query_log_file,
+    redact_params=settings.slow_query_redact_params,
+    explain=settings.slow_query_explain
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.shapes[statement] += 1
+
+        if settings.sql_query_budget_strict and stats.count > stats.budget:
+            raise QueryBudgetExceeded(
+                f"{stats.endpoint} superó su presupuesto de {stats.budget} consultas"
+            )
+
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start_time")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.total_seconds += elapsed
+    slow_query_log.maybe_record(conn.engine, statement, parameters, elapsed, executemany)
+
+
+def _summarize(statement: str, limit: int = 120) -> str:
+    """Resumir una sentencia para el log (la lista de columnas del SELECT no aporta)"""
+    text = " ".join(statement.split())
+    from_index = text.find(" FROM ")
+    if text.upper().startswith("SELECT") and from_index != -1:
+        text = "SELECT ..." + text[from_index:]
+    return text[:limit]
+
+
+async def sql_instrumentation_middleware(request, call_next):
+    """Contar sentencias y tiempo de BD por request y exponerlos en cabeceras"""
+    if not settings.sql_instrumentation_enabled:
+        return await call_next(request)
+
+    stats = RequestQueryStats(request.scope)
+    token = _current_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        _current_stats.reset(token)
+
+    response.headers["X-DB-Query-Count"] = str(stats.count)
+    response.headers["X-DB-Time-Ms"] = f"{stats.total_seconds * 1000:.2f}"
+
+    repeated = stats.repeated_shapes()
+    if repeated:
+        response.headers["X-DB-Repeated-Statements"] = str(len(repeated))
+        shape, count = repeated[0]
+        print(
+            f"[SQL] Posible N+1 en {stats.endpoint}: {stats.count} consultas, "
+            f"{count}x \"{_summarize(shape)}\""
+        )
+    if stats.count > stats.budget:
+        print(f"[SQL] {stats.endpoint} superó su presupuesto: {stats.count}/{stats.budget} consultas")
+
+    return response
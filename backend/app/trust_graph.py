@@ -0,0 +1,409 @@
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from .config import settings
+from .database import pin_primary, primary_session
+from . import models
+
+FRIENDSHIP = "friendship"
+HIRED = "hired"
+
+
+class CSRAdjacency:
+    """
+    Lista de adyacencia compacta (compressed sparse row).
+    ids[i] es el usuario del nodo i y sus vecinos son targets[offsets[i]:offsets[i + 1]],
+    en el orden en que aparecen los pares.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.offsets = array('q', [0])
+        self.targets = array('q')
+        self.index: Dict[int, int] = {}
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[int, int]], symmetric: bool = False) -> "CSRAdjacency":
+        # Por origen, sus destinos sin repetir (un dict conserva el orden de llegada)
+        adjacency: Dict[int, Dict[int, None]] = {}
+        for source, target in pairs:
+            if source is None or target is None or source == target:
+                continue
+            adjacency.setdefault(source, {})[target] = None
+            if symmetric:
+                adjacency.setdefault(target, {})[source] = None
+
+        csr = cls()
+        csr.ids = array('q', sorted(adjacency))
+        csr.index = {user_id: i for i, user_id in enumerate(csr.ids)}
+        csr.offsets = array('q', [0]) * (len(csr.ids) + 1)
+        for i, user_id in enumerate(csr.ids):
+            csr.targets.extend(adjacency[user_id])
+            csr.offsets[i + 1] = len(csr.targets)
+        return csr
+
+    def neighbors(self, user_id: int):
+        i = self.index.get(user_id)
+        if i is None:
+            return ()
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr.itemsize * len(arr) for arr in (self.ids, self.offsets, self.targets))
+
+
+class TrustGraph:
+    """
+    Grafo de confianza del proceso en memoria: amistades aceptadas y relaciones
+    cliente-técnico de servicios completados ("hired"), cada una en su CSR.
+
+    Los arrays se reconstruyen completos desde la BD; entre reconstrucciones,
+    los cambios confirmados por este proceso se aplican sobre un overlay.
+    Los cambios hechos por otros workers llegan con la siguiente reconstrucción.
+    """
+
+    def __init__(self, rebuild_seconds: float = 300.0):
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._friends = CSRAdjacency()
+        self._hires = CSRAdjacency()
+        # Amistades nuevas por usuario, en orden de llegada
+        self._added: Dict[int, Dict[int, None]] = {}
+        self._removed: Set[Tuple[int, int]] = set()
+        self._hires_added: Dict[int, Set[int]] = {}
+        # Cambios recibidos mientras se reconstruye (se reaplican al terminar)
+        self._replay: Optional[list] = None
+        self._built_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.rebuilds = 0
+        self.last_rebuild_seconds = 0.0
+
+    # Construcción
+
+    @property
+    def is_built(self) -> bool:
+        return self._built_at is not None
+
+    def needs_rebuild(self) -> bool:
+        return self._built_at is None or time.monotonic() - self._built_at >= self.rebuild_seconds
+
+    def ensure_built(self, db: Session):
+        """Construir de forma síncrona si el arranque en segundo plano aún no terminó"""
+        if self.is_built:
+            return
+        with self._build_lock:
+            if not self.is_built:
+                # Igual que el scheduler, la construcción lee del primario
+                pin_primary(db)
+                self.rebuild(db)
+
+    def rebuild(self, db: Session):
+        """Reconstruir los arrays desde friendship y los servicios completados"""
+        # El replay se abre antes de consultar: un cambio confirmado entre la lectura
+        # y el reemplazo de los arrays queda en el replay aunque no esté en la lectura
+        with self._lock:
+            self._replay = []
+        try:
+            # En orden de fila: los vecinos quedan en el orden en que se crearon las amistades
+            friendships = db.execute(
+                select(models.friendship.c.user_id, models.friendship.c.friend_id).where(
+                    models.friendship.c.status == "accepted"
+                ).order_by(models.friendship.c.id)
+            )
+            hires = db.execute(
+                select(models.Service.client_id, models.Service.technician_id).where(
+                    models.Service.status == "completed"
+                ).distinct()
+            )
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        self.load(friendships, hires)
+
+    def load(self, friendships: Iterable[Tuple[int, int]], hires: Iterable[Tuple[int, int]] = ()):
+        """
+        Construir desde pares (user_id, friend_id) y (client_id, technician_id) y
+        aplicar encima los cambios registrados desde que se abrió el replay.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._replay is None:
+                self._replay = []
+
+        try:
+            # La tabla friendship ya guarda ambas direcciones; se fuerza por si falta alguna
+            friends = CSRAdjacency.from_pairs(friendships, symmetric=True)
+            hired = CSRAdjacency.from_pairs(hires, symmetric=True)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            self._friends, self._hires = friends, hired
+            replay, self._replay = self._replay, None
+            self._added = {}
+            self._removed = set()
+            self._hires_added = {}
+            for op, user_id, other_id in replay:
+                self._apply(op, user_id, other_id)
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+            self.last_rebuild_seconds = time.perf_counter() - started
+
+    def start_scheduler(self, session_factory):
+        """Construir en segundo plano al arrancar y reconstruir cada rebuild_seconds"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            # Primera construcción inmediata; hasta entonces se consulta la BD.
+            # Se lee del primario: el replay solo cubre cambios posteriores a la lectura,
+            # así que una réplica atrasada perdería los confirmados justo antes
+            while True:
+                try:
+                    with primary_session(session_factory) as db, self._build_lock:
+                        self.rebuild(db)
+                except Exception as e:
+                    print(f"Error reconstruyendo el grafo de confianza: {e}")
+                if self._stop.wait(self.rebuild_seconds):
+                    break
+
+        self._thread = threading.Thread(target=run, name="trust-graph-rebuild", daemon=True)
+        self._thread.start()
+
+    def stop_scheduler(self):
+        self._stop.set()
+        self._thread = None
+
+    # Cambios incrementales
+
+    def add_edge(self, user_id: int, friend_id: int):
+        self._record("add", user_id, friend_id)
+
+    def remove_edge(self, user_id: int, friend_id: int):
+        self._record("remove", user_id, friend_id)
+
+    def add_hire(self, client_id: int, technician_id: int):
+        self._record("hire", client_id, technician_id)
+
+    def _record(self, op: str, user_id: int, other_id: int):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((op, user_id, other_id))
+            self._apply(op, user_id, other_id)
+
+    def _apply(self, op: str, user_id: int, other_id: int):
+        for source, target in ((user_id, other_id), (other_id, user_id)):
+            if op == "hire":
+                self._hires_added.setdefault(source, set()).add(target)
+            elif op == "add":
+                self._removed.discard((source, target))
+                self._added.setdefault(source, {})[target] = None
+            else:
+                added = self._added.get(source)
+                if added is not None:
+                    added.pop(target, None)
+                self._removed.add((source, target))
+
+    # Consultas en memoria
+
+    def neighbors(self, user_id: int) -> List[int]:
+        """Amigos del usuario, en el orden en que se crearon las amistades"""
+        with self._lock:
+            base = self._friends.neighbors(user_id)
+            if self._removed:
+                result = [target for target in base if (user_id, target) not in self._removed]
+            else:
+                result = list(base)
+            added = self._added.get(user_id)
+            if added:
+                present = set(result)
+                result.extend(target for target in added if target not in present)
+            return result
+
+    def hired_neighbors(self, user_id: int) -> List[int]:
+        """Técnicos que contrató el usuario y clientes que lo contrataron"""
+        with self._lock:
+            result = list(self._hires.neighbors(user_id))
+            added = self._hires_added.get(user_id)
+            if added:
+                present = set(result)
+                result.extend(target for target in added if target not in present)
+            return result
+
+    def degree(self, user_id: int) -> int:
+        return len(self.neighbors(user_id))
+
+    def bfs(self, source: int, max_depth: int, max_nodes: Optional[int] = None) -> Dict[int, int]:
+        """Distancia de cada usuario alcanzable hasta max_depth (en orden de visita)"""
+        distances = {source: 0}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            depth = distances[current]
+            if depth >= max_depth:
+                continue
+            for friend in self.neighbors(current):
+                if friend in distances:
+                    continue
+                distances[friend] = depth + 1
+                if max_nodes is not None and len(distances) >= max_nodes:
+                    return distances
+                queue.append(friend)
+        return distances
+
+    def k_hop(self, source: int, k: int) -> Set[int]:
+        """Usuarios a distancia 1..k"""
+        reachable = set(self.bfs(source, k))
+        reachable.discard(source)
+        return reachable
+
+    def mutual_friends(self, user_id: int, other_id: int) -> List[int]:
+        """Amigos en común, ordenados por id"""
+        mine = set(self.neighbors(user_id))
+        return sorted(friend for friend in self.neighbors(other_id) if friend in mine)
+
+    def relation(self, user_id: int, other_id: int) -> Optional[str]:
+        if other_id in self.neighbors(user_id):
+            return FRIENDSHIP
+        if other_id in self.hired_neighbors(user_id):
+            return HIRED
+        return None
+
+    def _linked(self, user_id: int, include_hires: bool) -> List[int]:
+        linked = self.neighbors(user_id)
+        if include_hires:
+            linked.extend(self.hired_neighbors(user_id))
+        return linked
+
+    def shortest_paths(self, source: int, target: int, max_depth: int = 4,
+                       max_paths: int = 3, include_hires: bool = True) -> List[List[int]]:
+        """
+        Caminos más cortos (hasta max_paths) entre dos usuarios con BFS bidireccional:
+        en cada paso se expande el lado con la frontera más chica y se termina
+        en el primer nivel en que ambos lados se tocan.
+        """
+        if source == target:
+            return [[source]]
+
+        # Por lado: padres de cada nodo en los caminos más cortos y su profundidad
+        parents = ({source: []}, {target: []})
+        depths = ({source: 0}, {target: 0})
+        frontiers = ([source], [target])
+        levels = [0, 0]
+
+        while frontiers[0] and frontiers[1] and levels[0] + levels[1] < max_depth:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            other = 1 - side
+            seen, depth = parents[side], depths[side]
+            level = levels[side] + 1
+
+            discovered: Dict[int, List[int]] = {}
+            for node in frontiers[side]:
+                for linked in self._linked(node, include_hires):
+                    if linked in seen:
+                        continue
+                    discovered.setdefault(linked, []).append(node)
+
+            for node, node_parents in discovered.items():
+                seen[node] = node_parents
+                depth[node] = level
+            frontiers = (list(discovered), frontiers[1]) if side == 0 else (frontiers[0], list(discovered))
+            levels[side] = level
+
+            meeting = [node for node in discovered if node in depths[other]]
+            if meeting:
+                best = min(depths[other][node] for node in meeting)
+                meeting = [node for node in meeting if depths[other][node] == best]
+                return self._join_paths(meeting, parents[0], parents[1], max_paths)
+
+        return []
+
+    def connection_paths(self, source: int, target: int, max_depth: int = 4,
+                         max_paths: int = 3) -> List[Tuple[List[int], List[str]]]:
+        """
+        Caminos más cortos con la relación de cada tramo. Todo se lee bajo el
+        mismo lock: un cambio concurrente no puede dejar un tramo sin relación.
+        """
+        with self._lock:
+            return [
+                (path, [self.relation(a, b) for a, b in zip(path, path[1:])])
+                for path in self.shortest_paths(source, target, max_depth, max_paths)
+            ]
+
+    @staticmethod
+    def _join_paths(meeting: List[int], from_source: dict, from_target: dict, max_paths: int) -> List[List[int]]:
+        def walk(node: int, parents: dict):
+            # Caminos desde node hasta la raíz de su lado
+            if not parents[node]:
+                yield [node]
+                return
+            for parent in parents[node]:
+                for rest in walk(parent, parents):
+                    yield [node] + rest
+
+        paths = []
+        for node in sorted(meeting):
+            for to_source in walk(node, from_source):
+                for to_target in walk(node, from_target):
+                    paths.append(list(reversed(to_source)) + to_target[1:])
+                    if len(paths) >= max_paths:
+                        return paths
+        return paths
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "built": self.is_built,
+                "nodes": len(self._friends.ids),
+                "edges": len(self._friends.targets) // 2,
+                "hire_edges": len(self._hires.targets) // 2,
+                "array_bytes": self._friends.nbytes + self._hires.nbytes,
+                "index_bytes": sys.getsizeof(self._friends.index) + sys.getsizeof(self._hires.index),
+                "overlay_added": sum(len(targets) for targets in self._added.values()),
+                "overlay_removed": len(self._removed),
+                "overlay_hires": sum(len(targets) for targets in self._hires_added.values()),
+                "rebuilds": self.rebuilds,
+                "last_rebuild_ms": round(self.last_rebuild_seconds * 1000, 2),
+                "age_seconds": round(time.monotonic() - self._built_at, 1) if self._built_at else None,
+            }
+
+
+trust_graph = TrustGraph(rebuild_seconds=settings.trust_graph_rebuild_seconds)
+
+
+def record_graph_change(db: Session, op: str, user_id: int, other_id: int):
+    """Aplicar el cambio ("add", "remove" o "hire") al grafo en memoria cuando la transacción confirme"""
+    db.info.setdefault("trust_graph_changes", []).append((op, user_id, other_id))
+
+
+@event.listens_for(Session, "after_flush")
+def _record_completed_services(session, flush_context):
+    # Cualquier camino que complete un servicio agrega la relación cliente-técnico
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Service) and obj.status == "completed" and obj.client_id:
+            if obj in session.new or get_history(obj, "status").has_changes():
+                record_graph_change(session, "hire", obj.client_id, obj.technician_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_changes(session):
+    for op, user_id, other_id in session.info.pop("trust_graph_changes", ()):
+        trust_graph._record(op, user_id, other_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop("trust_graph_changes", None)
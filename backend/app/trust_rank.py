@@ -0,0 +1,189 @@
+"""
+Propagación de confianza personalizada (PageRank personalizado) sobre el grafo
+de amistades y contrataciones.
+
+Nodos: usuarios. Aristas: amistad aceptada (ambas direcciones, peso 1) y
+contratación completada cliente -> técnico, con peso según la review
+(rating / 5; sin review, trust_rank_unreviewed_weight; las de menos de 3
+estrellas no transmiten confianza). Para cada usuario s se resuelve
+
+    r = alpha * P^T r + (1 - alpha) * e_s
+
+por iteración de potencias sobre bloques de usuarios (una matriz densa n x B
+por bloque), y se guarda el top-K de técnicos en technician_trust_scores. La
+masa de los nodos sin aristas salientes vuelve al usuario de origen.
+
+NumPy y SciPy se importan solo aquí (proceso batch), no al arrancar la API.
+"""
+import time
+from datetime import datetime
+from typing import Iterator, List, Tuple
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from .config import settings
+from . import models
+
+
+def build_transition(n: int, sources, targets, weights):
+    """
+    P^T en CSR (float32) y los índices de nodos sin aristas salientes,
+    a partir de aristas dirigidas ya expresadas como posiciones 0..n-1.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    adjacency = sparse.csr_matrix(
+        (np.asarray(weights, dtype=np.float64), (sources, targets)), shape=(n, n)
+    )
+    adjacency.sum_duplicates()
+    out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = np.flatnonzero(out_weight == 0)
+    inverse = np.divide(1.0, out_weight, out=np.zeros_like(out_weight), where=out_weight > 0)
+    transition = sparse.diags(inverse) @ adjacency
+    return transition.T.tocsr().astype(np.float32), dangling
+
+
+def load_graph(db: Session):
+    """(ids ordenados, P^T, nodos sin salida, máscara de técnicos) desde la BD"""
+    import numpy as np
+
+    friend_rows = db.execute(
+        select(models.friendship.c.user_id, models.friendship.c.friend_id).where(
+            models.friendship.c.status == "accepted"
+        )
+    ).all()
+    hire_rows = db.execute(
+        select(models.Service.client_id, models.Service.technician_id, models.Review.rating)
+        .outerjoin(models.Review, models.Review.service_id == models.Service.id)
+        .where(
+            models.Service.status == "completed",
+            models.Service.client_id.is_not(None),
+            models.Service.technician_id.is_not(None)
+        )
+    ).all()
+    technician_ids = np.fromiter(
+        db.execute(select(models.User.id).where(models.User.role == "technician")).scalars(),
+        dtype=np.int64
+    )
+
+    hire_weights = []
+    hire_pairs = []
+    for client_id, technician_id, rating in hire_rows:
+        if rating is None:
+            weight = settings.trust_rank_unreviewed_weight
+        elif rating < 3:
+            continue
+        else:
+            weight = rating / 5.0
+        hire_pairs.append((client_id, technician_id))
+        hire_weights.append(weight)
+
+    # La tabla de amistades es simétrica: cada fila ya es una arista dirigida
+    pairs = np.array(friend_rows + hire_pairs, dtype=np.int64).reshape(-1, 2)
+    weights = np.concatenate([np.ones(len(friend_rows)), np.array(hire_weights, dtype=np.float64)])
+
+    ids = np.unique(pairs)
+    transition, dangling = build_transition(
+        len(ids), np.searchsorted(ids, pairs[:, 0]), np.searchsorted(ids, pairs[:, 1]), weights
+    )
+    return ids, transition, dangling, np.isin(ids, technician_ids)
+
+
+def personalized_pagerank(transition, dangling, rows, alpha: float = None,
+                          tol: float = None, max_iter: int = None):
+    """
+    PageRank personalizado de un bloque de orígenes (posiciones sin repetir).
+    Devuelve (matriz n x len(rows) con una columna por origen, iteraciones).
+    """
+    import numpy as np
+
+    alpha = settings.trust_rank_alpha if alpha is None else alpha
+    tol = tol or settings.trust_rank_tol
+    max_iter = max_iter or settings.trust_rank_max_iter
+
+    n = transition.shape[0]
+    columns = np.arange(len(rows))
+    scores = np.zeros((n, len(rows)), dtype=np.float32)
+    scores[rows, columns] = 1.0
+
+    for iteration in range(1, max_iter + 1):
+        leaked = scores[dangling].sum(axis=0) if len(dangling) else 0.0
+        updated = transition @ scores
+        updated *= alpha
+        updated[rows, columns] += alpha * leaked + (1 - alpha)
+        delta = np.abs(updated - scores).sum(axis=0).max()
+        scores = updated
+        if delta < tol:
+            break
+    return scores, iteration
+
+
+def top_technicians(ids, scores, rows, technician_mask, top_k: int) -> Iterator[Tuple[int, List[Tuple[int, float]]]]:
+    """(user_id, [(técnico, score), ...]) por columna; a igual score, id menor"""
+    import numpy as np
+
+    technician_rows = np.flatnonzero(technician_mask)
+    technician_ids = ids[technician_rows]
+    block = scores[technician_rows]
+
+    for column, row in enumerate(rows):
+        values = block[:, column].copy()
+        if technician_mask[row]:
+            values[technician_ids == ids[row]] = 0
+        candidates = np.flatnonzero(values > 0)
+        if len(candidates) > top_k:
+            # Todos los empatados con el k-ésimo entran al orden final
+            threshold = np.partition(values[candidates], -top_k)[-top_k]
+            candidates = candidates[values[candidates] >= threshold]
+        order = np.lexsort((technician_ids[candidates], -values[candidates]))[:top_k]
+        yield int(ids[row]), [(int(technician_ids[candidates[i]]), float(values[candidates[i]])) for i in order]
+
+
+def rank_all(ids, transition, dangling, technician_mask, top_k: int = None, block_size: int = None, rows=None):
+    """Generar el top-K de técnicos de cada origen (por defecto, todo nodo con aristas salientes)"""
+    import numpy as np
+
+    top_k = top_k or settings.trust_rank_top_k
+    block_size = block_size or settings.trust_rank_block_size
+    if rows is None:
+        rows = np.setdiff1d(np.arange(len(ids)), dangling)
+
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start:start + block_size]
+        scores, _ = personalized_pagerank(transition, dangling, block_rows)
+        yield from top_technicians(ids, scores, block_rows, technician_mask, top_k)
+
+
+def refresh_all(db: Session, top_k: int = None, block_size: int = None) -> dict:
+    """Recalcular los puntajes de confianza de todos los usuarios"""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+
+    ids, transition, dangling, technician_mask = load_graph(db)
+    db.execute(delete(models.TechnicianTrustScore))
+
+    users = 0
+    stored = 0
+    values = []
+    for user_id, items in rank_all(ids, transition, dangling, technician_mask, top_k, block_size):
+        users += 1
+        values.extend(
+            {"user_id": user_id, "technician_id": technician_id, "score": score, "computed_at": now}
+            for technician_id, score in items
+        )
+        if len(values) >= 10000:
+            db.execute(insert(models.TechnicianTrustScore), values)
+            stored += len(values)
+            values = []
+    if values:
+        db.execute(insert(models.TechnicianTrustScore), values)
+        stored += len(values)
+
+    db.commit()
+    return {
+        "nodes": len(ids),
+        "edges": int(transition.nnz),
+        "users": users,
+        "scores": stored,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
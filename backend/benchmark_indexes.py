@@ -0,0 +1,197 @@
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import create_engine, text
+from app.models import Base
+from app.migrations import HOT_QUERY_INDEXES, _create_index_if_missing, _drop_index_if_exists
+from tests.seeding import seed_users
+
+# Índices vigentes: los de la migración 0002 menos los de friendship que reemplazó la 0003
+SUPERSEDED_INDEXES = {"ix_friendship_user_status", "ix_friendship_friend_status"}
+BENCHMARK_INDEXES = [index for index in HOT_QUERY_INDEXES if index[0] not in SUPERSEDED_INDEXES] + [
+    ("ix_friendship_user_status_friend", "friendship", ("user_id", "status", "friend_id")),
+]
+
+# (nombre, SQL, parámetros) de las formas de consulta más frecuentes
+HOT_QUERIES = [
+    ("servicios pendientes del técnico",
+     "SELECT * FROM services WHERE technician_id = :tech AND status = 'pending' ORDER BY created_at DESC",
+     lambda n: {"tech": random.randint(1, n["users"])}),
+    ("servicios completados del cliente",
+     "SELECT * FROM services WHERE client_id = :client AND status = 'completed'",
+     lambda n: {"client": random.randint(1, n["users"])}),
+    ("reviews del técnico",
+     "SELECT * FROM reviews WHERE technician_id = :tech ORDER BY created_at DESC",
+     lambda n: {"tech": random.randint(1, n["users"])}),
+    ("review por servicio",
+     "SELECT * FROM reviews WHERE service_id = :service",
+     lambda n: {"service": random.randint(1, n["services"])}),
+    ("mensajes de la conversación",
+     "SELECT * FROM messages WHERE conversation_id = :conv ORDER BY created_at ASC",
+     lambda n: {"conv": random.randint(1, n["conversations"])}),
+    ("conversación por participantes",
+     "SELECT * FROM conversations WHERE client_id = :a AND technician_id = :b",
+     lambda n: {"a": random.randint(1, n["users"]), "b": random.randint(1, n["users"])}),
+    ("amistades aceptadas",
+     "SELECT * FROM friendship WHERE user_id = :user AND status = 'accepted'",
+     lambda n: {"user": random.randint(1, n["users"])}),
+    ("solicitudes de amistad pendientes",
+     "SELECT * FROM friend_requests WHERE receiver_id = :user AND status = 'pending'",
+     lambda n: {"user": random.randint(1, n["users"])}),
+    ("usuario por token de verificación",
+     "SELECT * FROM users WHERE verification_token = :token",
+     lambda n: {"token": f"token-{random.randint(1, n['users'])}"}),
+]
+
+def seed(engine, scale: int) -> dict:
+    """Poblar la base de benchmark con datos sintéticos"""
+    counts = {
+        "users": 2000 * scale,
+        "friendships": 10000 * scale,
+        "services": 20000 * scale,
+        "conversations": 5000 * scale,
+        "messages": 50000 * scale,
+        "friend_requests": 5000 * scale,
+    }
+    now = datetime.utcnow()
+    statuses = ["pending", "accepted", "in_progress", "completed", "cancelled"]
+    rnd_user = lambda: random.randint(1, counts["users"])
+    rnd_date = lambda: now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+
+    with engine.begin() as conn:
+        seed_users(
+            conn, counts["users"], domain="bench.com",
+            role=lambda i: "technician" if i % 5 == 0 else "client",
+            extra=lambda i: {"verification_token": f"token-{i}" if i % 10 == 0 else None}
+        )
+        # Como la app: pares distintos, sin (a, a) y guardados en ambas direcciones
+        pairs = set()
+        while len(pairs) < counts["friendships"] // 2:
+            a, b = rnd_user(), rnd_user()
+            if a != b:
+                pairs.add((min(a, b), max(a, b)))
+        friendships = []
+        for a, b in sorted(pairs):
+            status = random.choice(["accepted", "accepted", "pending"])
+            created = rnd_date()
+            friendships.append({"a": a, "b": b, "status": status, "created": created})
+            friendships.append({"a": b, "b": a, "status": status, "created": created})
+        conn.execute(text(
+            "INSERT INTO friendship (user_id, friend_id, status, created_at) VALUES (:a, :b, :status, :created)"
+        ), friendships)
+        conn.execute(text(
+            "INSERT INTO services (id, client_id, technician_id, category, description, status, created_at) "
+            "VALUES (:id, :client, :tech, 'Eléctrico', 'benchmark', :status, :created)"
+        ), [
+            {"id": i, "client": rnd_user(), "tech": rnd_user(), "status": random.choice(statuses),
+             "created": rnd_date()}
+            for i in range(1, counts["services"] + 1)
+        ])
+        conn.execute(text(
+            "INSERT INTO reviews (service_id, client_id, technician_id, rating, created_at) "
+            "VALUES (:service, :client, :tech, :rating, :created)"
+        ), [
+            {"service": i, "client": rnd_user(), "tech": rnd_user(), "rating": random.randint(1, 5),
+             "created": rnd_date()}
+            for i in range(1, counts["services"] + 1, 2)
+        ])
+        conn.execute(text(
+            "INSERT INTO conversations (id, client_id, technician_id, unread_client, unread_technician, is_active) "
+            "VALUES (:id, :client, :tech, 0, 0, 1)"
+        ), [
+            {"id": i, "client": rnd_user(), "tech": rnd_user()}
+            for i in range(1, counts["conversations"] + 1)
+        ])
+        conn.execute(text(
+            "INSERT INTO messages (conversation_id, sender_id, content, is_read, is_ai_generated, created_at) "
+            "VALUES (:conv, :sender, 'hola', 0, 0, :created)"
+        ), [
+            {"conv": random.randint(1, counts["conversations"]), "sender": rnd_user(), "created": rnd_date()}
+            for _ in range(counts["messages"])
+        ])
+        conn.execute(text(
+            "INSERT INTO friend_requests (sender_id, receiver_id, status, created_at) "
+            "VALUES (:sender, :receiver, :status, :created)"
+        ), [
+            {"sender": rnd_user(), "receiver": rnd_user(), "status": random.choice(["pending", "accepted"]),
+             "created": rnd_date()}
+            for _ in range(counts["friend_requests"])
+        ])
+
+    return counts
+
+def drop_hot_indexes(engine):
+    # create_all ya crea algunos (p. ej. el de friendship); se quitan solo los que existen
+    with engine.begin() as conn:
+        for name, table, _ in BENCHMARK_INDEXES:
+            _drop_index_if_exists(conn, name, table)
+
+def create_hot_indexes(engine):
+    with engine.begin() as conn:
+        for name, table, columns in BENCHMARK_INDEXES:
+            _create_index_if_missing(conn, name, table, columns)
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("ANALYZE"))
+
+def measure(engine, counts: dict, iterations: int) -> dict:
+    """Plan y latencia media (ms) de cada consulta"""
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    results = {}
+    with engine.connect() as conn:
+        for name, sql, make_params in HOT_QUERIES:
+            plan_rows = conn.execute(text(prefix + sql), make_params(counts)).fetchall()
+            plan = "; ".join(str(row[-1]) if engine.dialect.name == "sqlite" else str(tuple(row)) for row in plan_rows)
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                conn.execute(text(sql), make_params(counts)).fetchall()
+            elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+            results[name] = (plan, elapsed_ms)
+    return results
+
+def benchmark(database_url: str, scale: int, iterations: int):
+    """Comparar planes y latencias sin y con los índices compuestos"""
+    if database_url.startswith("sqlite:///"):
+        Path(database_url.replace("sqlite:///", "", 1)).unlink(missing_ok=True)
+
+    engine = create_engine(database_url)
+    print(f"Creando esquema en {database_url}...")
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    random.seed(42)
+    print("Poblando datos de prueba...")
+    counts = seed(engine, scale)
+    print("  " + ", ".join(f"{table}={count}" for table, count in counts.items()))
+
+    drop_hot_indexes(engine)
+    random.seed(7)
+    before = measure(engine, counts, iterations)
+
+    create_hot_indexes(engine)
+    random.seed(7)
+    after = measure(engine, counts, iterations)
+
+    for name, _, _ in HOT_QUERIES:
+        plan_before, ms_before = before[name]
+        plan_after, ms_after = after[name]
+        speedup = ms_before / ms_after if ms_after else float("inf")
+        print(f"\n{name}: {ms_before:.3f} ms -> {ms_after:.3f} ms ({speedup:.1f}x)")
+        print(f"  antes:   {plan_before}")
+        print(f"  después: {plan_after}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de los índices compuestos (migraciones 0002 y 0003)")
+    parser.add_argument("--database-url", default="sqlite:///benchmark_indexes.db",
+                        help="Base de datos desechable; se borran y recrean todas las tablas")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    benchmark(args.database_url, args.scale, args.iterations)
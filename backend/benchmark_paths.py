@@ -0,0 +1,66 @@
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.trust_graph import TrustGraph
+
+def synthetic_graph(users: int, avg_friends: int, hires: int, technician_ratio: float):
+    """Amistades aleatorias con grado medio avg_friends y contrataciones cliente -> técnico"""
+    friendships = set()
+    target = users * avg_friends // 2
+    while len(friendships) < target:
+        a, b = random.randint(1, users), random.randint(1, users)
+        if a != b:
+            friendships.add((min(a, b), max(a, b)))
+
+    technicians = max(1, int(users * technician_ratio))
+    hire_pairs = [(random.randint(technicians + 1, users), random.randint(1, technicians)) for _ in range(hires)]
+    return friendships, hire_pairs, technicians
+
+def benchmark(users: int, avg_friends: int, hires: int, queries: int, max_depth: int, max_paths: int):
+    random.seed(42)
+    print(f"Generando grafo: {users} usuarios, grado medio {avg_friends}, {hires} contrataciones...")
+    friendships, hire_pairs, technicians = synthetic_graph(users, avg_friends, hires, 0.1)
+
+    graph = TrustGraph()
+    graph.load(friendships, hire_pairs)
+    stats = graph.stats()
+    print(f"  construido en {stats['last_rebuild_ms']} ms, {stats['array_bytes'] / 1024 / 1024:.1f} MB en arrays, "
+          f"{stats['index_bytes'] / 1024 / 1024:.1f} MB en índices")
+
+    latencies = []
+    found = 0
+    lengths = []
+    for _ in range(queries):
+        # Cliente -> técnico, el caso de uso del endpoint
+        source = random.randint(technicians + 1, users)
+        target = random.randint(1, technicians)
+        start = time.perf_counter()
+        paths = graph.shortest_paths(source, target, max_depth, max_paths)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if paths:
+            found += 1
+            lengths.append(len(paths[0]) - 1)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"\n{queries} consultas, profundidad máxima {max_depth}, hasta {max_paths} caminos")
+    print(f"  con camino: {found} ({found / queries:.0%}), largo medio {statistics.mean(lengths) if lengths else 0:.2f}")
+    print(f"  p50 {statistics.median(latencies):.2f} ms, p95 {p95:.2f} ms, máx {latencies[-1]:.2f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del BFS bidireccional de /api/network/path")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--avg-friends", type=int, default=10)
+    parser.add_argument("--hires", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-depth", type=int, default=4)
+    parser.add_argument("--max-paths", type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.users, args.avg_friends, args.hires, args.queries, args.max_depth, args.max_paths)
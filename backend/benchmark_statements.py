@@ -0,0 +1,97 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import and_, create_engine, or_, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import models, repository
+from tests.seeding import seed_users
+
+def seed(engine, users: int):
+    """Datos mínimos: la consulta en sí es trivial, se mide el costo en Python"""
+    with engine.begin() as conn:
+        seed_users(conn, users, domain="bench.com", role=lambda i: "technician" if i % 2 == 0 else "client")
+        conn.execute(text(
+            "INSERT INTO conversations (id, client_id, technician_id, unread_client, unread_technician, is_active) "
+            "VALUES (:id, :client, :tech, 1, 2, 1)"
+        ), [{"id": i, "client": i, "tech": i + 1} for i in range(1, users, 2)])
+        conn.execute(text(
+            "INSERT INTO reviews (service_id, client_id, technician_id, rating) VALUES (:id, :client, :tech, 5)"
+        ), [{"id": i, "client": i, "tech": i + 1} for i in range(1, users, 2)])
+
+# Versión anterior de cada consulta (API legacy db.query)
+
+def legacy_user_by_email(db, n):
+    return db.query(models.User).filter(models.User.email == f"user{n}@bench.com").first()
+
+def legacy_conversation_between(db, n):
+    return db.query(models.Conversation).filter(
+        or_(
+            and_(models.Conversation.client_id == n, models.Conversation.technician_id == n + 1),
+            and_(models.Conversation.client_id == n + 1, models.Conversation.technician_id == n)
+        )
+    ).first()
+
+def legacy_unread_total(db, n):
+    conversations = db.query(models.Conversation).filter(
+        or_(models.Conversation.client_id == n, models.Conversation.technician_id == n),
+        models.Conversation.is_active == True
+    ).all()
+    return sum(conv.unread_client if conv.client_id == n else conv.unread_technician for conv in conversations)
+
+def legacy_technician_reviews(db, n):
+    return db.query(models.Review).filter(
+        models.Review.technician_id == n
+    ).order_by(models.Review.created_at.desc()).all()
+
+CASES = [
+    ("usuario por email", legacy_user_by_email,
+     lambda db, n: repository.get_user_by_email(db, f"user{n}@bench.com")),
+    ("conversación por participantes", legacy_conversation_between,
+     lambda db, n: repository.get_conversation_between(db, n, n + 1)),
+    ("total de no leídos", legacy_unread_total,
+     lambda db, n: repository.get_unread_total(db, n)),
+    ("reviews del técnico", legacy_technician_reviews,
+     lambda db, n: repository.get_technician_reviews(db, n)),
+]
+
+def run(Session, fn, users: int, iterations: int) -> float:
+    """Microsegundos por llamada (sesión nueva por lote, como en un request)"""
+    start = time.perf_counter()
+    db = Session()
+    try:
+        for i in range(iterations):
+            fn(db, i % users + 1)
+            if i % 50 == 0:
+                db.expunge_all()
+    finally:
+        db.close()
+    return (time.perf_counter() - start) * 1_000_000 / iterations
+
+def benchmark(users: int, iterations: int):
+    # SQLite en memoria: el tiempo de la BD es mínimo y domina el overhead de Python
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    seed(engine, users)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    print(f"{'consulta':32} {'legacy':>10} {'cacheada':>10} {'mejora':>8}")
+    for name, legacy, cached in CASES:
+        # Calentar ambos caminos (compilación inicial y caché de lambdas)
+        run(Session, legacy, users, 50)
+        run(Session, cached, users, 50)
+        legacy_us = run(Session, legacy, users, iterations)
+        cached_us = run(Session, cached, users, iterations)
+        print(f"{name:32} {legacy_us:8.1f}us {cached_us:8.1f}us {legacy_us / cached_us:7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overhead por llamada de las consultas cacheadas (app/repository.py)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+    benchmark(args.users, args.iterations)
@@ -0,0 +1,83 @@
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+from app import trust_rank
+from app.config import settings
+
+def synthetic_edges(edges: int, avg_degree: int, technician_ratio: float):
+    """Mitad amistades (en ambas direcciones) y mitad contrataciones cliente -> técnico con rating 3..5"""
+    users = max(10, edges // avg_degree)
+    technicians = max(1, int(users * technician_ratio))
+    rng = np.random.default_rng(42)
+
+    friendships = edges // 4
+    a = rng.integers(0, users, friendships)
+    b = rng.integers(0, users, friendships)
+    keep = a != b
+    a, b = a[keep], b[keep]
+
+    hires = edges - 2 * len(a)
+    clients = rng.integers(technicians, users, hires)
+    hired = rng.integers(0, technicians, hires)
+    ratings = rng.integers(3, 6, hires)
+
+    sources = np.concatenate([a, b, clients])
+    targets = np.concatenate([b, a, hired])
+    weights = np.concatenate([np.ones(2 * len(a)), ratings / 5.0])
+    technician_mask = np.zeros(users, dtype=bool)
+    technician_mask[:technicians] = True
+    return users, sources, targets, weights, technician_mask
+
+def benchmark(edges: int, avg_degree: int, sample: int, block_size: int, top_k: int):
+    users, sources, targets, weights, technician_mask = synthetic_edges(edges, avg_degree, 0.1)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    transition, dangling = trust_rank.build_transition(users, sources, targets, weights)
+    build_seconds = time.perf_counter() - start
+    matrix_bytes = transition.data.nbytes + transition.indices.nbytes + transition.indptr.nbytes
+
+    ids = np.arange(1, users + 1)
+    rows = np.setdiff1d(np.arange(users), dangling)
+    random.seed(42)
+    sampled = np.array(sorted(random.sample(list(rows), min(sample, len(rows)))), dtype=np.int64)
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    iterations = []
+    for offset in range(0, len(sampled), block_size):
+        block_rows = sampled[offset:offset + block_size]
+        scores, iteration = trust_rank.personalized_pagerank(transition, dangling, block_rows)
+        iterations.append(iteration)
+        for _ in trust_rank.top_technicians(ids, scores, block_rows, technician_mask, top_k):
+            pass
+    rank_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_user = rank_seconds / len(sampled)
+    print(f"{edges:>9} aristas | {users:>7} usuarios | matriz {build_seconds * 1000:7.1f} ms, {matrix_bytes / 1024 / 1024:6.1f} MB"
+          f" | {len(sampled)} orígenes en {rank_seconds:6.2f}s ({per_user * 1000:6.2f} ms c/u, {max(iterations)} iter)"
+          f" | pico {peak / 1024 / 1024:6.1f} MB | total estimado {per_user * len(rows) / 60:7.1f} min")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del PageRank personalizado por bloques")
+    parser.add_argument("--edges", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--avg-degree", type=int, default=10)
+    parser.add_argument("--sample", type=int, default=256, help="Orígenes medidos por tamaño (el total se extrapola)")
+    parser.add_argument("--block-size", type=int, default=settings.trust_rank_block_size)
+    parser.add_argument("--top-k", type=int, default=settings.trust_rank_top_k)
+    args = parser.parse_args()
+    # Importar SciPy antes de medir
+    trust_rank.build_transition(2, [0], [1], [1.0])
+    print(f"alpha {settings.trust_rank_alpha}, tolerancia {settings.trust_rank_tol}, bloque {args.block_size}, top-{args.top_k}")
+    for edges in args.edges:
+        benchmark(edges, args.avg_degree, args.sample, args.block_size, args.top_k)
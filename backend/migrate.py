@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.database import engine
+from app.migrations import MIGRATIONS, applied_versions, create_schema, upgrade
+
+def migrate():
+    """Crear las tablas que falten y aplicar las migraciones pendientes"""
+    try:
+        print("Creando tablas faltantes...")
+        create_schema(engine)
+
+        done = applied_versions(engine)
+        pending = [(version, name) for version, name, _ in MIGRATIONS if version not in done]
+        if not pending:
+            print("La base de datos ya está actualizada")
+            return
+
+        print(f"Migraciones pendientes: {len(pending)}")
+        upgrade(engine, verbose=True)
+        print("Migraciones aplicadas exitosamente!")
+
+    except Exception as e:
+        print(f"Error al aplicar migraciones: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    migrate()
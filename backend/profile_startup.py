@@ -0,0 +1,82 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+# Paquetes pesados que no deberían importarse al arrancar
+LAZY_MODULES = ("google.generativeai", "emails", "numpy", "scipy")
+
+def import_profile(module: str) -> list:
+    """Ejecutar python -X importtime en un proceso limpio y devolver (acumulado_us, propio_us, módulo)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"No se pudo importar {module}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+def startup_time() -> tuple:
+    """Tiempo hasta importar app.main y hasta responder /health con los eventos de startup"""
+    code = (
+        "import time; t0 = time.perf_counter()\n"
+        "import app.main\n"
+        "t1 = time.perf_counter()\n"
+        "from fastapi.testclient import TestClient\n"
+        "with TestClient(app.main.app) as client:\n"
+        "    client.get('/health')\n"
+        "    t2 = time.perf_counter()\n"
+        "print(f'{t1 - t0:.4f} {t2 - t0:.4f}')\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit("No se pudo arrancar la aplicación")
+    import_seconds, ready_seconds = result.stdout.strip().splitlines()[-1].split()
+    return float(import_seconds), float(ready_seconds)
+
+def report(module: str, top: int, with_startup: bool):
+    rows = import_profile(module)
+    total_us = max((cumulative for cumulative, _, _ in rows if cumulative), default=0)
+    print(f"Import de {module}: {total_us / 1000:.1f} ms ({len(rows)} módulos)")
+
+    print(f"\nTop {top} por tiempo acumulado:")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:9.1f} ms  {self_us / 1000:8.1f} ms propio  {name.strip()}")
+
+    imported = {name.strip() for _, _, name in rows}
+    eager = [lazy for lazy in LAZY_MODULES if lazy in imported]
+    if eager:
+        print(f"\nAVISO: módulos pesados importados al arrancar: {', '.join(eager)}")
+    else:
+        print(f"\nMódulos diferidos correctamente: {', '.join(LAZY_MODULES)}")
+
+    if with_startup:
+        started = time.perf_counter()
+        import_seconds, ready_seconds = startup_time()
+        print(f"\nImport de app.main: {import_seconds * 1000:.1f} ms")
+        print(f"Listo para responder /health: {ready_seconds * 1000:.1f} ms")
+        print(f"(proceso completo: {(time.perf_counter() - started) * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfil de tiempo de import y arranque de la API")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--no-startup", action="store_true", help="No arrancar la app (solo imports)")
+    args = parser.parse_args()
+    report(args.module, args.top, not args.no_startup)
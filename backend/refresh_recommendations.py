@@ -0,0 +1,37 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.database import primary_session
+from app import recommendation_store
+
+def refresh(batch: int = None):
+    """Materializar las recomendaciones de los usuarios con cambios (y de los nunca calculados)"""
+    with primary_session() as db:
+        try:
+            print("Materializando recomendaciones pendientes...")
+            result = recommendation_store.refresh_all_pending(db, batch)
+            print(f"  {result['refreshed']} usuarios, {result['recommendations']} recomendaciones en {result['seconds']}s")
+
+        except Exception as e:
+            db.rollback()
+            print(f"Error al materializar recomendaciones: {e}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Batch de recomendaciones materializadas (correr en un solo proceso, p. ej. cron)"
+    )
+    parser.add_argument("--batch", type=int, default=None, help="Usuarios por lote")
+    parser.add_argument("--loop", type=int, default=0, metavar="SEGUNDOS",
+                        help="Repetir cada SEGUNDOS en lugar de terminar")
+    args = parser.parse_args()
+    refresh(args.batch)
+    while args.loop > 0:
+        time.sleep(args.loop)
+        refresh(args.batch)
@@ -0,0 +1,36 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.database import primary_session
+from app import friend_suggestions
+
+def refresh(full: bool, top_k: int = None):
+    """Recalcular 'personas que quizás conozcas' (completo o solo usuarios en cola)"""
+    with primary_session() as db:
+        try:
+            if full:
+                print("Recalculando sugerencias de todos los usuarios...")
+                result = friend_suggestions.refresh_all(db, top_k)
+                print(f"  {result['users']} usuarios, {result['edges']} amistades")
+            else:
+                print("Recalculando sugerencias de usuarios con cambios...")
+                result = friend_suggestions.refresh_queued(db, top_k)
+                print(f"  {result['changed']} con cambios, {result['refreshed']} recalculados")
+            print(f"  {result['suggestions']} sugerencias guardadas en {result['seconds']}s")
+
+        except Exception as e:
+            db.rollback()
+            print(f"Error al recalcular sugerencias: {e}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch de sugerencias de amistad por amigos en común")
+    parser.add_argument("--full", action="store_true", help="Recalcular todos los usuarios (por defecto solo los de la cola)")
+    parser.add_argument("--top-k", type=int, default=None)
+    args = parser.parse_args()
+    refresh(args.full, args.top_k)
@@ -0,0 +1,31 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.database import primary_session
+from app import trust_rank
+
+def refresh(top_k: int = None, block_size: int = None):
+    """Recalcular la confianza personalizada de cada usuario en los técnicos"""
+    with primary_session() as db:
+        try:
+            print("Calculando PageRank personalizado...")
+            result = trust_rank.refresh_all(db, top_k, block_size)
+            print(f"  {result['nodes']} nodos, {result['edges']} aristas, {result['users']} usuarios")
+            print(f"  {result['scores']} puntajes guardados en {result['seconds']}s")
+
+        except Exception as e:
+            db.rollback()
+            print(f"Error al calcular la confianza: {e}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch de PageRank personalizado sobre amistades y contrataciones")
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--block-size", type=int, default=None)
+    args = parser.parse_args()
+    refresh(args.top_k, args.block_size)
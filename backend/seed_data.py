@@ -5,6 +5,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 from app.database import SessionLocal
 from app.models import User, Service, Review, FriendRequest
 from app.auth import get_password_hash
+from app.services import FriendshipService
 from datetime import datetime, timedelta
 import random
 
@@ -132,11 +133,11 @@ def seed_database():
         
         # Crear amistades (red de confianza)
         # Kevin es amigo de María y Juan
-        users[0].friends.append(users[1])  # Kevin -> María
-        users[0].friends.append(users[2])  # Kevin -> Juan
+        FriendshipService.add_friendship(db, users[0].id, users[1].id)  # Kevin <-> María
+        FriendshipService.add_friendship(db, users[0].id, users[2].id)  # Kevin <-> Juan
         
         # María es amiga de Juan
-        users[1].friends.append(users[2])  # María -> Juan
+        FriendshipService.add_friendship(db, users[1].id, users[2].id)  # María <-> Juan
         
         db.commit()
         print("✅ Relaciones de amistad creadas")
@@ -0,0 +1,37 @@
+"""
+Configuración común de los tests.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import os
+import sys
+from pathlib import Path
+
+# Agregar el directorio backend al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import models
+from tests.seeding import seed_users
+
+
+@pytest.fixture
+def make_db():
+    """
+    Fábrica de bases SQLite en memoria con el esquema de app.models y `users`
+    usuarios sembrados; devuelve un sessionmaker sin autoflush, igual que SessionLocal.
+    """
+    def make(users: int = 0, role=None):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        models.Base.metadata.create_all(engine)
+        if users:
+            with engine.begin() as conn:
+                seed_users(conn, users, role)
+        return sessionmaker(bind=engine, autoflush=False)
+    return make
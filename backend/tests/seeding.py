@@ -0,0 +1,31 @@
+"""
+Datos sintéticos compartidos por los tests y los benchmarks.
+Se insertan a través de los modelos: las columnas que no se indican toman
+los valores por defecto de app/models.py.
+"""
+from typing import Callable, Optional
+from sqlalchemy import insert
+from app import models
+
+
+def seed_users(conn, count: int, role: Optional[Callable[[int], str]] = None,
+               domain: str = "test.com", extra: Optional[Callable[[int], dict]] = None):
+    """
+    Usuarios 1..count activos y verificados (userN@domain). role(i) elige el rol
+    (cliente por defecto) y extra(i) agrega columnas, las mismas para todos.
+    """
+    rows = []
+    for i in range(1, count + 1):
+        row = {
+            "id": i,
+            "email": f"user{i}@{domain}",
+            "username": f"user{i}",
+            "hashed_password": "x",
+            "role": role(i) if role else "client",
+            "is_active": True,
+            "is_verified": True,
+        }
+        if extra:
+            row.update(extra(i))
+        rows.append(row)
+    conn.execute(insert(models.User), rows)
@@ -0,0 +1,112 @@
+"""
+Las rutas asíncronas usan del cache de principals solo identidad y rol:
+contadores y perfil escritos por otro worker no se devuelven ni se pisan
+con los valores cacheados, y un cambio de rol devuelve un token nuevo.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app import async_routes, auth, models
+from app.database import get_async_db
+from app.revocation import TokenRevocationList
+from tests.seeding import seed_users
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Cada test parte sin revocaciones (el cambio de rol de otro test revoca la versión 0)
+    monkeypatch.setattr(auth, "revocation_list", TokenRevocationList())
+    # Archivo y no memoria: el motor síncrono (el "otro worker") y el asíncrono comparten la base
+    path = tmp_path / "async.db"
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        seed_users(conn, 1)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    AsyncSession = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(async_routes.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    auth.principal_cache.clear()
+
+    db = sessionmaker(bind=engine)()
+    user = db.get(models.User, 1)
+    token = auth.create_user_access_token(user)
+    # Snapshot cacheado con los contadores de ahora
+    auth.principal_cache.set(user.email, auth._user_snapshot(user))
+    db.close()
+
+    with TestClient(app, headers={"Authorization": f"Bearer {token}"}) as client:
+        yield client, engine
+    auth.principal_cache.clear()
+    engine.dispose()
+
+
+def write_elsewhere(engine, **values):
+    """Cambio confirmado por otro worker: no pasa por este cache"""
+    with engine.begin() as conn:
+        conn.execute(update(models.User).where(models.User.id == 1).values(**values))
+
+
+def test_me_returns_fresh_counters(client):
+    client, engine = client
+    write_elsewhere(engine, jobs_completed=7, rating=4.5)
+
+    response = client.get("/api/users/me")
+
+    assert response.status_code == 200, response.text
+    assert (response.json()["jobs_completed"], response.json()["rating"]) == (7, 4.5)
+
+
+def test_update_does_not_overwrite_counters(client):
+    client, engine = client
+    write_elsewhere(engine, jobs_completed=7, location="Culiacán")
+
+    response = client.put("/api/users/me", json={"bio": "Electricista"})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["bio"], body["jobs_completed"], body["location"]) == ("Electricista", 7, "Culiacán")
+    with engine.connect() as conn:
+        row = conn.execute(
+            models.User.__table__.select().where(models.User.id == 1)
+        ).one()
+    assert (row.bio, row.jobs_completed, row.location) == ("Electricista", 7, "Culiacán")
+
+
+def test_switch_role_bumps_token_version(client):
+    client, engine = client
+    write_elsewhere(engine, jobs_active=2)
+
+    response = client.post("/api/users/switch-role")
+
+    assert response.status_code == 200, response.text
+    assert response.json()["new_role"] == "technician"
+    with engine.connect() as conn:
+        row = conn.execute(
+            models.User.__table__.select().where(models.User.id == 1)
+        ).one()
+    assert (row.role, row.token_version, row.jobs_active) == ("technician", 1, 2)
+
+
+def test_role_update_returns_new_token(client):
+    client, _ = client
+
+    response = client.put("/api/users/me", json={"role": "technician"})
+
+    assert response.status_code == 200, response.text
+    token = response.json()["access_token"]
+    assert client.get("/api/users/me").status_code == 401
+    me = client.get("/api/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert me.status_code == 200, me.text
+    assert me.json()["role"] == "technician"
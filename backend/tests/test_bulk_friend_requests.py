@@ -0,0 +1,27 @@
+"""
+La importación de contactos encuentra a los usuarios aunque el email
+guardado y el importado difieran en mayúsculas.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+from sqlalchemy import select
+from app import models
+from app.services import FriendshipService
+
+
+def test_emails_match_regardless_of_case(make_db):
+    Session = make_db(users=3)
+    db = Session()
+    db.get(models.User, 2).email = "Ana@Example.com"
+    db.get(models.User, 3).email = "luis@example.com"
+    db.commit()
+
+    results = FriendshipService.send_friend_requests_bulk(
+        db, 1, ["ana@example.com", " ANA@EXAMPLE.COM", "Luis@Example.com", "nadie@example.com"]
+    )
+
+    assert [(result.status, result.receiver_id) for result in results] == [
+        ("sent", 2), ("duplicate", None), ("sent", 3), ("not_found", None)
+    ]
+    assert set(db.execute(select(models.FriendRequest.receiver_id)).scalars()) == {2, 3}
+    db.close()
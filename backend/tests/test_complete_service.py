@@ -0,0 +1,64 @@
+"""
+/api/services/{id}/complete aplica las mismas reglas que update_service_status:
+un completado más, un activo menos solo si estaba en progreso (nunca por debajo
+de cero), y marca para recalcular las recomendaciones de los amigos del cliente.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from app import auth, models
+from app.database import get_db
+from app.main import app
+from app.services import FriendshipService
+
+
+def complete(Session):
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def override_current_user(db=Depends(get_db)):
+        return db.get(models.User, 2)
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[auth.get_current_active_user] = override_current_user
+    try:
+        return TestClient(app).post("/api/services/1/complete")
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("status, jobs_active, expected_active", [
+    ("in_progress", 1, 0),
+    ("accepted", 0, 0),
+])
+def test_complete_updates_counters_and_queues_friends(make_db, status, jobs_active, expected_active):
+    # Cliente 1 (amigo del 3) contrató al técnico 2
+    Session = make_db(users=3, role=lambda i: "technician" if i == 2 else "client")
+    db = Session()
+    technician = db.get(models.User, 2)
+    technician.jobs_active, technician.jobs_completed = jobs_active, 3
+    FriendshipService.add_friendship(db, 1, 3)
+    db.execute(insert(models.Service).values(id=1, client_id=1, technician_id=2, status=status))
+    db.add(models.RecommendationState(user_id=3))
+    db.commit()
+    db.close()
+
+    response = complete(Session)
+    assert response.status_code == 200, response.text
+    # Completarlo otra vez no vuelve a mover los contadores
+    assert complete(Session).status_code == 404
+
+    db = Session()
+    technician = db.get(models.User, 2)
+    assert (technician.jobs_active, technician.jobs_completed) == (expected_active, 4)
+    assert db.get(models.Service, 1).status == "completed"
+    state = db.get(models.RecommendationState, 3)
+    assert state.queue_version == 1 and state.stale_since is not None
+    db.close()
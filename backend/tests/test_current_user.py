@@ -0,0 +1,85 @@
+"""
+Rutas síncronas de /api/users con el cache de principals: el perfil se lee de
+la BD fuera del event loop y un cambio de rol devuelve un token que sigue valiendo.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import auth, models
+from app.database import get_db
+from app.main import app
+from app.revocation import TokenRevocationList
+
+
+def in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@pytest.fixture
+def client(make_db, monkeypatch):
+    Session = make_db(users=1)
+    # Revocaciones de otros tests (mismo email, otra base) no aplican aquí
+    monkeypatch.setattr(auth, "revocation_list", TokenRevocationList())
+    engine = Session.kw["bind"]
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    db = Session()
+    token = auth.create_user_access_token(db.get(models.User, 1))
+    db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    auth.principal_cache.clear()
+    yield TestClient(app, headers={"Authorization": f"Bearer {token}"}), engine
+    app.dependency_overrides.clear()
+    auth.principal_cache.clear()
+
+
+def test_me_loads_profile_outside_event_loop(client):
+    client, engine = client
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(in_event_loop())
+
+    first = client.get("/api/users/me")
+    hits = auth.principal_cache.stats()["hits"]
+    second = client.get("/api/users/me")
+
+    assert first.status_code == second.status_code == 200, second.text
+    assert first.json() == second.json()
+    assert auth.principal_cache.stats()["hits"] == hits + 1
+    assert statements and not any(statements)
+
+
+def test_role_update_returns_new_token(client):
+    client, _ = client
+
+    profile = client.put("/api/users/me", json={"bio": "Electricista"})
+    assert profile.status_code == 200, profile.text
+    assert profile.json()["access_token"] is None
+
+    response = client.put("/api/users/me", json={"role": "technician"})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["role"] == "technician" and body["token_type"] == "bearer"
+
+    # El token anterior quedó revocado; el nuevo sirve en el siguiente request
+    assert client.get("/api/users/me").status_code == 401
+    me = client.get("/api/users/me", headers={"Authorization": f"Bearer {body['access_token']}"})
+    assert me.status_code == 200, me.text
+    assert me.json()["role"] == "technician"
@@ -0,0 +1,50 @@
+"""
+Encolar sugerencias de amistad varias veces para el mismo usuario en una
+transacción (o en transacciones sucesivas) no debe violar la clave primaria
+de friend_suggestion_refresh.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import pytest
+from sqlalchemy import select
+from app import models
+from app.services import FriendshipService
+
+
+@pytest.fixture
+def Session(make_db):
+    return make_db(users=4)
+
+
+def queued(db) -> dict:
+    return dict(db.execute(
+        select(models.FriendSuggestionRefresh.user_id, models.FriendSuggestionRefresh.queued_at)
+    ).all())
+
+
+def test_overlapping_friendships_in_one_transaction(Session):
+    db = Session()
+    # Como seed_data.py: el usuario 1 y el 2 aparecen en más de una amistad antes de confirmar
+    FriendshipService.add_friendship(db, 1, 2)
+    FriendshipService.add_friendship(db, 1, 3)
+    FriendshipService.add_friendship(db, 2, 3)
+    db.commit()
+
+    assert set(queued(db)) == {1, 2, 3}
+    db.close()
+
+
+def test_requeue_in_a_later_transaction(Session):
+    db = Session()
+    FriendshipService.add_friendship(db, 1, 2)
+    db.commit()
+    first = queued(db)
+
+    FriendshipService.add_friendship(db, 2, 4)
+    FriendshipService.remove_friendship(db, 1, 2)
+    db.commit()
+
+    again = queued(db)
+    assert set(again) == {1, 2, 4}
+    assert again[2] >= first[2]
+    db.close()
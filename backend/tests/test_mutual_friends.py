@@ -0,0 +1,37 @@
+"""
+Amigos en común: el grafo en memoria y la consulta (antes de que el grafo
+se construya) deben dar el mismo resultado.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import pytest
+from app import services
+from app.services import FriendshipService
+from app.trust_graph import TrustGraph
+
+
+@pytest.fixture
+def Session(make_db):
+    Session = make_db(users=6)
+    db = Session()
+    for user_id, friend_id in ((1, 2), (1, 3), (1, 5), (4, 2), (4, 3), (4, 6)):
+        FriendshipService.add_friendship(db, user_id, friend_id)
+    db.commit()
+    db.close()
+    return Session
+
+
+@pytest.mark.parametrize("built", [False, True])
+def test_mutual_friends(Session, monkeypatch, built):
+    graph = TrustGraph()
+    monkeypatch.setattr(services, "trust_graph", graph)
+    db = Session()
+    if built:
+        graph.rebuild(db)
+        assert graph.is_built
+
+    mutual = FriendshipService.get_mutual_friends(db, 1, 4)
+
+    assert [user.id for user in mutual] == [2, 3]
+    assert FriendshipService.get_mutual_friends(db, 1, 6) == []
+    db.close()
@@ -0,0 +1,173 @@
+"""
+/api/network/graph debe ejecutar la misma cantidad de sentencias sin importar
+cuántos amigos, contrataciones y técnicos tenga la red (sin N+1), los amigos
+deben salir en el orden de las amistades y el formato ndjson debe poder leerse
+de vuelta.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import json
+
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from app import auth, models, services
+from app.config import settings
+from app.database import get_db
+from app.main import app
+from app.services import FriendshipService
+from app.trust_graph import TrustGraph
+
+
+def build_network(make_db, friends: int, services_per_friend: int):
+    """Usuario 1 con `friends` amigos; cada amigo contrata técnicos y deja reviews"""
+    technicians = friends * services_per_friend
+    Session = make_db(
+        users=friends + technicians + 1,
+        role=lambda i: "client" if i <= friends + 1 else "technician"
+    )
+
+    services = []
+    reviews = []
+    service_id = 0
+    for friend_id in range(2, friends + 2):
+        for _ in range(services_per_friend):
+            service_id += 1
+            technician_id = friends + 1 + service_id
+            services.append({"id": service_id, "client_id": friend_id, "technician_id": technician_id,
+                             "category": "Eléctrico", "description": "test", "status": "completed"})
+            reviews.append({"service_id": service_id, "client_id": friend_id, "technician_id": technician_id,
+                            "rating": 4 + service_id % 2})
+
+    db = Session()
+    for friend_id in range(2, friends + 2):
+        FriendshipService.add_friendship(db, 1, friend_id)
+    db.execute(insert(models.Service), services)
+    db.execute(insert(models.Review), reviews)
+    db.commit()
+    db.close()
+    return Session
+
+
+def get_graph(Session, format: str, status_code: int = 200, **params):
+    """Llamar a /api/network/graph como el usuario 1"""
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def override_current_user(db=Depends(get_db)):
+        return db.get(models.User, 1)
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[auth.get_current_active_user] = override_current_user
+    try:
+        response = TestClient(app).get("/api/network/graph", params={"format": format, **params})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == status_code, response.text
+    return response
+
+
+def graph_statements(Session, format: str) -> tuple:
+    """(sentencias, nodos) de una llamada a /api/network/graph como el usuario 1"""
+    response = get_graph(Session, format)
+    if format == "compact":
+        nodes = len(response.json()["nodes"]["id"])
+    else:
+        nodes = len(response.json()["nodes"])
+    return int(response.headers["X-DB-Query-Count"]), nodes
+
+
+@pytest.fixture(autouse=True)
+def instrumentation(monkeypatch):
+    monkeypatch.setattr(settings, "sql_instrumentation_enabled", True)
+    monkeypatch.setattr(settings, "sql_query_budget_strict", False)
+
+
+# ndjson no: la cabecera se envía antes de que el cuerpo termine de generarse
+@pytest.mark.parametrize("format", ["json", "compact"])
+def test_statement_count_does_not_grow_with_network(make_db, format):
+    small = build_network(make_db, friends=2, services_per_friend=1)
+    large = build_network(make_db, friends=25, services_per_friend=4)
+
+    small_statements, small_nodes = graph_statements(small, format)
+    large_statements, large_nodes = graph_statements(large, format)
+
+    assert large_nodes > small_nodes
+    assert large_statements == small_statements
+
+
+def test_ndjson_stream_reads_back(make_db):
+    Session = build_network(make_db, friends=3, services_per_friend=2)
+    json_graph = get_graph(Session, "json").json()
+
+    lines = [json.loads(line) for line in get_graph(Session, "ndjson").text.splitlines()]
+    kinds = [line["kind"] for line in lines]
+    nodes = [line for line in lines if line["kind"] == "node"]
+    edges = [line for line in lines if line["kind"] == "edge"]
+
+    assert kinds[0] == "meta" and kinds[-1] == "end"
+    assert set(kinds[1:-1]) == {"node", "edge"}
+    end = lines[-1]
+    assert (end["nodes"], end["edges"]) == (len(nodes), len(edges))
+    assert (len(nodes), len(edges)) == (len(json_graph["nodes"]), len(json_graph["connections"]))
+    assert {edge["type"] for edge in edges} == {"friendship", "recommendation"}
+
+
+@pytest.mark.parametrize("built", [False, True])
+def test_friends_keep_friendship_order(make_db, monkeypatch, built):
+    Session = make_db(users=4)
+    db = Session()
+    # Amistades de antes de guardar ambas direcciones: la fila inversa llega después
+    db.execute(insert(models.friendship), [
+        {"user_id": 3, "friend_id": 1, "status": "accepted"},
+        {"user_id": 1, "friend_id": 2, "status": "accepted"},
+        {"user_id": 1, "friend_id": 3, "status": "accepted"},
+        {"user_id": 2, "friend_id": 1, "status": "accepted"},
+    ])
+    FriendshipService.add_friendship(db, 4, 1)
+    db.commit()
+    # Con el grafo en memoria construido, los amigos salen de ahí con el mismo orden
+    graph = TrustGraph()
+    monkeypatch.setattr(services, "trust_graph", graph)
+    if built:
+        graph.rebuild(db)
+    db.close()
+
+    network = get_graph(Session, "json").json()
+
+    assert [node["id"] for node in network["nodes"]] == [1, 3, 2, 4]
+    assert [edge["target"] for edge in network["connections"]] == [3, 2, 4]
+
+
+def test_max_depth(make_db):
+    Session = build_network(make_db, friends=2, services_per_friend=1)
+
+    depth_one = get_graph(Session, "json", max_depth=1).json()
+    assert {node["distance"] for node in depth_one["nodes"]} == {0, 1}
+    assert {edge["type"] for edge in depth_one["connections"]} == {"friendship"}
+
+    get_graph(Session, "json", status_code=422, max_depth=3)
+    get_graph(Session, "json", status_code=422, max_depth=0)
+
+
+def test_formats_share_node_fields(make_db):
+    Session = build_network(make_db, friends=2, services_per_friend=1)
+
+    json_nodes = get_graph(Session, "json").json()["nodes"]
+    compact_nodes = get_graph(Session, "compact").json()["nodes"]
+    ndjson_nodes = [
+        line for line in map(json.loads, get_graph(Session, "ndjson").text.splitlines())
+        if line["kind"] == "node"
+    ]
+
+    fields = set(json_nodes[0])
+    assert set(compact_nodes) == fields
+    assert {key for key in ndjson_nodes[0] if key != "kind"} == fields
+    assert compact_nodes["rating"] == [node["rating"] for node in json_nodes]
+    assert compact_nodes["total_reviews"] == [node["total_reviews"] for node in json_nodes]
@@ -0,0 +1,108 @@
+"""
+El cache de recomendaciones se valida contra recommendation_state en cada
+consulta: un cambio confirmado por cualquier worker (o por
+refresh_recommendations.py) deja de servir lo cacheado, y el rating de los
+técnicos se lee siempre de la BD.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import pytest
+from sqlalchemy import delete, insert, update
+from app import models, recommendation_store, services
+from app.config import settings
+from app.recommendation_cache import RecommendationCache
+from app.schemas import ReviewCreate
+from app.services import FriendshipService, RecommendationService, ReviewService
+
+# Usuario 1 con amigos 2 y 3; técnicos 4 y 5
+TECHNICIANS = (4, 5)
+
+
+@pytest.fixture
+def Session(make_db, monkeypatch):
+    monkeypatch.setattr(services, "recommendation_cache", RecommendationCache())
+    # Sin tolerancia: con cambios pendientes se calcula en vivo
+    monkeypatch.setattr(settings, "recommendations_max_staleness_seconds", 0)
+    Session = make_db(users=5, role=lambda i: "technician" if i in TECHNICIANS else "client")
+    db = Session()
+    FriendshipService.add_friendship(db, 1, 2)
+    FriendshipService.add_friendship(db, 1, 3)
+    db.execute(insert(models.Service), [
+        {"id": 1, "client_id": 2, "technician_id": 4, "category": "Eléctrico", "status": "completed"},
+        {"id": 2, "client_id": 3, "technician_id": 5, "category": "Eléctrico", "status": "completed"},
+    ])
+    db.commit()
+    ReviewService.create_review(db, ReviewCreate(service_id=1, rating=5), 2)
+    recommendation_store.materialize(db, 1)
+    db.commit()
+    db.close()
+    return Session
+
+
+def recommended(Session) -> list:
+    db = Session()
+    try:
+        return [
+            (item.technician.id, item.technician.total_reviews)
+            for item in RecommendationService.get_recommendations(db, 1, limit=10)
+        ]
+    finally:
+        db.close()
+
+
+def test_cached_until_state_changes(Session):
+    assert recommended(Session) == [(4, 1)]
+    assert recommended(Session) == [(4, 1)]
+    assert services.recommendation_cache.stats()["hits"] == 1
+
+    # Otro worker: de su review aquí solo se ve lo que confirmó en la BD
+    db = Session()
+    db.execute(insert(models.Review).values(service_id=2, client_id=3, technician_id=5, rating=4))
+    recommendation_store.queue_friends_of(db, 3)
+    db.commit()
+    db.close()
+
+    assert recommended(Session) == [(4, 1), (5, 0)]
+
+
+def test_rematerializing_changes_the_version(Session):
+    recommended(Session)
+    db = Session()
+    db.execute(update(models.Service).where(models.Service.id == 1).values(status="cancelled"))
+    # refresh_recommendations.py: recalcula sin pasar por la API
+    recommendation_store.materialize(db, 1)
+    db.commit()
+    db.close()
+
+    assert recommended(Session) == []
+
+
+def test_hits_read_current_technicians(Session):
+    recommended(Session)
+    db = Session()
+    db.execute(update(models.User).where(models.User.id == 4).values(total_reviews=9))
+    db.commit()
+    db.close()
+
+    assert recommended(Session) == [(4, 9)]
+    assert services.recommendation_cache.stats()["hits"] == 1
+
+
+def test_unmaterialized_users_are_cached(Session):
+    # Sin scheduler: el usuario nunca se materializó
+    db = Session()
+    db.execute(delete(models.Recommendation))
+    db.execute(delete(models.RecommendationState))
+    db.commit()
+    db.close()
+
+    assert recommended(Session) == [(4, 1)]
+    assert recommended(Session) == [(4, 1)]
+    assert services.recommendation_cache.stats()["hits"] == 1
+
+    db = Session()
+    FriendshipService.remove_friendship(db, 1, 2)
+    db.commit()
+    db.close()
+
+    assert recommended(Session) == []
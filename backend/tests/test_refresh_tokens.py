@@ -0,0 +1,51 @@
+"""
+Rotación de refresh tokens: cada token se canjea una sola vez, aunque dos
+canjes del mismo token lleguen al mismo tiempo; el segundo cuenta como
+reutilización y cierra todas las sesiones del usuario.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import pytest
+from app import auth, models
+from app.revocation import TokenRevocationList
+
+
+@pytest.fixture
+def Session(make_db, monkeypatch):
+    monkeypatch.setattr(auth, "revocation_list", TokenRevocationList())
+    return make_db(users=1)
+
+
+def test_rotated_token_cannot_be_reused(Session):
+    db = Session()
+    token = auth.create_refresh_token(db, 1)
+
+    assert auth.rotate_refresh_token(db, token) is not None
+    assert auth.rotate_refresh_token(db, token) is None
+
+    assert db.query(models.RefreshToken).filter(models.RefreshToken.revoked_at.is_(None)).count() == 0
+    assert db.get(models.User, 1).token_version == 1
+    db.close()
+
+
+def test_concurrent_rotation_mints_one_pair(Session):
+    db = Session()
+    token = auth.create_refresh_token(db, 1)
+    db.close()
+
+    # El segundo canje leyó el token antes de que el primero confirmara
+    first, second = Session(), Session()
+    stale = auth._find_refresh_token(second, token)
+    assert auth.rotate_refresh_token(first, token) is not None
+    assert stale.revoked_at is None
+
+    assert auth.rotate_refresh_token(second, token) is None
+
+    db = Session()
+    tokens = db.query(models.RefreshToken).all()
+    assert len(tokens) == 2
+    assert all(row.revoked_at is not None for row in tokens)
+    assert db.get(models.User, 1).token_version == 1
+    db.close()
+    first.close()
+    second.close()
@@ -0,0 +1,97 @@
+"""
+Lectura de las propias escrituras con réplicas y varios workers: después de
+confirmar una escritura el cliente recibe primary_until y, con él, sus
+lecturas van al primario aunque las atienda otro worker.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.pool import StaticPool
+from app import database, models
+
+
+def memory_engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def client(monkeypatch):
+    primary, replica = memory_engine(), memory_engine()
+    monkeypatch.setattr(database, "engine", primary)
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    database.recent_writers.clear()
+
+    app = FastAPI()
+    app.middleware("http")(database.read_your_writes_middleware)
+
+    def read_bind(db) -> str:
+        return "primary" if db.get_bind(clause=select(models.User.id)) is primary else "replica"
+
+    @app.get("/read")
+    def read():
+        db = database.SessionLocal()
+        try:
+            return {"bind": read_bind(db)}
+        finally:
+            db.close()
+
+    @app.post("/write")
+    def write(fail: bool = False):
+        db = database.SessionLocal()
+        try:
+            bind = read_bind(db)
+            db.execute(insert(models.FriendRequest).values(sender_id=1, receiver_id=2))
+            if fail:
+                db.rollback()
+                raise HTTPException(status_code=409)
+            db.commit()
+            return {"bind": bind}
+        finally:
+            db.close()
+
+    yield TestClient(app)
+    database.recent_writers.clear()
+
+
+def test_reads_go_to_replica_by_default(client):
+    response = client.get("/read")
+    assert response.json() == {"bind": "replica"}
+    assert database.PRIMARY_UNTIL_HEADER not in response.headers
+
+
+def test_writing_requests_read_from_primary(client):
+    response = client.post("/write")
+    assert response.json() == {"bind": "primary"}
+    assert database.PRIMARY_UNTIL_HEADER in response.headers
+
+
+def test_primary_until_follows_the_client_to_other_workers(client):
+    client.post("/write")
+    # Otro worker: no conoce al usuario, solo la cookie que devuelve el cliente
+    database.recent_writers.clear()
+    assert client.get("/read").json() == {"bind": "primary"}
+
+    client.cookies.clear()
+    assert client.get("/read").json() == {"bind": "replica"}
+
+
+def test_header_is_accepted_and_bounded(client):
+    soon = f"{time.time() + 1:.3f}"
+    assert client.get("/read", headers={database.PRIMARY_UNTIL_HEADER: soon}).json() == {"bind": "primary"}
+
+    far = f"{time.time() + 3600:.3f}"
+    assert client.get("/read", headers={database.PRIMARY_UNTIL_HEADER: far}).json() == {"bind": "replica"}
+    assert client.get("/read", headers={database.PRIMARY_UNTIL_HEADER: "x"}).json() == {"bind": "replica"}
+
+
+def test_rolled_back_writes_do_not_pin(client):
+    response = client.post("/write", params={"fail": True})
+    assert response.status_code == 409
+    assert database.PRIMARY_UNTIL_HEADER not in response.headers
@@ -0,0 +1,40 @@
+"""
+Recorridos del grafo de confianza en memoria: BFS, vecindario a k saltos y
+cambios confirmados aplicados sobre el overlay.
+
+Correr desde backend/: python -m pytest -q tests
+"""
+from app.trust_graph import TrustGraph
+
+
+def make_graph() -> TrustGraph:
+    # 1 - 3 - 4 - 5 y 1 - 2, en ese orden de creación
+    graph = TrustGraph()
+    graph.load([(1, 3), (3, 4), (1, 2), (4, 5)])
+    return graph
+
+
+def test_bfs_distances_in_visit_order():
+    graph = make_graph()
+
+    assert list(graph.bfs(1, 3).items()) == [(1, 0), (3, 1), (2, 1), (4, 2), (5, 3)]
+    assert graph.bfs(1, 1) == {1: 0, 3: 1, 2: 1}
+    assert list(graph.bfs(1, 3, max_nodes=2)) == [1, 3]
+
+
+def test_k_hop():
+    graph = make_graph()
+
+    assert graph.k_hop(1, 1) == {2, 3}
+    assert graph.k_hop(1, 2) == {2, 3, 4}
+    assert graph.k_hop(5, 4) == {1, 2, 3, 4}
+
+
+def test_overlay_changes():
+    graph = make_graph()
+    graph.add_edge(1, 6)
+    graph.remove_edge(1, 3)
+
+    assert graph.neighbors(1) == [2, 6]
+    assert graph.degree(1) == 2
+    assert graph.k_hop(1, 2) == {2, 6}